@@ -1,5 +1,7 @@
 from django.urls import path
 from . import views
+from core.views import invalidation_bus_api, query_stats_api
+from jobs.views import job_status_api
 
 app_name = "admin_panel"
 
@@ -33,13 +35,17 @@ urlpatterns = [
     path("matches/<int:match_id>/delete/", views.delete_match_api, name="delete_match_api"),
 
     # MANAGE MATCH_PLAYERS
-    path("match_players/<int:match_id>/", views.match_players_api),
-    path("match_players/<int:match_id>/update/", views.update_match_players_api),
+    path("match_players/<int:match_id>/", views.match_players_api, name="match_players_api"),
+    path("match_players/<int:match_id>/update/", views.update_match_players_api, name="update_match_players_api"),
 
     # MANAGE PLAYER STATS
-    path("matches/<int:match_id>/stats/", views.manage_player_stats_api),
+    path("matches/<int:match_id>/stats/", views.manage_player_stats_api, name="manage_player_stats_api"),
+    path("matches/<int:match_id>/stats/events/", views.ingest_ball_events_api, name="ingest_ball_events_api"),
 
     # CALCULATE MATCH RESULTS
-    path("matches/<int:match_id>/calculate_result/", views.calculate_match_results_api),
+    path("matches/<int:match_id>/calculate_result/", views.calculate_match_results_api, name="calculate_match_results_api"),
+    path("jobs/<int:job_id>/", job_status_api, name="job_status_api"),
+    path("cache/bus/", invalidation_bus_api, name="invalidation_bus_api"),
+    path("db/queries/", query_stats_api, name="query_stats_api"),
 
 ]
@@ -1,12 +1,22 @@
 from django.http import JsonResponse
-from django.db import connection, IntegrityError
+from django.db import IntegrityError
 from django.views.decorators.csrf import csrf_exempt
 import json
 from django.utils.timezone import localdate
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
-from leaderboard.views import update_all_overall_ranks, update_matchday_leaderboard, update_overall_leaderboard_for_user
+from core.cache import invalidate_on_commit, match_tag, team_tag
+from core.db import as_columns, as_tuples, execute, fetch_all, fetch_one, fetch_value, query
+from core.versions import MATCHES, PLAYERS, TEAMS, bump_on_commit
+from jobs.queue import enqueue
+from leaderboard.views import matchday_leaderboard
+from match_players.lineup import update_playing_xi
+from match_players.views import MATCH_WITH_TEAMS, SQUAD_SELECTION
+from player_stats.ingest import ingest_events
+from player_stats.stats import validate_player_stats, upsert_player_stats
+from player_stats.views import PLAYING_STATS
+from teams.views import TEAM_LIST
 
 
 @login_required
@@ -38,21 +48,38 @@ def admin_login_api(request):
     
 
 # ===========================
-# HELPER
+# TEAMS CRUD
 # ===========================
-def dictfetchall(cursor):
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+NEXT_TEAM_ID = query("admin.next_team_id", """
+    SELECT COALESCE(MAX(team_id), 0) + 1 FROM teams
+""")
+
+INSERT_TEAM = query("admin.insert_team", """
+    INSERT INTO teams (team_id, team_name, acronym) VALUES (%s, %s, %s)
+""")
+
+UPDATE_TEAM = query("admin.update_team", """
+    UPDATE teams SET team_name=%s, acronym=%s WHERE team_id=%s
+""")
+
+DELETE_TEAM_PLAYERS = query("admin.delete_team_players", """
+    DELETE FROM players WHERE team_id=%s
+""")
+
+DELETE_TEAM_MATCHES = query("admin.delete_team_matches", """
+    DELETE FROM matches
+    WHERE team_1=%s OR team_2=%s
+    RETURNING match_id
+""")
+
+DELETE_TEAM = query("admin.delete_team", """
+    DELETE FROM teams WHERE team_id=%s
+""")
 
 
-# ===========================
-# TEAMS CRUD
-# ===========================
 @login_required
 def list_teams_api(request):
-    with connection.cursor() as cursor:
-        cursor.execute("SELECT team_id, team_name, acronym FROM teams ORDER BY team_name")
-        teams = dictfetchall(cursor)
+    teams = fetch_all(TEAM_LIST)
     return JsonResponse({"teams": teams})
 
 
@@ -74,13 +101,10 @@ def add_team_api(request):
         return JsonResponse({"error": "Team name and acronym are required"}, status=400)
 
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT COALESCE(MAX(team_id), 0) + 1 FROM teams")
-            new_id = cursor.fetchone()[0]
-            cursor.execute(
-                "INSERT INTO teams (team_id, team_name, acronym) VALUES (%s, %s, %s)",
-                [new_id, team_name, acronym],
-            )
+        new_id = fetch_value(NEXT_TEAM_ID)
+        execute(INSERT_TEAM, [new_id, team_name, acronym])
+        bump_on_commit(TEAMS)
+        invalidate_on_commit(TEAMS)
         return JsonResponse({"status": "created"})
     except IntegrityError as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -97,11 +121,9 @@ def edit_team_api(request, team_id):
         team_name = data.get("team_name")
         acronym = data.get("acronym")
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "UPDATE teams SET team_name=%s, acronym=%s WHERE team_id=%s",
-                [team_name, acronym, team_id],
-            )
+        execute(UPDATE_TEAM, [team_name, acronym, team_id])
+        bump_on_commit(TEAMS)
+        invalidate_on_commit(TEAMS, team_tag(team_id))
         return JsonResponse({"status": "updated"})
     except IntegrityError:
         return JsonResponse({"error": "Update failed"}, status=400)
@@ -112,19 +134,59 @@ def edit_team_api(request, team_id):
 def delete_team_api(request, team_id):
     if request.method != "DELETE":
         return JsonResponse({"error": "DELETE required"}, status=405)
-    with connection.cursor() as cursor:
-        cursor.execute("DELETE FROM players WHERE team_id=%s", [team_id])
-        cursor.execute("""
-            DELETE FROM matches
-            WHERE team_1=%s OR team_2=%s
-        """, [team_id, team_id])
-        cursor.execute("DELETE FROM teams WHERE team_id=%s", [team_id])
+    execute(DELETE_TEAM_PLAYERS, [team_id])
+    match_ids = fetch_all(DELETE_TEAM_MATCHES, [team_id, team_id], rows=as_columns)["match_id"]
+    execute(DELETE_TEAM, [team_id])
+    bump_on_commit(TEAMS, PLAYERS, MATCHES, *map(matchday_leaderboard, match_ids))
+    invalidate_on_commit(TEAMS, team_tag(team_id), MATCHES, *map(match_tag, match_ids))
     return JsonResponse({"status": "deleted"})
 
 
 ###########################
 # Players CRUD
 ###########################
+# Unset filters are passed as NULL, so every combination is one statement
+LIST_PLAYERS = query("admin.list_players", """
+    SELECT 
+        p.player_id,
+        p.player_name,
+        p.role,
+        p.cost,
+        p.team_id,
+        t.team_name
+    FROM players p
+    JOIN teams t ON p.team_id = t.team_id
+    WHERE (%(player_id)s::text IS NULL OR p.player_id ILIKE %(player_id)s)
+      AND (%(name)s::text IS NULL OR p.player_name ILIKE %(name)s)
+      AND (%(role)s::text IS NULL OR p.role = %(role)s)
+      AND (%(team_id)s::int IS NULL OR p.team_id = %(team_id)s::int)
+      AND (%(max_cost)s::numeric IS NULL OR p.cost <= %(max_cost)s::numeric)
+    ORDER BY p.player_name
+""")
+
+INSERT_PLAYER = query("admin.insert_player", """
+    INSERT INTO players
+    (player_id, player_name, role, cost, team_id)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+
+# the squads of both the old and the new team change
+UPDATE_PLAYER = query("admin.update_player", """
+    UPDATE players p
+    SET player_name=%s,
+        role=%s,
+        cost=%s,
+        team_id=%s
+    FROM (
+        SELECT team_id FROM players WHERE player_id=%s FOR UPDATE
+    ) old
+    WHERE p.player_id=%s
+    RETURNING old.team_id
+""")
+
+DELETE_PLAYER = query("admin.delete_player", """
+    DELETE FROM players WHERE player_id=%s RETURNING team_id
+""")
 
 @login_required
 @require_http_methods(["GET"])
@@ -133,56 +195,16 @@ def list_players_api(request):
     Return list of players with optional filters:
     ?name=...&role=...&team_id=...&max_cost=...
     """
-    filters = []
-    params = []
-
     id = request.GET.get("player_id")
     name = request.GET.get("name")
-    role = request.GET.get("role")
-    team_id = request.GET.get("team_id")
-    max_cost = request.GET.get("max_cost")
-
-    if id:
-        filters.append("p.player_id ILIKE %s")
-        params.append(f"%{id}%")  # case-insensitive match
-
-    if name:
-        filters.append("p.player_name ILIKE %s")
-        params.append(f"%{name}%")  # case-insensitive match
-
-    if role:
-        filters.append("p.role = %s")
-        params.append(role)
-
-    if team_id:
-        filters.append("p.team_id = %s")
-        params.append(team_id)
-
-    if max_cost:
-        filters.append("p.cost <= %s")
-        params.append(max_cost)
-
-    where_clause = " AND ".join(filters)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    query = f"""
-        SELECT 
-            p.player_id,
-            p.player_name,
-            p.role,
-            p.cost,
-            p.team_id,
-            t.team_name
-        FROM players p
-        JOIN teams t ON p.team_id = t.team_id
-        {where_clause}
-        ORDER BY p.player_name
-    """
 
-    with connection.cursor() as cursor:
-        cursor.execute(query, params)
-        players = dictfetchall(cursor)
+    players = fetch_all(LIST_PLAYERS, {
+        "player_id": f"%{id}%" if id else None,  # case-insensitive match
+        "name": f"%{name}%" if name else None,  # case-insensitive match
+        "role": request.GET.get("role") or None,
+        "team_id": request.GET.get("team_id") or None,
+        "max_cost": request.GET.get("max_cost") or None,
+    })
 
     return JsonResponse({"players": players})
 
@@ -201,12 +223,9 @@ def add_player_api(request):
     except Exception:
         return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            INSERT INTO players
-            (player_id, player_name, role, cost, team_id)
-            VALUES (%s, %s, %s, %s, %s)
-        """, [player_id, player_name, role, cost, team_id])
+    execute(INSERT_PLAYER, [player_id, player_name, role, cost, team_id])
+    bump_on_commit(PLAYERS)
+    invalidate_on_commit(team_tag(team_id))
 
     return JsonResponse({"status": "created"})
 
@@ -224,18 +243,12 @@ def edit_player_api(request, player_id):
     except Exception:
         return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            UPDATE players
-            SET player_name=%s,
-                role=%s,
-                cost=%s,
-                team_id=%s
-            WHERE player_id=%s
-        """, [player_name, role, cost, team_id, player_id])
+    row = fetch_one(UPDATE_PLAYER, [player_name, role, cost, team_id, player_id, player_id], rows=as_tuples)
 
-        if cursor.rowcount == 0:
-            return JsonResponse({"error": "Player not found"}, status=404)
+    if row is None:
+        return JsonResponse({"error": "Player not found"}, status=404)
+    bump_on_commit(PLAYERS)
+    invalidate_on_commit(team_tag(row[0]), team_tag(team_id))
 
     return JsonResponse({"status": "updated"})
 
@@ -245,40 +258,58 @@ def edit_player_api(request, player_id):
 @require_http_methods(["DELETE"])
 def delete_player_api(request, player_id):
 
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "DELETE FROM players WHERE player_id=%s",
-            [player_id]
-        )
+    old_team_id = fetch_value(DELETE_PLAYER, [player_id])
 
-        if cursor.rowcount == 0:
-            return JsonResponse(
-                {"error": "Player not found"},
-                status=404
-            )
+    if old_team_id is None:
+        return JsonResponse(
+            {"error": "Player not found"},
+            status=404
+        )
+    bump_on_commit(PLAYERS)
+    invalidate_on_commit(team_tag(old_team_id))
 
     return JsonResponse({"status": "deleted"})
 
 # ===========================
 # MATCHES CRUD
 # ===========================
+LIST_MATCHES = query("admin.list_matches", """
+    SELECT 
+        m.match_id,
+        m.match_date,
+        t1.team_name AS team1,
+        t2.team_name AS team2
+    FROM matches m
+    JOIN teams t1 ON m.team_1 = t1.team_id
+    JOIN teams t2 ON m.team_2 = t2.team_id
+    ORDER BY m.match_date ASC
+""")
+
+INSERT_MATCH = query("admin.insert_match", """
+    INSERT INTO matches (match_date, team_1, team_2)
+    VALUES (%s, %s, %s)
+    RETURNING match_id
+""")
+
+# update in place: match_players, fantasy_teams etc. reference match_id
+UPDATE_MATCH = query("admin.update_match", """
+    UPDATE matches
+    SET match_date=%s,
+        team_1=%s,
+        team_2=%s
+    WHERE match_id=%s
+""")
+
+DELETE_MATCH = query("admin.delete_match", """
+    DELETE FROM matches WHERE match_id=%s
+""")
+
+
 @login_required
 @require_http_methods(["GET"])
 def list_matches_api(request):
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                m.match_id,
-                m.match_date,
-                t1.team_name AS team1,
-                t2.team_name AS team2
-            FROM matches m
-            JOIN teams t1 ON m.team_1 = t1.team_id
-            JOIN teams t2 ON m.team_2 = t2.team_id
-            ORDER BY m.match_date ASC
-        """)
-        rows = dictfetchall(cursor)
+    rows = fetch_all(LIST_MATCHES)
 
     today = localdate()
 
@@ -312,14 +343,9 @@ def add_match_api(request):
         return JsonResponse({"error": "Teams cannot be same"}, status=400)
 
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO matches (match_date, team_1, team_2)
-                VALUES (%s, %s, %s)
-                RETURNING match_id
-            """, [match_date, team_1, team_2])
-
-            match_id = cursor.fetchone()[0]
+        match_id = fetch_value(INSERT_MATCH, [match_date, team_1, team_2])
+        bump_on_commit(MATCHES)
+        invalidate_on_commit(MATCHES)
 
         return JsonResponse({
             "status": "created",
@@ -345,28 +371,10 @@ def edit_match_api(request, match_id):
     if team_1 == team_2:
         return JsonResponse({"error": "Teams cannot be same"}, status=400)
 
-    
-    with connection.cursor() as cursor:
-
-        # check exists
-        cursor.execute(
-            "SELECT 1 FROM matches WHERE match_id=%s",
-            [match_id]
-        )
-        if not cursor.fetchone():
-            return JsonResponse({"error": "Match not found"}, status=404)
-
-        cursor.execute(
-            "DELETE FROM matches WHERE match_id=%s",
-            [match_id]
-        )
-
-        # insert new with SAME ID
-        cursor.execute("""
-            INSERT INTO matches
-            (match_id, match_date, team_1, team_2)
-            VALUES (%s, %s, %s, %s)
-        """, [match_id, match_date, team_1, team_2])
+    if execute(UPDATE_MATCH, [match_date, team_1, team_2, match_id]) == 0:
+        return JsonResponse({"error": "Match not found"}, status=404)
+    bump_on_commit(MATCHES)
+    invalidate_on_commit(MATCHES, match_tag(match_id))
 
     return JsonResponse({"status": "updated"})
 
@@ -375,17 +383,13 @@ def edit_match_api(request, match_id):
 @require_http_methods(["DELETE"])
 def delete_match_api(request, match_id):
 
-    with connection.cursor() as cursor:
-        cursor.execute(
-            "DELETE FROM matches WHERE match_id=%s",
-            [match_id]
+    if execute(DELETE_MATCH, [match_id]) == 0:
+        return JsonResponse(
+            {"error": "Match not found"},
+            status=404
         )
-
-        if cursor.rowcount == 0:
-            return JsonResponse(
-                {"error": "Match not found"},
-                status=404
-            )
+    bump_on_commit(MATCHES, matchday_leaderboard(match_id))
+    invalidate_on_commit(MATCHES, match_tag(match_id))
 
     return JsonResponse({"status": "deleted"})
 
@@ -401,22 +405,8 @@ def match_players_api(request, match_id):
     POST: update playing status for players of the match
     """
     if request.method == "GET":
-        with connection.cursor() as cursor:
-            # Fetch match info
-            cursor.execute("""
-                SELECT 
-                    m.match_id,
-                    m.match_date,
-                    t1.team_id AS team1_id,
-                    t1.team_name AS team1_name,
-                    t2.team_id AS team2_id,
-                    t2.team_name AS team2_name
-                FROM matches m
-                JOIN teams t1 ON m.team_1 = t1.team_id
-                JOIN teams t2 ON m.team_2 = t2.team_id
-                WHERE m.match_id = %s
-            """, [match_id])
-            match = cursor.fetchone()
+        # Fetch match info
+        match = fetch_one(MATCH_WITH_TEAMS, [match_id], rows=as_tuples)
 
         if not match:
             return JsonResponse({"error": "Match not found"}, status=404)
@@ -424,23 +414,7 @@ def match_players_api(request, match_id):
         team1_id, team2_id = match[2], match[4]
 
         # Fetch players for both teams + playing status
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    p.player_id,
-                    p.player_name,
-                    t.team_name,
-                    COALESCE(mp.is_playing, FALSE) AS is_playing
-                FROM players p
-                JOIN teams t ON p.team_id = t.team_id
-                LEFT JOIN match_players mp
-                    ON mp.player_id = p.player_id
-                   AND mp.match_id = %s
-                WHERE p.team_id IN (%s, %s)
-                ORDER BY t.team_name, p.player_name
-            """, [match_id, team1_id, team2_id])
-
-            players = dictfetchall(cursor)
+        players = fetch_all(SQUAD_SELECTION, [match_id, team1_id, team2_id])
 
         return JsonResponse({
             "match": {
@@ -471,33 +445,13 @@ def update_match_players_api(request, match_id):
     except Exception:
         return JsonResponse({"error": "Invalid JSON"}, status=400)
 
-    # Fetch players of match
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT player_id
-            FROM players
-            WHERE team_id IN (
-                SELECT team_1 FROM matches WHERE match_id=%s
-                UNION
-                SELECT team_2 FROM matches WHERE match_id=%s
-            )
-        """, [match_id, match_id])
-        valid_players = [row[0] for row in cursor.fetchall()]
-
-    with connection.cursor() as cursor:
-        # Delete old entries
-        cursor.execute("DELETE FROM match_players WHERE match_id=%s", [match_id])
-
-        # Insert updated entries
-        for pid in valid_players:
-            is_playing = pid in selected_players
-            mp_id = f"{match_id}_{pid}"
-            cursor.execute("""
-                INSERT INTO match_players (mp_id, match_id, player_id, is_playing)
-                VALUES (%s, %s, %s, %s)
-            """, [mp_id, match_id, pid, is_playing])
-
-    return JsonResponse({"status": "updated", "selected_players": selected_players})
+    changed = update_playing_xi(match_id, selected_players)
+
+    return JsonResponse({
+        "status": "updated",
+        "selected_players": selected_players,
+        "changed": [{"player_id": pid, "is_playing": playing} for pid, playing in changed]
+    })
 
 
 #########################
@@ -513,76 +467,45 @@ def manage_player_stats_api(request, match_id):
     # GET — fetch players + stats
     # -------------------------
     if request.method == "GET":
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT
-                    mp.mp_id,
-                    p.player_name,
-                    t.team_name,
-                    COALESCE(ps.run_rate, 0) AS run_rate,
-                    COALESCE(ps.econ, 0) AS econ,
-                    COALESCE(ps.wickets, 0) AS wickets,
-                    COALESCE(ps.sixes, 0) AS sixes,
-                    COALESCE(ps.fours, 0) AS fours,
-                    COALESCE(ps.catches, 0) AS catches,
-                    COALESCE(ps.runs, 0) AS runs
-                FROM match_players mp
-                JOIN players p ON mp.player_id = p.player_id
-                JOIN teams t ON p.team_id = t.team_id
-                LEFT JOIN player_stats ps ON mp.mp_id = ps.mp_id
-                WHERE mp.match_id = %s
-                  AND mp.is_playing = TRUE
-                ORDER BY t.team_name, p.player_name
-            """, [match_id])
-
-            players = dictfetchall(cursor)
+        players = fetch_all(PLAYING_STATS, [match_id])
 
         return JsonResponse({"players": players})
 
     # -------------------------
     # POST — save stats
     # -------------------------
-    data = json.loads(request.body)
-
-    with connection.cursor() as cursor:
-        for p in data["players"]:
-            mp_id = p["mp_id"]
-            stat_id = f"{mp_id}_STAT"
-
-            cursor.execute(
-                "SELECT 1 FROM player_stats WHERE mp_id=%s",
-                [mp_id]
-            )
-
-            if cursor.fetchone():
-                cursor.execute("""
-                    UPDATE player_stats SET
-                        run_rate=%s,
-                        econ=%s,
-                        wickets=%s,
-                        sixes=%s,
-                        fours=%s,
-                        catches=%s,
-                        runs=%s
-                    WHERE mp_id=%s
-                """, [
-                    p["run_rate"], p["econ"], p["wickets"],
-                    p["sixes"], p["fours"], p["catches"],
-                    p["runs"], mp_id
-                ])
-            else:
-                cursor.execute("""
-                    INSERT INTO player_stats
-                    (stat_id, mp_id, run_rate, econ, wickets,
-                     sixes, fours, catches, runs)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                """, [
-                    stat_id, mp_id,
-                    p["run_rate"], p["econ"], p["wickets"],
-                    p["sixes"], p["fours"], p["catches"], p["runs"]
-                ])
-
-    return JsonResponse({"status": "saved"})
+    try:
+        data = json.loads(request.body)
+        rows = data["players"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    stats, errors = validate_player_stats(match_id, rows)
+    if errors:
+        return JsonResponse({"error": "Invalid stats", "errors": errors}, status=400)
+
+    upsert_player_stats(match_id, stats)
+
+    return JsonResponse({"status": "saved", "saved": len(stats)})
+
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+def ingest_ball_events_api(request, match_id):
+    """
+    POST an NDJSON stream of deliveries (see player_stats.ingest).
+    The body is read line by line and applied in batches as it arrives.
+    """
+    summary = ingest_events(match_id, request, timer=False)
+
+    return JsonResponse({
+        "status": "ingested",
+        "events": summary["events"],
+        "rejected": summary["rejected"],
+        "errors": summary["errors"],
+        "batches": summary["batches"],
+    }, status=400 if summary["rejected"] and not summary["events"] else 200)
 
 
 ##############
@@ -594,80 +517,17 @@ def manage_player_stats_api(request, match_id):
 @require_http_methods(["POST"])
 def calculate_match_results_api(request, match_id):
     """
-    Calculate & store fantasy points for ALL users for a match
+    Queue the calculation of fantasy points for ALL users for a match.
+    Poll the returned job_id at /admin_panel/jobs/<job_id>/.
     """
-
-    with connection.cursor() as cursor:
-        # Get all fantasy teams for this match
-        cursor.execute("""
-            SELECT fantasy_team_id, user_id
-            FROM fantasy_teams
-            WHERE match_id = %s
-        """, [match_id])
-
-        teams = dictfetchall(cursor)
-
-    for team in teams:
-        fantasy_team_id = team["fantasy_team_id"]
-        user_id = team["user_id"]
-
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT
-                    ftp.is_captain,
-                    ftp.is_vice_captain,
-                    (
-                        (COALESCE(ps.runs,0) / 10.0) +
-                        (COALESCE(ps.run_rate,0) / 100.0) +
-                        (CASE 
-                            WHEN COALESCE(ps.econ,0) > 0 
-                            THEN 10.0 / ps.econ 
-                            ELSE 0 
-                        END) +
-                        (COALESCE(ps.wickets,0) * 2) +
-                        (COALESCE(ps.sixes,0)) +
-                        (COALESCE(ps.fours,0) * 0.5) +
-                        (COALESCE(ps.catches,0))
-                    ) AS base_points
-                FROM fantasy_team_players ftp
-                JOIN match_players mp 
-                    ON mp.player_id = ftp.player_id
-                   AND mp.match_id = %s
-                LEFT JOIN player_stats ps 
-                    ON ps.mp_id = mp.mp_id
-                WHERE ftp.fantasy_team_id = %s
-            """, [match_id, fantasy_team_id])
-
-            players = dictfetchall(cursor)
-
-        total_points = 0
-
-        for p in players:
-            if p["is_captain"]:
-                total_points += p["base_points"] * 2
-            elif p["is_vice_captain"]:
-                total_points += p["base_points"] * 1.5
-            else:
-                total_points += p["base_points"]
-
-        total_points = round(total_points, 2)
-
-        # 🔥 Store result
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                UPDATE fantasy_teams
-                SET total_points = %s
-                WHERE fantasy_team_id = %s
-            """, [total_points, fantasy_team_id])
-
-        # 🔥 Update leaderboards
-        update_overall_leaderboard_for_user(user_id)
-
-    update_all_overall_ranks()
-    update_matchday_leaderboard(match_id)
+    job_id = enqueue(
+        "calculate_match_results",
+        {"match_id": match_id},
+        dedupe_key=f"calculate_match_results:{match_id}",
+    )
 
     return JsonResponse({
-        "status": "success",
+        "status": "queued",
         "match_id": match_id,
-        "teams_processed": len(teams)
-    })
\ No newline at end of file
+        "job_id": job_id
+    }, status=202)
@@ -0,0 +1,271 @@
+import json
+import logging
+import os
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from core.db import execute, query
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# INVALIDATION BUS
+# ===========================
+# Writers publish the cache tags and version entities they changed with
+# NOTIFY on CHANNEL. NOTIFY is transactional: listeners only hear about
+# committed writes, and a rolled-back write is never announced.
+#
+# Every process that reads through a cache runs one listener thread with
+# its own connection. It evicts the tags locally (core.cache) and, when the
+# version counters are process-local, bumps them (core.versions).
+#
+# Bounded staleness: the local caches are only used while the listener is
+# connected and has confirmed its connection within
+# INVALIDATION_BUS_MAX_STALENESS seconds; otherwise reads bypass them.
+# After a reconnect the local reference cache (and process-local version
+# counters) are dropped wholesale. A gap in the message sequence is usually
+# a transaction committing out of order, or one that rolled back after
+# taking a number: holes are waited for INVALIDATION_BUS_GAP_WINDOW
+# seconds, and only those still open then cause a flush (one per poll).
+CHANNEL = "npl_invalidate"
+POLL = 1.0
+# Skips longer than this aren't tracked hole by hole: flush right away
+MAX_TRACKED_GAP = 10000
+
+
+def bus_enabled():
+    return getattr(settings, "INVALIDATION_BUS", True)
+
+
+def max_staleness():
+    return getattr(settings, "INVALIDATION_BUS_MAX_STALENESS", 5.0)
+
+
+def gap_window():
+    # a hole may not outlive the staleness bound
+    return min(getattr(settings, "INVALIDATION_BUS_GAP_WINDOW", 2.0), max_staleness())
+
+
+NOTIFY = query("bus.notify", """
+    SELECT pg_notify(%s, nextval('invalidation_seq') || ' ' || %s)
+""")
+
+
+def publish(tags=(), versions=()):
+    """
+    Announce changed cache tags / version entities to every process once
+    the current transaction commits. Payload: "<seq> <json>".
+    """
+    if not bus_enabled() or not (tags or versions):
+        return
+
+    body = json.dumps({"tags": list(tags), "versions": list(versions)})
+    execute(NOTIFY, [CHANNEL, body])
+
+
+class Listener(threading.Thread):
+    def __init__(self):
+        super().__init__(name="invalidation-bus", daemon=True)
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.connected = False
+        self.last_alive = 0.0
+        self.last_seq = None
+        self.missing = {}  # seq -> when the hole was noticed
+        self.counts = {
+            "received": 0,
+            "gaps": 0,         # sequence numbers skipped over (suspected missed)
+            "late": 0,         # skipped numbers that arrived afterwards
+            "expired": 0,      # holes still open after the gap window
+            "flushes": 0,
+            "reconnects": 0,
+            "errors": 0,
+        }
+
+    # -------------------------
+    # connection
+    # -------------------------
+    def connect(self):
+        wrapper = connections["default"]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        # works for psycopg2 and psycopg 3 alike
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {CHANNEL}")
+        return conn, cursor
+
+    def run(self):
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        backoff = POLL
+        while True:
+            conn = None
+            try:
+                conn, cursor = self.connect()
+                if is_psycopg3:
+                    conn.add_notify_handler(lambda notify: self.handle(notify.payload))
+                self.on_connect()
+                backoff = POLL
+
+                while True:
+                    select.select([conn.fileno()], [], [], POLL)
+                    # one round trip both proves the connection is alive and
+                    # makes the driver collect any pending notifications
+                    cursor.execute("SELECT 1")
+                    if not is_psycopg3:
+                        while conn.notifies:
+                            self.handle(conn.notifies.pop(0).payload)
+                    self.expire_gaps()
+                    self.last_alive = time.monotonic()
+            except Exception:
+                logger.exception("invalidation bus listener disconnected")
+                with self.lock:
+                    self.counts["errors"] += 1
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def on_connect(self):
+        # anything published while we weren't listening is lost
+        flush_local_caches()
+        with self.lock:
+            if self.last_alive:
+                self.counts["reconnects"] += 1
+            self.counts["flushes"] += 1
+            self.last_seq = None
+            self.missing.clear()
+        self.last_alive = time.monotonic()
+        self.connected = True
+
+    # -------------------------
+    # messages
+    # -------------------------
+    def handle(self, payload):
+        from core.cache import invalidate
+        from core.versions import bump, versions_in_shared_cache
+
+        try:
+            seq, body = payload.split(" ", 1)
+            seq = int(seq)
+            data = json.loads(body)
+        except ValueError:
+            logger.warning("invalidation bus: malformed payload %r", payload)
+            return
+
+        flush = False
+        with self.lock:
+            self.counts["received"] += 1
+            if self.last_seq is None:
+                self.last_seq = seq
+            elif seq > self.last_seq:
+                skipped = range(self.last_seq + 1, seq)
+                self.counts["gaps"] += len(skipped)
+                if len(skipped) > MAX_TRACKED_GAP:
+                    self.missing.clear()
+                    flush = True
+                elif skipped:
+                    noticed = time.monotonic()
+                    self.missing.update(dict.fromkeys(skipped, noticed))
+                self.last_seq = seq
+            elif seq in self.missing:
+                # committed out of order: it wasn't missed after all
+                del self.missing[seq]
+                self.counts["late"] += 1
+
+        if flush:
+            flush_local_caches()
+            with self.lock:
+                self.counts["flushes"] += 1
+
+        invalidate(*data.get("tags", []))
+        if not versions_in_shared_cache():
+            bump(*data.get("versions", []))
+
+    def expire_gaps(self):
+        """
+        Give up on holes older than the gap window: whatever took the
+        number rolled back, or its message was lost. One flush covers them
+        all.
+        """
+        deadline = time.monotonic() - gap_window()
+        with self.lock:
+            expired = [seq for seq, noticed in self.missing.items() if noticed <= deadline]
+            for seq in expired:
+                del self.missing[seq]
+            if expired:
+                self.counts["expired"] += len(expired)
+                self.counts["flushes"] += 1
+
+        if expired:
+            flush_local_caches()
+
+    def healthy(self):
+        return (
+            self.is_alive()
+            and self.connected
+            and time.monotonic() - self.last_alive <= max_staleness()
+        )
+
+    def metrics(self):
+        with self.lock:
+            counts = dict(self.counts)
+            outstanding = len(self.missing)
+        return {
+            **counts,
+            "missed": outstanding,
+            "connected": self.connected,
+            "healthy": self.healthy(),
+            "seconds_since_alive": round(time.monotonic() - self.last_alive, 3) if self.last_alive else None,
+            "last_seq": self.last_seq,
+            "pid": self.pid,
+        }
+
+
+def flush_local_caches():
+    from core import cache, versions
+
+    cache.clear_local()
+    versions.clear_local()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def listener():
+    """
+    This process's listener, started on first use (and again after a fork)
+    """
+    global _listener
+    if _listener is not None and _listener.pid == os.getpid() and _listener.is_alive():
+        return _listener
+
+    with _listener_lock:
+        if _listener is None or _listener.pid != os.getpid() or not _listener.is_alive():
+            _listener = Listener()
+            _listener.start()
+        return _listener
+
+
+def local_caches_usable():
+    """
+    True when cached entries in this process are at most
+    INVALIDATION_BUS_MAX_STALENESS seconds behind committed writes
+    (or the bus is turned off and only TTLs apply)
+    """
+    return not bus_enabled() or listener().healthy()
+
+
+def metrics():
+    return listener().metrics() if bus_enabled() else {"enabled": False}
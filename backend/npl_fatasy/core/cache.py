@@ -0,0 +1,92 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from core import bus
+
+# ===========================
+# READ-THROUGH CACHE
+# ===========================
+# Reference data (teams, squads, fixtures) cached in this process, with a
+# TTL and tags. Every tag has a generation number; an entry's key embeds
+# the generations of its tags, read before the value is computed. Bumping
+# a tag's generation (invalidate) makes every entry under it unreachable,
+# and the old entries simply expire. Invalidations reach the other
+# processes through the invalidation bus (core.bus); while the bus can't
+# vouch for this process's cache, reads go straight to the database.
+#
+# Tags: core.versions.TEAMS / MATCHES for the lists, "team:<id>" /
+# "match:<id>" for one entity and whatever is derived from it (a team's
+# squad, a match's teams).
+REFERENCE_CACHE = "reference"
+
+
+def team_tag(team_id):
+    return f"team:{team_id}"
+
+
+def match_tag(match_id):
+    return f"match:{match_id}"
+
+
+def _cache():
+    return caches[REFERENCE_CACHE]
+
+
+def _ttl():
+    return getattr(settings, "REFERENCE_CACHE_TTL", 300)
+
+
+def _generations(tags):
+    cache = _cache()
+    keys = [f"tag:{tag}" for tag in tags]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # never reuse a generation an evicted counter may have handed out
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def read_through(key, tags, compute, ttl=None):
+    """
+    The cached value of `key` under `tags`, calling compute() on a miss
+    """
+    if not bus.local_caches_usable():
+        return compute()
+
+    cache = _cache()
+    generations = ".".join(str(g) for g in _generations(tags))
+    entry_key = "entry:" + hashlib.sha256(f"{key}|{generations}".encode()).hexdigest()
+
+    value = cache.get(entry_key)
+    if value is None:
+        value = compute()
+        cache.set(entry_key, value, _ttl() if ttl is None else ttl)
+    return value
+
+
+def invalidate(*tags):
+    cache = _cache()
+    for tag in tags:
+        try:
+            cache.incr(f"tag:{tag}")
+        except ValueError:
+            pass  # no generation yet: nothing was cached under it
+
+
+def invalidate_on_commit(*tags):
+    """
+    Invalidate once the current transaction commits (immediately outside one),
+    here and, through the bus, in every other process
+    """
+    transaction.on_commit(lambda: invalidate(*tags))
+    bus.publish(tags=tags)
+
+
+def clear_local():
+    _cache().clear()
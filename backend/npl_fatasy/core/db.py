@@ -0,0 +1,172 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+# ===========================
+# QUERY REGISTRY
+# ===========================
+# Every statement the app runs is registered once, at import time, under a
+# dotted name ("leaderboard.overall_page"). The name is appended to the SQL
+# as a comment, so it shows up in pg_stat_statements, pg_stat_activity and
+# the slow query log, and per-name timings are kept in process.
+#
+#   OVERALL_PAGE = query("leaderboard.overall_page", """SELECT ...""")
+#   rows = fetch_all(OVERALL_PAGE, [after_rank, limit])
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Query:
+    __slots__ = ("name", "sql")
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = f"{sql.rstrip()}\n/* {name} */"
+
+    def __repr__(self):
+        return f"<Query {self.name}>"
+
+
+def query(name, sql):
+    """
+    Register a named statement. Registering the same name twice with
+    different SQL is an error.
+    """
+    q = Query(name, sql)
+    with _registry_lock:
+        existing = _registry.get(name)
+        if existing is not None and existing.sql != q.sql:
+            raise ValueError(f"query {name!r} is already registered with different SQL")
+        _registry[name] = q
+    return q
+
+
+def registered_queries():
+    return dict(_registry)
+
+
+# ===========================
+# ROW FACTORIES
+# ===========================
+# (column names, list of row tuples) -> result
+def as_dicts(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def as_tuples(columns, rows):
+    return rows
+
+
+def as_columns(columns, rows):
+    """
+    {column: [values]}: one list per column instead of one dict per row,
+    for large result sets
+    """
+    return {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+
+
+# ===========================
+# TIMING
+# ===========================
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, seconds):
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+def query_stats():
+    """
+    {name: {"calls", "seconds", "max_seconds"}} for this process, slowest
+    total first
+    """
+    with _stats_lock:
+        items = [(name, dict(stats)) for name, stats in _stats.items()]
+    return dict(sorted(items, key=lambda item: -item[1]["seconds"]))
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+@contextmanager
+def _timed(q):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(q.name, time.perf_counter() - started)
+
+
+def _columns(cursor):
+    return [col[0] for col in cursor.description]
+
+
+# ===========================
+# EXECUTION
+# ===========================
+def fetch_all(q, params=None, rows=as_dicts):
+    with _timed(q), connection.cursor() as cursor:
+        cursor.execute(q.sql, params)
+        return rows(_columns(cursor), cursor.fetchall())
+
+
+def fetch_one(q, params=None, rows=as_dicts):
+    """
+    The first row (a dict by default), or None
+    """
+    with _timed(q), connection.cursor() as cursor:
+        cursor.execute(q.sql, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return rows(_columns(cursor), [row])[0]
+
+
+def fetch_value(q, params=None, default=None):
+    """
+    The first column of the first row, or default
+    """
+    with _timed(q), connection.cursor() as cursor:
+        cursor.execute(q.sql, params)
+        row = cursor.fetchone()
+        return default if row is None else row[0]
+
+
+def execute(q, params=None):
+    """
+    Run a statement for its effect; returns the rowcount
+    """
+    with _timed(q), connection.cursor() as cursor:
+        cursor.execute(q.sql, params)
+        return cursor.rowcount
+
+
+def stream(q, params=None, rows=as_tuples, chunk_size=2000):
+    """
+    Yield the result in chunks of chunk_size rows (each shaped by `rows`)
+    from a server-side cursor, without loading it all into memory.
+    Timed once the stream is exhausted or closed.
+    """
+    with _timed(q):
+        cursor = connection.chunked_cursor()
+        try:
+            cursor.execute(q.sql, params)
+            columns = _columns(cursor)
+            while True:
+                chunk = cursor.fetchmany(chunk_size)
+                if not chunk:
+                    return
+                yield rows(columns, chunk)
+        finally:
+            cursor.close()
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from django.db import connection
+from django.test import RequestFactory
+
+
+def fake_request(user_id, path="/", method="get", **data):
+    request = getattr(RequestFactory(), method)(path, **data)
+    # users.auth.login_required reads the session, admin views request.user
+    request.session = {"user_id": user_id}
+    request.user = SimpleNamespace(is_authenticated=True, is_superuser=True)
+    return request
+
+
+def _rescore_one_player(match_id, user_id):
+    from fantasy_teams.live import rescore_players
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT player_id
+            FROM fantasy_team_players
+            WHERE fantasy_team_id = %s
+            LIMIT 1
+        """, [f"{user_id}_{match_id}"])
+        player_id = cursor.fetchone()[0]
+
+    return rescore_players(match_id, {player_id: 1})
+
+
+def hot_paths(match_id, user_id):
+    """
+    [(label, callable)] running the request paths that matter on a
+    matchday for one match and one of its users
+    """
+    from admin_panel import views as admin_views
+    from fantasy_teams import views as fantasy_views
+    from fantasy_teams.jobs import CHUNK_SIZE
+    from fantasy_teams.scoring import score_fantasy_teams
+    from leaderboard import views as leaderboard_views
+    from leaderboard.refresh import refresh_match_leaderboards
+
+    return [
+        ("select_players_api GET",
+         lambda: fantasy_views.select_players_api(fake_request(user_id), match_id=match_id)),
+        ("fantasy_team_api",
+         lambda: fantasy_views.fantasy_team_api(fake_request(user_id), match_id=match_id)),
+        ("fantasy_team_results_api",
+         lambda: fantasy_views.fantasy_team_results_api(fake_request(user_id), match_id=match_id)),
+        ("overall_leaderboard_api",
+         lambda: leaderboard_views.overall_leaderboard_api(fake_request(user_id))),
+        ("matchday_leaderboard_api",
+         lambda: leaderboard_views.matchday_leaderboard_api(fake_request(user_id), match_id=match_id)),
+        ("my_overall_rank_api",
+         lambda: leaderboard_views.my_overall_rank_api(fake_request(user_id))),
+        ("my_matchday_rank_api",
+         lambda: leaderboard_views.my_matchday_rank_api(fake_request(user_id), match_id=match_id)),
+        ("manage_player_stats_api GET",
+         lambda: admin_views.manage_player_stats_api(fake_request(user_id), match_id=match_id)),
+        ("match_players_api GET",
+         lambda: admin_views.match_players_api(fake_request(user_id), match_id=match_id)),
+        ("calculate_match_results: score chunk",
+         lambda: score_fantasy_teams(match_id, limit=CHUNK_SIZE)),
+        ("calculate_match_results: leaderboards",
+         lambda: refresh_match_leaderboards(match_id)),
+        ("live rescore: one player",
+         lambda: _rescore_one_player(match_id, user_id)),
+    ]
@@ -0,0 +1,198 @@
+import heapq
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# SQL RECORDER
+# ===========================
+# A connection.execute_wrapper() that times every statement. Statements are
+# grouped by shape: the name of a registered query (core.db), or the SQL
+# with literals and IN lists collapsed. A shape run many times in one
+# request is the signature of a per-row query loop (N+1).
+_NAME = re.compile(r"/\* ([\w.:-]+) \*/\s*$")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)")
+
+
+def shape(sql):
+    match = _NAME.search(sql)
+    if match:
+        return match.group(1)
+    sql = _LITERALS.sub("?", " ".join(sql.split()))
+    return _IN_LIST.sub("(...)", sql)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.statements = []  # (sql, seconds)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    def shapes(self):
+        return Counter(shape(sql) for sql, _ in self.statements)
+
+    def repeated(self, threshold=None):
+        """
+        {shape: count} for shapes run at least threshold times
+        """
+        threshold = threshold or n_plus_one_threshold()
+        return {s: n for s, n in self.shapes().most_common() if n >= threshold}
+
+    def slowest(self, n=None):
+        n = slow_query_count() if n is None else n
+        return [
+            (shape(sql), seconds)
+            for sql, seconds in heapq.nlargest(n, self.statements, key=lambda s: s[1])
+        ]
+
+
+@contextmanager
+def record_queries():
+    """
+    Record the statements run inside the block on the default connection:
+
+        with record_queries() as recorder:
+            ...
+        recorder.count, recorder.repeated(), recorder.slowest()
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+
+
+# ===========================
+# BUDGETS
+# ===========================
+def instrumentation_enabled():
+    return getattr(settings, "SQL_INSTRUMENTATION", True)
+
+
+def n_plus_one_threshold():
+    return getattr(settings, "N_PLUS_ONE_THRESHOLD", 5)
+
+
+def slow_query_count():
+    return getattr(settings, "SLOW_QUERY_COUNT", 3)
+
+
+def query_budget(view_name):
+    """
+    Most statements one request to a view may run: QUERY_BUDGETS[view_name]
+    (the resolved URL name with its namespace, e.g. "leaderboard:my_overall_rank"),
+    else QUERY_BUDGET_DEFAULT
+    """
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    return budgets.get(view_name, getattr(settings, "QUERY_BUDGET_DEFAULT", 30))
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else None
+
+
+# ===========================
+# MIDDLEWARE
+# ===========================
+def _quoted(text):
+    return '"%s"' % text[:80].replace("\\", "\\\\").replace('"', "'")
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Count and time the SQL of every request. Adds a Server-Timing header
+    (total DB time plus the slowest statements) and logs one JSON line per
+    request, at WARNING when the view's query budget is exceeded or a
+    statement shape repeats N_PLUS_ONE_THRESHOLD times.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not instrumentation_enabled():
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.report(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not instrumentation_enabled():
+            return await self.get_response(request)
+
+        # Under ASGI sync views (and their queries) run on the request's
+        # sync thread, which has its own connection: wrap that one
+        started = time.perf_counter()
+        recorder = QueryRecorder()
+        await sync_to_async(lambda: connection.execute_wrappers.append(recorder))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(recorder))()
+        return self.report(request, response, recorder, started)
+
+    def report(self, request, response, recorder, started):
+        total = time.perf_counter() - started
+        name = view_name(request)
+        budget = query_budget(name)
+        repeated = recorder.repeated()
+        slowest = recorder.slowest()
+
+        timings = [
+            f"app;dur={total * 1000:.2f}",
+            f"db;dur={recorder.seconds * 1000:.2f};desc={_quoted(f'{recorder.count} queries')}",
+            *(
+                f"sql-{i};dur={seconds * 1000:.2f};desc={_quoted(label)}"
+                for i, (label, seconds) in enumerate(slowest, start=1)
+            ),
+        ]
+        response["Server-Timing"] = ", ".join(timings)
+
+        over_budget = recorder.count > budget
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": name,
+            "status": response.status_code,
+            "ms": round(total * 1000, 2),
+            "queries": recorder.count,
+            "db_ms": round(recorder.seconds * 1000, 2),
+            "budget": budget,
+            "over_budget": over_budget,
+            "repeated": [{"shape": s, "count": n} for s, n in repeated.items()],
+            "slowest": [{"shape": s, "ms": round(seconds * 1000, 2)} for s, seconds in slowest],
+        }
+        level = logging.WARNING if over_budget or repeated else logging.INFO
+        logger.log(level, "sql %s", json.dumps(record), extra={"sql": record})
+        return response
@@ -0,0 +1,246 @@
+import itertools
+import json
+import math
+import platform
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.hot_paths import fake_request
+from core.instrumentation import record_queries
+from core.synthetic import seed_league
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a non-empty list
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    """
+    samples: [(seconds, queries)] -> timing and query-count summary
+    """
+    ms = [seconds * 1000 for seconds, _ in samples]
+    queries = [count for _, count in samples]
+    return {
+        "calls": len(samples),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "max_ms": round(max(ms), 3),
+        "queries_per_call": round(sum(queries) / len(queries), 2),
+        "max_queries": max(queries),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic league (rolled back afterwards), time the matchday "
+        "endpoints and write p50/p95 latency and queries per call as JSON. "
+        "Run it against a local Postgres before and after a change."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000, help="Synthetic users")
+        parser.add_argument("--matches", type=int, default=5, help="Synthetic matches")
+        parser.add_argument("--squad-size", type=int, default=15, help="Players per team")
+        parser.add_argument("--playing", type=int, default=11, help="Playing XI size per team")
+        parser.add_argument(
+            "--entry-rate", type=float, default=1.0,
+            help="Share of users with a fantasy team in each match",
+        )
+        parser.add_argument("--seed", type=float, default=0.42, help="Seed for the synthetic data")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed calls per endpoint")
+        parser.add_argument("--warmup", type=int, default=2, help="Untimed calls per endpoint")
+        parser.add_argument(
+            "--output", default="benchmark_matchday.json",
+            help="Where to write the JSON results ('-' for stdout)",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        try:
+            with transaction.atomic():
+                results = self.run(options)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "config": {
+                key: options[key]
+                for key in ("users", "matches", "squad_size", "playing", "entry_rate", "seed", "repeat", "warmup")
+            },
+            "results": results,
+        }
+
+        self.stdout.write(f"{'endpoint':<36} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8}")
+        for name, summary in results.items():
+            self.stdout.write(
+                f"{name:<36} {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} "
+                f"{summary['queries_per_call']:>8}"
+            )
+
+        if options["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    # ===========================
+    # RUN
+    # ===========================
+    def run(self, options):
+        started = time.perf_counter()
+        seeded = seed_league(
+            options["users"], options["matches"],
+            squad_size=options["squad_size"], playing=options["playing"],
+            entry_rate=options["entry_rate"], seed=options["seed"],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stderr.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        # the middle match is today's
+        match_id = seeded["match_ids"][len(seeded["match_ids"]) // 2]
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT user_id FROM fantasy_teams
+                WHERE match_id = %s
+                ORDER BY fantasy_team_id
+                LIMIT 1
+            """, [match_id])
+            row = cursor.fetchone()
+        if not row:
+            raise CommandError("No fantasy teams were seeded; raise --users or --entry-rate")
+        user_id = row[0]
+
+        results = {}
+        for name, call in self.cases(match_id, user_id):
+            for _ in range(options["warmup"]):
+                call()
+
+            samples = []
+            for _ in range(options["repeat"]):
+                with record_queries() as recorder:
+                    t0 = time.perf_counter()
+                    call()
+                    samples.append((time.perf_counter() - t0, recorder.count))
+            results[name] = summarize(samples)
+            self.stderr.write(f"  {name}: done")
+
+        return results
+
+    def cases(self, match_id, user_id):
+        """
+        [(name, callable)]. calculate_match_results runs first: it fills
+        the leaderboards the read cases page through.
+        """
+        from admin_panel import views as admin_views
+        from fantasy_teams import views as fantasy_views
+        from jobs.queue import run_next_job
+        from leaderboard import views as leaderboard_views
+
+        def calculate_match_results():
+            response = admin_views.calculate_match_results_api(fake_request(user_id, method="post"), match_id)
+            job_id = json.loads(response.content)["job_id"]
+            # runs anything queued ahead of it too; keep the queue empty
+            while True:
+                job = run_next_job()
+                if job is None or job.job_id == job_id:
+                    return
+
+        lineups = self.lineups(match_id)
+        submissions = itertools.count()
+
+        def select_players_post():
+            # alternate lineups so every call writes
+            payload = lineups[next(submissions) % len(lineups)]
+            response = fantasy_views.select_players_api(_post(user_id, payload), match_id)
+            if response.status_code != 200:
+                raise CommandError(f"select_players_api: {response.content.decode()}")
+
+        stats = self.stats_sheet(admin_views, match_id, user_id)
+        saves = itertools.count(1)
+
+        def player_stats_post():
+            # every save changes every player's runs, so everything is re-scored
+            bump = next(saves)
+            payload = {"players": [{**row, "runs": row["runs"] + bump} for row in stats]}
+            response = admin_views.manage_player_stats_api(_post(user_id, payload), match_id)
+            if response.status_code != 200:
+                raise CommandError(f"manage_player_stats_api: {response.content.decode()}")
+
+        return [
+            ("calculate_match_results",
+             calculate_match_results),
+            ("select_players_api POST",
+             select_players_post),
+            ("overall_leaderboard_api",
+             lambda: leaderboard_views.overall_leaderboard_api(fake_request(user_id))),
+            ("matchday_leaderboard_api",
+             lambda: leaderboard_views.matchday_leaderboard_api(fake_request(user_id), match_id)),
+            ("manage_player_stats_api GET",
+             lambda: admin_views.manage_player_stats_api(fake_request(user_id), match_id)),
+            ("manage_player_stats_api POST",
+             player_stats_post),
+        ]
+
+    # ===========================
+    # PAYLOADS
+    # ===========================
+    def lineups(self, match_id):
+        """
+        Two valid 7-player selections from the match's squads (same
+        players, captain and vice-captain swapped): cheapest first,
+        at most 4 per team and 3 per role
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT p.player_id, p.team_id, p.role
+                FROM matches m
+                JOIN players p ON p.team_id IN (m.team_1, m.team_2)
+                WHERE m.match_id = %s
+                ORDER BY p.cost, p.player_id
+            """, [match_id])
+            squad = cursor.fetchall()
+
+        picked, teams, roles = [], {}, {}
+        for player_id, team_id, role in squad:
+            if teams.get(team_id, 0) < 4 and roles.get(role, 0) < 3:
+                picked.append(player_id)
+                teams[team_id] = teams.get(team_id, 0) + 1
+                roles[role] = roles.get(role, 0) + 1
+            if len(picked) == 7:
+                break
+        if len(picked) < 7:
+            raise CommandError("The synthetic squads can't make a valid lineup")
+
+        return [
+            {"players": picked, "captain": picked[0], "vice_captain": picked[1]},
+            {"players": picked, "captain": picked[1], "vice_captain": picked[0]},
+        ]
+
+    def stats_sheet(self, admin_views, match_id, user_id):
+        response = admin_views.manage_player_stats_api(fake_request(user_id), match_id)
+        rows = json.loads(response.content)["players"]
+        fields = ("mp_id", "run_rate", "econ", "wickets", "sixes", "fours", "catches", "runs")
+        return [{field: row[field] for field in fields} for row in rows]
+
+
+def _post(user_id, payload):
+    return fake_request(user_id, method="post", data=json.dumps(payload), content_type="application/json")
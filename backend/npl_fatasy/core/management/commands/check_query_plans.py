@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.plans import (
+    COST_FACTOR,
+    SNAPSHOT_PATH,
+    collect_hot_plans,
+    compare_snapshots,
+    load_snapshot,
+    sequential_scans,
+    snapshot,
+    write_snapshot,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN every statement of the matchday hot paths and fail if one "
+        "does a sequential scan of a large table, or if a registered "
+        "statement's plan changed shape or cost COST_FACTOR times more than "
+        "in the committed snapshot. Seeds a synthetic season first (rolled "
+        "back afterwards) unless --teams 0 is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--teams", type=int, default=None,
+            help="Fantasy teams to seed per match (default: the snapshot's scale, else 1000; "
+                 "0: use the first match with teams in the database)",
+        )
+        parser.add_argument(
+            "--min-rows", type=int, default=1000,
+            help="Sequential scans of tables smaller than this are allowed",
+        )
+        parser.add_argument(
+            "--cost-factor", type=float, default=COST_FACTOR,
+            help="Fail when a statement's estimated cost grows by more than this factor",
+        )
+        parser.add_argument("--snapshot", default=SNAPSHOT_PATH, help="Plan snapshot file")
+        parser.add_argument(
+            "--update-snapshot", action="store_true",
+            help="Write the current plans to the snapshot instead of comparing "
+                 "(on a freshly migrated database, like the test suite's)",
+        )
+
+    def handle(self, *args, **options):
+        expected = None if options["update_snapshot"] else load_snapshot(options["snapshot"])
+        teams = options["teams"]
+        if teams is None:
+            teams = expected["teams"] if expected else 1000
+        if expected and teams != expected["teams"]:
+            raise CommandError(
+                f"The snapshot was taken with --teams {expected['teams']}; "
+                f"compare at that scale or pass --update-snapshot"
+            )
+
+        try:
+            with transaction.atomic():
+                plans = collect_hot_plans(teams)
+                scans = sequential_scans(plans, options["min_rows"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+        except ValueError as e:
+            raise CommandError(f"{e}; use --teams")
+
+        labels = list(dict.fromkeys(entry["label"] for entry in plans))
+        for label in labels:
+            count = sum(1 for entry in plans if entry["label"] == label)
+            bad = [scan for scan in scans if scan[0] == label]
+            status = "SEQ SCAN" if bad else "ok"
+            self.stdout.write(f"{status:>8}  {label} ({count} statements)")
+            for _, table, rows, sql in bad:
+                self.stdout.write(f"          {table} (~{rows} rows): {' '.join(sql.split())[:160]}")
+
+        problems = []
+        if options["update_snapshot"]:
+            write_snapshot(plans, teams, options["snapshot"])
+            self.stdout.write(f"Wrote {len(snapshot(plans))} plans to {options['snapshot']}")
+        elif expected:
+            problems = compare_snapshots(expected["plans"], snapshot(plans), options["cost_factor"])
+            for name, problem in problems:
+                self.stdout.write(f"{'CHANGED':>8}  {name}: {problem}")
+        else:
+            self.stdout.write(f"No plan snapshot at {options['snapshot']}; --update-snapshot writes one")
+
+        if scans or problems:
+            raise CommandError(
+                f"{len(scans)} sequential scan(s) of large tables, "
+                f"{len(problems)} plan(s) differing from the snapshot"
+            )
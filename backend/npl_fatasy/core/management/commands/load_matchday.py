@@ -0,0 +1,454 @@
+import http.cookiejar
+import json
+import math
+import platform
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.cache import invalidate_on_commit, match_tag
+from core.instrumentation import shape
+from core.management.commands.benchmark_matchday import percentile
+from core.synthetic import seed_league
+from core.versions import MATCHES, PLAYERS, TEAMS, bump_on_commit
+
+# ===========================
+# SIMULATED USERS
+# ===========================
+# Each simulated user is a browser session: its own cookie jar (sessionid,
+# csrftoken), logged in through the real login endpoint. Redirects are not
+# followed, so a lost session shows up as a 302 instead of a login page.
+_SERVER_TIMING_DB = "db;dur="
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class VirtualUser:
+    def __init__(self, base_url, username, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.timeout = timeout
+        self.jar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.jar), _NoRedirect(),
+        )
+        self.samples = []  # (endpoint, started, seconds, status, db_ms, queries)
+
+    def csrf_token(self):
+        return next((c.value for c in self.jar if c.name == "csrftoken"), "")
+
+    def call(self, endpoint, method, path, payload=None):
+        """
+        One timed request. Returns the decoded JSON body, or None when the
+        request failed (non-2xx status, timeout, refused connection).
+        """
+        data = None if payload is None else json.dumps(payload).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+            request.add_header("X-CSRFToken", self.csrf_token())
+
+        started = time.perf_counter()
+        status, body, timing = None, None, ""
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status = response.status
+                body = response.read()
+                timing = response.headers.get("Server-Timing", "")
+        except urllib.error.HTTPError as e:
+            status = e.code
+            timing = e.headers.get("Server-Timing", "")
+        except (urllib.error.URLError, OSError):
+            pass
+        seconds = time.perf_counter() - started
+
+        db_ms, queries = _server_timing(timing)
+        self.samples.append((endpoint, started, seconds, status, db_ms, queries))
+        if status is None or status >= 300:
+            return None
+        return json.loads(body) if body else {}
+
+    def login(self, password):
+        self.call("csrf", "GET", "/users/csrf/")
+        return self.call("login", "POST", "/users/login/", {
+            "username": self.username, "password": password,
+        }) is not None
+
+
+def _server_timing(header):
+    """
+    (db ms, query count) from core.instrumentation's Server-Timing header
+    """
+    for metric in header.split(","):
+        metric = metric.strip()
+        if metric.startswith(_SERVER_TIMING_DB):
+            parts = dict(p.split("=", 1) for p in metric.split(";")[1:] if "=" in p)
+            queries = parts.get("desc", "").strip('"').split(" ")[0]
+            return float(parts["dur"]), int(queries) if queries.isdigit() else None
+    return None, None
+
+
+def pick_lineup(players, rng):
+    """
+    A random valid selection from the squad select_players_api returns:
+    7 players, at most 4 per team and 3 per role, within the 60 budget
+    """
+    for _ in range(50):
+        pool = players[:]
+        rng.shuffle(pool)
+        picked, teams, roles, cost = [], Counter(), Counter(), 0
+        for p in pool:
+            if teams[p["team_id"]] < 4 and roles[p["role"]] < 3 and cost + p["cost"] <= 60:
+                picked.append(p["player_id"])
+                teams[p["team_id"]] += 1
+                roles[p["role"]] += 1
+                cost += p["cost"]
+            if len(picked) == 7:
+                captain, vice_captain = rng.sample(picked, 2)
+                return {"players": picked, "captain": captain, "vice_captain": vice_captain}
+    return None
+
+
+# ===========================
+# LOCK WAITS
+# ===========================
+LOCK_WAITS = """
+    SELECT wait_event, query
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+      AND pid <> pg_backend_pid()
+      AND state = 'active'
+      AND wait_event_type = 'Lock'
+"""
+
+
+class LockSampler(threading.Thread):
+    """
+    Polls pg_stat_activity for backends waiting on a heavyweight lock
+    (row, tuple, transaction id, relation) and counts them by statement
+    shape, i.e. the registered query name (core.db). Each sample stands
+    for `interval` seconds of waiting.
+    """
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.samples = 0
+        self.peak = 0
+        self.waits = Counter()  # (shape, wait_event) -> samples
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.wait(self.interval):
+                    cursor.execute(LOCK_WAITS)
+                    rows = cursor.fetchall()
+                    self.samples += 1
+                    self.peak = max(self.peak, len(rows))
+                    for wait_event, sql in rows:
+                        self.waits[(shape(sql or ""), wait_event)] += 1
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def report(self):
+        return {
+            "samples": self.samples,
+            "interval_s": self.interval,
+            "peak_waiting": self.peak,
+            "statements": [
+                {
+                    "statement": statement,
+                    "wait_event": wait_event,
+                    "samples": n,
+                    "approx_wait_s": round(n * self.interval, 2),
+                }
+                for (statement, wait_event), n in self.waits.most_common()
+            ],
+        }
+
+
+def deadlocks():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cursor.fetchone()[0]
+
+
+# ===========================
+# REPORT
+# ===========================
+def summarize(samples, wall):
+    """
+    samples: [(endpoint, started, seconds, status, db_ms, queries)] of one
+    endpoint -> throughput, latency percentiles and error rate
+    """
+    ms = [seconds * 1000 for _, _, seconds, _, _, _ in samples]
+    errors = Counter(str(status) for _, _, _, status, _, _ in samples if status is None or status >= 300)
+    db_ms = [d for *_, d, _ in samples if d is not None]
+    queries = [q for *_, q in samples if q is not None]
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / wall, 2) if wall else None,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2),
+        "errors": sum(errors.values()),
+        "error_rate": round(sum(errors.values()) / len(samples), 4),
+        "errors_by_status": dict(errors),
+        "db_ms_mean": round(sum(db_ms) / len(db_ms), 2) if db_ms else None,
+        "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a matchday submission burst against a running server: seed "
+        "a synthetic league (committed, removed afterwards unless --keep), "
+        "log simulated users in with real sessions, then have them open the "
+        "team picker, submit and edit lineups and read their team and the "
+        "leaderboards. Reports throughput, tail latency, error rate per "
+        "endpoint and Postgres lock waits. Start the server first, against "
+        "the same database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Server to load")
+        parser.add_argument("--users", type=int, default=1000, help="Simulated users")
+        parser.add_argument("--concurrency", type=int, default=100, help="Users active at once")
+        parser.add_argument(
+            "--ramp", type=float, default=60.0,
+            help="Seconds over which the users arrive",
+        )
+        parser.add_argument(
+            "--arrival", choices=("rising", "uniform"), default="rising",
+            help="rising: arrivals grow towards the end of the ramp, like the run-up to a deadline",
+        )
+        parser.add_argument("--edits", type=int, default=1, help="Extra submissions per user")
+        parser.add_argument(
+            "--think", type=float, default=2.0,
+            help="Most seconds a user waits between requests",
+        )
+        parser.add_argument(
+            "--leaderboard-reads", type=int, default=1,
+            help="Leaderboard reads per user after submitting",
+        )
+        parser.add_argument(
+            "--entry-rate", type=float, default=0.5,
+            help="Share of users who already have a team for the match",
+        )
+        parser.add_argument("--squad-size", type=int, default=15, help="Players per team")
+        parser.add_argument("--seed", type=float, default=0.42, help="Seed for data and behaviour")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+        parser.add_argument(
+            "--lock-interval", type=float, default=0.1,
+            help="Seconds between pg_stat_activity samples",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the synthetic league")
+        parser.add_argument(
+            "--output", default="load_matchday.json",
+            help="Where to write the JSON results ('-' for stdout)",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--users and --concurrency must be at least 1")
+
+        probe = VirtualUser(options["base_url"], None, options["timeout"])
+        if probe.call("csrf", "GET", "/users/csrf/") is None:
+            raise CommandError(f"No server answering at {options['base_url']}")
+
+        password = "load-%d" % random.Random(options["seed"]).randrange(10 ** 9)
+        seeded = self.seed(options, password)
+        try:
+            report = self.run(options, seeded, password)
+        finally:
+            if options["keep"]:
+                self.stderr.write(f"Kept the synthetic league (prefix {seeded['prefix']}, password {password})")
+            else:
+                self.cleanup(seeded)
+
+        self.stdout.write(
+            f"{'endpoint':<22} {'reqs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'errors':>7}"
+        )
+        for name, s in report["endpoints"].items():
+            self.stdout.write(
+                f"{name:<22} {s['requests']:>6} {s['rps']:>8} {s['p50_ms']:>9.2f} "
+                f"{s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f} {s['error_rate']:>7.2%}"
+            )
+        locks = report["lock_waits"]
+        self.stdout.write(
+            f"lock waits: peak {locks['peak_waiting']} backends, "
+            f"{len(locks['statements'])} statements, {report['deadlocks']} deadlocks"
+        )
+        for row in locks["statements"][:5]:
+            self.stdout.write(f"  {row['statement'][:60]:<60} {row['wait_event']:<14} ~{row['approx_wait_s']}s")
+
+        if options["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+
+    # ===========================
+    # DATA
+    # ===========================
+    def seed(self, options, password):
+        """
+        Commit a one-match league whose users can log in with `password`,
+        and tell the server's caches about the new fixtures
+        """
+        started = time.perf_counter()
+        with transaction.atomic():
+            seeded = seed_league(
+                options["users"], 1, squad_size=options["squad_size"],
+                entry_rate=options["entry_rate"], seed=options["seed"],
+            )
+            # one hash for everyone: hashing per user would take minutes
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE users SET password = %s WHERE starts_with(username, %s)",
+                    [make_password(password), seeded["prefix"]],
+                )
+                cursor.execute(
+                    "SELECT username FROM users WHERE starts_with(username, %s) ORDER BY user_id",
+                    [seeded["prefix"]],
+                )
+                seeded["usernames"] = [username for username, in cursor.fetchall()]
+            bump_on_commit(TEAMS, PLAYERS, MATCHES)
+            invalidate_on_commit(TEAMS, MATCHES)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stderr.write(f"Seeded {len(seeded['usernames'])} users in {time.perf_counter() - started:.1f}s")
+        return seeded
+
+    def cleanup(self, seeded):
+        # everything else cascades from the users and the teams
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM leaderboard_refresh_queue WHERE match_id = ANY(%s)", [seeded["match_ids"]])
+                cursor.execute("DELETE FROM users WHERE starts_with(username, %s)", [seeded["prefix"]])
+                cursor.execute("DELETE FROM teams WHERE team_id = ANY(%s)", [seeded["team_ids"]])
+            bump_on_commit(TEAMS, PLAYERS, MATCHES)
+            invalidate_on_commit(TEAMS, MATCHES, *map(match_tag, seeded["match_ids"]))
+        self.stderr.write("Removed the synthetic league")
+
+    # ===========================
+    # RUN
+    # ===========================
+    def run(self, options, seeded, password):
+        match_id = seeded["match_ids"][0]
+        rng = random.Random(options["seed"])
+        users = [VirtualUser(options["base_url"], u, options["timeout"]) for u in seeded["usernames"]]
+
+        # Sessions are established before the burst: on matchday most users
+        # are already logged in, and password hashing would swamp the numbers
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            logged_in = [u for u, ok in zip(users, pool.map(lambda u: u.login(password), users)) if ok]
+        self.stderr.write(
+            f"Logged in {len(logged_in)}/{len(users)} users in {time.perf_counter() - started:.1f}s"
+        )
+        if not logged_in:
+            raise CommandError("No user could log in; is the server using the same database?")
+        for user in logged_in:
+            user.samples.clear()
+
+        ramp = options["ramp"]
+        # rising: arrival density grows linearly towards the end of the ramp
+        arrivals = sorted(
+            (ramp * (math.sqrt(rng.random()) if options["arrival"] == "rising" else rng.random()), i)
+            for i in range(len(logged_in))
+        )
+        seeds = [rng.random() for _ in logged_in]
+
+        sampler = LockSampler(options["lock_interval"])
+        deadlocks_before = deadlocks()
+        sampler.start()
+        burst_started = time.perf_counter()
+
+        def session(arrival, i):
+            delay = burst_started + arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.matchday(logged_in[i], match_id, random.Random(seeds[i]), options)
+
+        try:
+            with ThreadPoolExecutor(options["concurrency"]) as pool:
+                for future in [pool.submit(session, arrival, i) for arrival, i in arrivals]:
+                    future.result()
+        finally:
+            wall = time.perf_counter() - burst_started
+            sampler.stop()
+        deadlocks_after = deadlocks()
+
+        by_endpoint = {}
+        for user in logged_in:
+            for sample in user.samples:
+                by_endpoint.setdefault(sample[0], []).append(sample)
+        every = [sample for samples in by_endpoint.values() for sample in samples]
+
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "config": {
+                key: options[key]
+                for key in (
+                    "base_url", "users", "concurrency", "ramp", "arrival", "edits", "think",
+                    "leaderboard_reads", "entry_rate", "squad_size", "seed", "timeout",
+                )
+            },
+            "match_id": match_id,
+            "wall_s": round(wall, 2),
+            "total": summarize(every, wall) if every else None,
+            "endpoints": {name: summarize(samples, wall) for name, samples in sorted(by_endpoint.items())},
+            "lock_waits": sampler.report(),
+            "deadlocks": deadlocks_after - deadlocks_before,
+        }
+
+    def matchday(self, user, match_id, rng, options):
+        """
+        One user's run-up to the deadline: open the team picker, submit a
+        lineup (and edit it), check the saved team, glance at the leaderboards
+        """
+        def think():
+            time.sleep(rng.uniform(0, options["think"]))
+
+        squad = user.call("select GET", "GET", f"/fantasy/select/{match_id}/")
+        if squad is None:
+            return
+
+        for _ in range(1 + options["edits"]):
+            think()
+            lineup = pick_lineup(squad["players"], rng)
+            if lineup is None:
+                return
+            user.call("select POST", "POST", f"/fantasy/select/{match_id}/", lineup)
+
+        think()
+        user.call("team GET", "GET", f"/fantasy/team/{match_id}/")
+
+        for _ in range(options["leaderboard_reads"]):
+            think()
+            if rng.random() < 0.5:
+                user.call("leaderboard overall", "GET", "/leaderboard/api/overall/")
+            else:
+                user.call("leaderboard match", "GET", f"/leaderboard/api/match/{match_id}/")
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- numbers every invalidation-bus message, so listeners can spot gaps
+                CREATE SEQUENCE IF NOT EXISTS invalidation_seq;
+            """,
+            reverse_sql="DROP SEQUENCE IF EXISTS invalidation_seq;",
+        ),
+    ]
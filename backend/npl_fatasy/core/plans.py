@@ -0,0 +1,264 @@
+import difflib
+import json
+from pathlib import Path
+
+from django.db import connection
+
+from core.db import registered_queries
+from core.instrumentation import shape
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+class PlanCollector:
+    """
+    connection.execute_wrapper() that runs EXPLAIN on every statement
+    before executing it, so the plans of real code paths can be checked:
+
+        collector = PlanCollector()
+        with connection.execute_wrapper(collector):
+            collector.label = "fantasy_team_api"
+            fantasy_team_api(request, match_id)
+    """
+
+    def __init__(self):
+        self.label = None
+        self.plans = []
+
+    def __call__(self, execute, sql, params, many, context):
+        keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+        if not many and keyword in EXPLAINABLE:
+            # the raw DB-API cursor, so EXPLAIN doesn't go through this wrapper again
+            raw = context["cursor"].cursor
+            raw.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = raw.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            self.plans.append({"label": self.label, "sql": sql, "plan": plan[0]["Plan"]})
+
+        return execute(sql, params, many, context)
+
+
+def iter_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from iter_nodes(child)
+
+
+def table_sizes(tables):
+    """
+    Estimated row count per table, from the planner statistics
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT relname, reltuples
+            FROM pg_class
+            WHERE relkind IN ('r', 'p')
+              AND relname = ANY(%s)
+        """, [list(tables)])
+        return dict(cursor.fetchall())
+
+
+# Registered statements that read a whole board by design: a full
+# re-rank numbers every overall row
+WHOLE_TABLE_STATEMENTS = {"leaderboard.overall_ranks"}
+
+
+def sequential_scans(plans, min_rows):
+    """
+    [(label, table, rows, sql)] for every Seq Scan on a table with at
+    least min_rows rows, outside WHOLE_TABLE_STATEMENTS
+    """
+    plans = [entry for entry in plans if shape(entry["sql"]) not in WHOLE_TABLE_STATEMENTS]
+    tables = {
+        node["Relation Name"]
+        for entry in plans
+        for node in iter_nodes(entry["plan"])
+        if node["Node Type"] == "Seq Scan"
+    }
+    sizes = table_sizes(tables) if tables else {}
+
+    found = []
+    for entry in plans:
+        for node in iter_nodes(entry["plan"]):
+            if node["Node Type"] != "Seq Scan":
+                continue
+            rows = sizes.get(node["Relation Name"], 0)
+            if rows >= min_rows:
+                found.append((entry["label"], node["Relation Name"], int(rows), entry["sql"]))
+    return found
+
+
+# ===========================
+# HOT PATHS
+# ===========================
+SEEDED_TABLES = (
+    "users", "teams", "players", "matches", "match_players", "player_stats",
+    "fantasy_teams", "fantasy_team_players", "leaderboard",
+)
+# The explained match is one of a season's worth: alone in the tables, its
+# match_id filters select every row and a sequential scan is the right plan
+SEASON_MATCHES = 30
+
+
+def collect_hot_plans(teams):
+    """
+    Plans of every statement the matchday hot paths run (core.hot_paths).
+    Seeds a season of SEASON_MATCHES scored synthetic matches of `teams`
+    fantasy teams each, leaderboards included, and explains the last one;
+    or uses the first match with fantasy teams when teams is 0. Run it
+    inside a transaction that is rolled back afterwards.
+    """
+    from core.db import execute
+    from core.hot_paths import hot_paths
+    from core.synthetic import seed_match
+    from fantasy_teams.scoring import score_match
+    from leaderboard.views import (
+        MATCHDAY_TOTALS,
+        update_all_overall_ranks,
+        update_matchday_ranks,
+        update_overall_leaderboard_for_users,
+    )
+
+    def analyze():
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {', '.join(SEEDED_TABLES)}")
+
+    if teams:
+        match_ids = [seed_match(teams)["match_id"] for _ in range(SEASON_MATCHES)]
+        analyze()
+        user_ids = []
+        for match_id in match_ids:
+            user_ids += score_match(match_id)
+            execute(MATCHDAY_TOTALS, [match_id])
+        update_overall_leaderboard_for_users(user_ids)
+        # ranking boards the planner still takes for empty goes quadratic
+        analyze()
+        for match_id in match_ids:
+            update_matchday_ranks(match_id)
+        update_all_overall_ranks()
+        analyze()
+    else:
+        match_id = None
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT match_id, user_id
+            FROM fantasy_teams
+            WHERE match_id = %s OR %s IS NULL
+            LIMIT 1
+        """, [match_id, match_id])
+        row = cursor.fetchone()
+    if not row:
+        raise ValueError("No fantasy teams to explain against")
+    match_id, user_id = row
+
+    collector = PlanCollector()
+    with connection.execute_wrapper(collector):
+        for label, run in hot_paths(match_id, user_id):
+            collector.label = label
+            run()
+
+    return collector.plans
+
+
+# ===========================
+# SNAPSHOTS
+# ===========================
+# A snapshot keeps, per registered statement (core.db), the shape of its
+# plan (node and join types, tables, indexes; no estimates) and its
+# estimated total cost at a known seed scale. A different shape, or a cost
+# more than COST_FACTOR times the snapshot's, is a regression or a change
+# to snapshot again on purpose.
+SNAPSHOT_PATH = Path(__file__).resolve().parent / "plan_snapshots.json"
+COST_FACTOR = 2.0
+
+
+def plan_shape(plan, depth=0):
+    """
+    The plan tree as indented lines: "Index Scan on players using players_pkey".
+    Index only and single-index bitmap scans read as index scans: which
+    one the planner picks depends on the visibility map and the heap's
+    physical order, not on the statement.
+    """
+    children = plan.get("Plans", [])
+    if plan["Node Type"] == "Index Only Scan":
+        plan = {**plan, "Node Type": "Index Scan"}
+    elif plan["Node Type"] == "Bitmap Heap Scan" and [c["Node Type"] for c in children] == ["Bitmap Index Scan"]:
+        plan = {**plan, "Node Type": "Index Scan", "Index Name": children[0]["Index Name"]}
+        children = []
+
+    detail = plan.get("Join Type") or plan.get("Strategy")
+    line = "  " * depth + plan["Node Type"]
+    if detail:
+        line += f" ({detail})"
+    if "Relation Name" in plan:
+        line += f" on {plan['Relation Name']}"
+    if "Index Name" in plan:
+        line += f" using {plan['Index Name']}"
+
+    lines = [line]
+    for child in children:
+        lines += plan_shape(child, depth + 1)
+    return lines
+
+
+def snapshot(plans):
+    """
+    {statement name: {"label", "cost", "shape"}} for the registered
+    statements among plans; a statement run more than once keeps its
+    first plan. Statements reading no table (bus.notify, which only runs
+    with INVALIDATION_BUS on) have no plan to regress and are left out.
+    """
+    registered = registered_queries()
+    found = {}
+    for entry in plans:
+        name = shape(entry["sql"])
+        if name not in registered or name in found:
+            continue
+        if not any("Relation Name" in node for node in iter_nodes(entry["plan"])):
+            continue
+        found[name] = {
+            "label": entry["label"],
+            "cost": entry["plan"]["Total Cost"],
+            "shape": plan_shape(entry["plan"]),
+        }
+    return found
+
+
+def compare_snapshots(expected, actual, cost_factor=COST_FACTOR):
+    """
+    [(statement name, problem)] for every statement whose plan departs
+    from the snapshot, or that only one side has
+    """
+    problems = []
+    for name, old in expected.items():
+        new = actual.get(name)
+        if new is None:
+            problems.append((name, "no longer runs on the hot paths"))
+        elif new["shape"] != old["shape"]:
+            diff = difflib.unified_diff(old["shape"], new["shape"], "snapshot", "now", lineterm="", n=1)
+            problems.append((name, "plan changed\n" + "\n".join(list(diff)[2:])))
+        elif new["cost"] > old["cost"] * cost_factor:
+            problems.append((name, f"estimated cost {old['cost']:.0f} -> {new['cost']:.0f}"))
+
+    for name in sorted(actual.keys() - expected.keys()):
+        problems.append((name, "not in the snapshot"))
+    return problems
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    {"teams", "plans"}, or None when no snapshot was taken yet
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_snapshot(plans, teams, path=SNAPSHOT_PATH):
+    with open(path, "w") as f:
+        json.dump({"teams": teams, "plans": snapshot(plans)}, f, indent=2, sort_keys=True)
+        f.write("\n")
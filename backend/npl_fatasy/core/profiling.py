@@ -0,0 +1,188 @@
+import cProfile
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from core.instrumentation import shape, view_name
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# REQUEST PROFILER
+# ===========================
+# A superuser profiles one request by adding ?profile=1 or an
+# "X-Profile: 1" header. Three files land in PROFILE_DIR, named by the id
+# returned in the X-Profile-Id response header:
+#
+#   <id>.prof      cProfile stats (python -m pstats, snakeviz, gprof2dot)
+#   <id>.folded    sampled call stacks, one "a;b;c <samples>" line per
+#                  stack (flamegraph.pl, speedscope, inferno)
+#   <id>.sql.json  the request's statements: start offset, duration, name
+#
+# With PROFILING off the middleware removes itself at startup. When it is
+# on, requests without the flag pass straight through, and the session is
+# only looked at for flagged requests. One request is profiled at a time.
+_profiling = threading.Lock()
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILE_DIR", settings.BASE_DIR / "profiles"))
+
+
+def sample_interval():
+    return getattr(settings, "PROFILE_SAMPLE_INTERVAL", 0.001)
+
+
+def profile_requested(request):
+    return request.headers.get("X-Profile") == "1" or request.GET.get("profile") == "1"
+
+
+_labels = {}
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename
+        if path.startswith(str(settings.BASE_DIR)):
+            path = os.path.relpath(path, settings.BASE_DIR)
+        else:
+            path = os.path.join(*Path(path).parts[-2:])
+        label = _labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+    return label
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the call stack of one thread every `interval` seconds and
+    counts identical stacks, root first, joined by ";"
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.stacks = Counter()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class SqlTimeline:
+    """
+    connection.execute_wrapper() noting when each statement started
+    (relative to `started`) and how long it took
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.entries.append({
+                "start_ms": round((start - self.started) * 1000, 3),
+                "ms": round((time.perf_counter() - start) * 1000, 3),
+                "statement": shape(sql),
+                "sql": " ".join(sql.split()),
+            })
+
+
+class ProfilingMiddleware:
+    """
+    Profile a single request on a superuser's request (see above). Must
+    come after AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profile_requested(request) or not request.user.is_superuser:
+            return self.get_response(request)
+
+        # cProfile can't run twice at once; the other request goes unprofiled
+        if not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            _profiling.release()
+
+    def profile(self, request):
+        started = time.perf_counter()
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), sample_interval())
+        timeline = SqlTimeline(started)
+
+        # the sampler only runs when it gets the GIL: hand it over as often as it samples
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, sampler.interval))
+        sampler.start()
+        with connection.execute_wrapper(timeline):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                sampler.stop()
+                sys.setswitchinterval(switch_interval)
+        total = time.perf_counter() - started
+
+        response["X-Profile-Id"] = self.write(request, response, profiler, sampler, timeline, total)
+        return response
+
+    def write(self, request, response, profiler, sampler, timeline, total):
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        label = re.sub(r"\W+", "_", view_name(request) or request.path).strip("_") or "root"
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{label}"
+        base = directory / profile_id
+
+        profiler.dump_stats(f"{base}.prof")
+        with open(f"{base}.folded", "w") as f:
+            for stack, samples in sampler.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
+        with open(f"{base}.sql.json", "w") as f:
+            json.dump({
+                "method": request.method,
+                "path": request.get_full_path(),
+                "view": view_name(request),
+                "status": response.status_code,
+                "ms": round(total * 1000, 2),
+                "db_ms": round(sum(entry["ms"] for entry in timeline.entries), 2),
+                "statements": timeline.entries,
+            }, f, indent=2)
+
+        logger.info("profile %s written to %s", profile_id, directory)
+        return profile_id
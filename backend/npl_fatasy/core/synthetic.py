@@ -0,0 +1,235 @@
+from django.db import connection
+
+from fantasy_teams.scoring import refresh_match_player_points
+
+SQUAD_SIZE = 11
+
+
+def seed_match(teams, seed=0.42):
+    """
+    Insert a synthetic match: two squads of SQUAD_SIZE, every player
+    playing with random stats, `teams` new users and one 7-player fantasy
+    team (captain, vice-captain) per user. Deterministic for a given seed.
+
+    Meant to run inside a transaction that is rolled back afterwards.
+    Returns {"match_id", "team_ids", "prefix"}; every synthetic player id
+    and username starts with prefix.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT setseed(%s)", [seed])
+        cursor.execute("SELECT COALESCE(MAX(team_id), 0) FROM teams")
+        base_team = cursor.fetchone()[0]
+        team_ids = [base_team + 1, base_team + 2]
+        for team_id in team_ids:
+            cursor.execute(
+                "INSERT INTO teams (team_id, team_name, acronym) VALUES (%s, %s, %s)",
+                [team_id, f"Synthetic {team_id}", f"S{team_id}"],
+            )
+
+        cursor.execute("""
+            INSERT INTO matches (match_date, team_1, team_2)
+            VALUES (CURRENT_DATE, %s, %s)
+            RETURNING match_id
+        """, team_ids)
+        match_id = cursor.fetchone()[0]
+        prefix = f"SYN{match_id}_"
+
+        cursor.execute("""
+            INSERT INTO players (player_id, player_name, role, cost, team_id)
+            SELECT
+                %s || g,
+                'Synthetic Player ' || g,
+                (ARRAY['Batsman', 'Bowler', 'All-Rounder', 'Wicket-Keeper'])[g %% 4 + 1],
+                5 + g %% 6,
+                CASE WHEN g < %s THEN %s ELSE %s END
+            FROM generate_series(0, %s - 1) g
+        """, [prefix, SQUAD_SIZE, team_ids[0], team_ids[1], SQUAD_SIZE * 2])
+
+        cursor.execute("""
+            INSERT INTO match_players (mp_id, match_id, player_id, is_playing)
+            SELECT %s || '_' || player_id, %s, player_id, TRUE
+            FROM players
+            WHERE team_id IN (%s, %s)
+        """, [match_id, match_id, team_ids[0], team_ids[1]])
+
+        cursor.execute("""
+            INSERT INTO player_stats
+            (stat_id, mp_id, run_rate, econ, wickets, sixes, fours, catches, runs)
+            SELECT
+                mp_id || '_STAT',
+                mp_id,
+                ROUND((random() * 200)::numeric, 2),
+                ROUND((random() * 12)::numeric, 2),
+                floor(random() * 4),
+                floor(random() * 5),
+                floor(random() * 8),
+                floor(random() * 3),
+                floor(random() * 90)
+            FROM match_players
+            WHERE match_id = %s
+        """, [match_id])
+        refresh_match_player_points(match_id)
+
+        cursor.execute("""
+            INSERT INTO users (username, password)
+            SELECT %s || g, '!'
+            FROM generate_series(1, %s) g
+        """, [prefix, teams])
+
+        cursor.execute("""
+            INSERT INTO fantasy_teams (fantasy_team_id, user_id, match_id, total_points)
+            SELECT user_id || '_' || %s, user_id, %s, 0
+            FROM users
+            WHERE starts_with(username, %s)
+        """, [match_id, match_id, prefix])
+
+        # 7 distinct players per team, captain first, vice-captain second
+        cursor.execute("""
+            INSERT INTO fantasy_team_players
+            (fantasy_team_id, match_id, player_id, is_captain, is_vice_captain)
+            SELECT
+                ft.fantasy_team_id,
+                %s,
+                %s || ((ft.n + k) %% %s),
+                k = 0,
+                k = 1
+            FROM (
+                SELECT fantasy_team_id, ROW_NUMBER() OVER () AS n
+                FROM fantasy_teams
+                WHERE match_id = %s
+            ) ft
+            CROSS JOIN generate_series(0, 6) k
+        """, [match_id, prefix, SQUAD_SIZE * 2, match_id])
+
+    return {"match_id": match_id, "team_ids": team_ids, "prefix": prefix}
+
+
+def seed_league(users, matches, squad_size=15, playing=SQUAD_SIZE, entry_rate=1.0, seed=0.42):
+    """
+    Insert a synthetic league: `matches` matches between 2 * matches new
+    teams of squad_size players, a playing XI of `playing` players per
+    team with random stats, `users` new users, and a 7-player fantasy team
+    per user and match for a random entry_rate share of the users. Match
+    dates are spread around today, so both completed and upcoming matches
+    exist. Deterministic for a given seed.
+
+    Fantasy teams are not scored; run calculate_match_results for that.
+    Meant to run inside a transaction that is rolled back afterwards.
+    Returns {"match_ids", "team_ids", "prefix"}; every synthetic player id
+    and username starts with prefix.
+    """
+    if playing * 2 < 7 or playing > squad_size:
+        raise ValueError("playing must be between 4 and squad_size")
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT setseed(%s)", [seed])
+        cursor.execute("SELECT COALESCE(MAX(team_id), 0) FROM teams")
+        base_team = cursor.fetchone()[0]
+        team_ids = list(range(base_team + 1, base_team + 2 * matches + 1))
+
+        cursor.execute("""
+            INSERT INTO teams (team_id, team_name, acronym)
+            SELECT t, 'Synthetic ' || t, 'S' || t
+            FROM unnest(%s::int[]) t
+        """, [team_ids])
+
+        cursor.execute("""
+            INSERT INTO matches (match_date, team_1, team_2)
+            SELECT CURRENT_DATE + (g - %s), %s + 2 * g - 1, %s + 2 * g
+            FROM generate_series(1, %s) g
+            RETURNING match_id, team_1
+        """, [matches // 2, base_team, base_team, matches])
+        match_ids = [match_id for match_id, _ in sorted(cursor.fetchall(), key=lambda row: row[1])]
+        prefix = f"SYN{match_ids[0]}_"
+
+        # player ids are "<prefix><team_id>_<n>"; the first `playing` of each squad play
+        cursor.execute("""
+            INSERT INTO players (player_id, player_name, role, cost, team_id)
+            SELECT
+                %s || t || '_' || g,
+                'Synthetic Player ' || t || '-' || g,
+                (ARRAY['Batsman', 'Bowler', 'All-Rounder', 'Wicket-Keeper'])[g %% 4 + 1],
+                5 + g %% 6,
+                t
+            FROM unnest(%s::int[]) t
+            CROSS JOIN generate_series(0, %s - 1) g
+        """, [prefix, team_ids, squad_size])
+
+        cursor.execute("""
+            INSERT INTO match_players (mp_id, match_id, player_id, is_playing)
+            SELECT
+                m.match_id || '_' || p.player_id,
+                m.match_id,
+                p.player_id,
+                split_part(substr(p.player_id, length(%s) + 1), '_', 2)::int < %s
+            FROM matches m
+            JOIN players p ON p.team_id IN (m.team_1, m.team_2)
+            WHERE m.match_id = ANY(%s)
+        """, [prefix, playing, match_ids])
+
+        cursor.execute("""
+            INSERT INTO player_stats
+            (stat_id, mp_id, run_rate, econ, wickets, sixes, fours, catches, runs)
+            SELECT
+                mp_id || '_STAT',
+                mp_id,
+                ROUND((random() * 200)::numeric, 2),
+                ROUND((random() * 12)::numeric, 2),
+                floor(random() * 4),
+                floor(random() * 5),
+                floor(random() * 8),
+                floor(random() * 3),
+                floor(random() * 90)
+            FROM match_players
+            WHERE match_id = ANY(%s)
+              AND is_playing = TRUE
+        """, [match_ids])
+        for match_id in match_ids:
+            refresh_match_player_points(match_id)
+
+        cursor.execute("""
+            INSERT INTO users (username, password)
+            SELECT %s || g, '!'
+            FROM generate_series(1, %s) g
+        """, [prefix, users])
+
+        cursor.execute("""
+            INSERT INTO fantasy_teams (fantasy_team_id, user_id, match_id, total_points)
+            SELECT u.user_id || '_' || m.match_id, u.user_id, m.match_id, 0
+            FROM users u
+            CROSS JOIN unnest(%s::int[]) m(match_id)
+            WHERE starts_with(u.username, %s)
+              AND random() < %s
+        """, [match_ids, prefix, entry_rate])
+
+        # 7 distinct playing players per team, captain first, vice-captain second
+        cursor.execute("""
+            WITH squad AS (
+                SELECT
+                    match_id,
+                    player_id,
+                    ROW_NUMBER() OVER (PARTITION BY match_id ORDER BY player_id) - 1 AS i,
+                    COUNT(*) OVER (PARTITION BY match_id) AS size
+                FROM match_players
+                WHERE match_id = ANY(%s)
+                  AND is_playing = TRUE
+            ),
+            ft AS (
+                SELECT
+                    fantasy_team_id,
+                    match_id,
+                    ROW_NUMBER() OVER (PARTITION BY match_id ORDER BY fantasy_team_id) AS n
+                FROM fantasy_teams
+                WHERE match_id = ANY(%s)
+            )
+            INSERT INTO fantasy_team_players
+            (fantasy_team_id, match_id, player_id, is_captain, is_vice_captain)
+            SELECT ft.fantasy_team_id, ft.match_id, s.player_id, k = 0, k = 1
+            FROM ft
+            CROSS JOIN generate_series(0, 6) k
+            JOIN squad s
+                ON s.match_id = ft.match_id
+               AND s.i = (ft.n + k) %% s.size
+        """, [match_ids, match_ids])
+
+    return {"match_ids": match_ids, "team_ids": team_ids, "prefix": prefix}
@@ -0,0 +1,503 @@
+import json
+import random
+import re
+import tempfile
+from datetime import date
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings, tag
+from django.urls import URLResolver, get_resolver
+
+from core.bus import Listener, flush_local_caches
+from core.cache import invalidate, read_through, team_tag
+from core.db import as_columns, as_dicts, fetch_all, query, registered_queries
+from core.instrumentation import QueryRecorder, query_budget, record_queries, shape
+from core.management.commands.load_matchday import pick_lineup
+from core.plans import collect_hot_plans, compare_snapshots, load_snapshot, sequential_scans, snapshot
+from core.profiling import ProfilingMiddleware
+from core.synthetic import seed_league
+from fantasy_teams.views import match_squad
+from jobs.queue import enqueue, run_next_job
+from player_stats.stats import STAT_FIELDS
+from player_stats.views import PLAYING_STATS
+
+LOCMEM = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "versions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-versions"},
+    "reference": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-reference"},
+}
+
+
+@override_settings(CACHES=LOCMEM, INVALIDATION_BUS=False)
+class ReadThroughCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def load(self):
+        self.calls += 1
+        return [{"calls": self.calls}]
+
+    def test_hit_skips_compute(self):
+        first = read_through("squad:1", [team_tag(1)], self.load)
+        second = read_through("squad:1", [team_tag(1)], self.load)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidating_a_tag_recomputes(self):
+        read_through("squad:2", [team_tag(2)], self.load)
+        invalidate(team_tag(2))
+
+        self.assertEqual(read_through("squad:2", [team_tag(2)], self.load), [{"calls": 2}])
+
+    def test_other_tags_stay_cached(self):
+        read_through("squad:3", [team_tag(3)], self.load)
+        invalidate(team_tag(4))
+        read_through("squad:3", [team_tag(3)], self.load)
+
+        self.assertEqual(self.calls, 1)
+
+    def test_ttl(self):
+        read_through("squad:5", [team_tag(5)], self.load, ttl=0)
+        read_through("squad:5", [team_tag(5)], self.load, ttl=0)
+
+        self.assertEqual(self.calls, 2)
+
+
+class QueryRegistryTests(SimpleTestCase):
+    def test_name_is_tagged_on_the_sql(self):
+        q = query("tests.tagged", "SELECT 1")
+
+        self.assertTrue(q.sql.endswith("/* tests.tagged */"))
+        self.assertIs(registered_queries()["tests.tagged"], q)
+
+    def test_conflicting_registration(self):
+        query("tests.conflict", "SELECT 1")
+        query("tests.conflict", "SELECT 1")
+
+        with self.assertRaises(ValueError):
+            query("tests.conflict", "SELECT 2")
+
+    def test_row_factories(self):
+        columns, rows = ["a", "b"], [(1, 2), (3, 4)]
+
+        self.assertEqual(as_dicts(columns, rows), [{"a": 1, "b": 2}, {"a": 3, "b": 4}])
+        self.assertEqual(as_columns(columns, rows), {"a": [1, 3], "b": [2, 4]})
+        self.assertEqual(as_columns(columns, []), {"a": [], "b": []})
+
+
+class StatementShapeTests(SimpleTestCase):
+    def test_registered_queries_use_their_name(self):
+        self.assertEqual(shape(query("tests.shape", "SELECT %s").sql), "tests.shape")
+
+    def test_literals_and_in_lists_collapse(self):
+        self.assertEqual(
+            shape("SELECT *\n FROM t WHERE a IN (1, 2, 3) AND b = 'x''y'"),
+            shape("SELECT * FROM t WHERE a IN (4, 5) AND b = 'z'"),
+        )
+
+    def test_repeated_shapes(self):
+        recorder = QueryRecorder()
+        recorder.statements = [("SELECT 1", 0.1)] * 5 + [("SELECT * FROM t", 0.2)]
+
+        self.assertEqual(recorder.repeated(threshold=5), {"SELECT ?": 5})
+        self.assertEqual(recorder.slowest(1), [("SELECT * FROM t", 0.2)])
+
+
+@override_settings(CACHES=LOCMEM, INVALIDATION_BUS=False)
+class BudgetFlagTests(TestCase):
+    """
+    The middleware looks budgets up by resolved URL name: a view running
+    more statements than its QUERY_BUDGETS entry is logged at WARNING
+    """
+    URL = "/leaderboard/api/overall/"
+
+    def request(self):
+        with self.assertLogs("core.instrumentation", "INFO") as logs:
+            self.client.get(self.URL)
+        [record] = logs.records
+        return record.levelname, record.sql
+
+    def test_within_budget(self):
+        level, record = self.request()
+
+        self.assertEqual(level, "INFO")
+        self.assertEqual(record["view"], "leaderboard:overall_leaderboard")
+        self.assertEqual(record["budget"], settings.QUERY_BUDGETS["leaderboard:overall_leaderboard"])
+        self.assertFalse(record["over_budget"])
+
+    def test_over_budget_is_flagged(self):
+        with override_settings(QUERY_BUDGETS={**settings.QUERY_BUDGETS, "leaderboard:overall_leaderboard": 0}):
+            level, record = self.request()
+
+        self.assertEqual(level, "WARNING")
+        self.assertGreater(record["queries"], 0)
+        self.assertTrue(record["over_budget"])
+
+
+@override_settings(CACHES=LOCMEM, INVALIDATION_BUS=False)
+class InternalsAccessTests(TestCase):
+    """Process internals are for superusers only"""
+    URLS = ("/admin_panel/jobs/1/", "/admin_panel/cache/bus/", "/admin_panel/db/queries/")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("internals_admin", password="secret")
+        cls.staff = User.objects.create_user("internals_staff", password="secret", is_staff=True)
+
+    def test_others_are_refused(self):
+        session = self.client.session
+        session["user_id"], session["username"] = 1, "player"
+        session.save()
+
+        for user in (None, self.staff):
+            if user:
+                self.client.force_login(user)
+            for url in self.URLS:
+                for method in ("get", "delete"):
+                    with self.subTest(user=user, url=url, method=method):
+                        self.assertEqual(getattr(self.client, method)(url).status_code, 403)
+
+    def test_superuser(self):
+        self.client.force_login(self.admin)
+
+        self.assertEqual(self.client.get("/admin_panel/jobs/1/").status_code, 404)
+        self.assertEqual(self.client.get("/admin_panel/cache/bus/").json(), {"enabled": False})
+        self.assertIn("queries", self.client.get("/admin_panel/db/queries/").json())
+
+    def test_reset_needs_a_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.admin)
+
+        self.assertEqual(client.delete("/admin_panel/db/queries/").status_code, 403)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.delete("/admin_panel/db/queries/").status_code, 200)
+
+
+# ===========================
+# INVALIDATION BUS
+# ===========================
+@override_settings(CACHES=LOCMEM, INVALIDATION_BUS_GAP_WINDOW=60)
+class SequenceGapTests(SimpleTestCase):
+    def setUp(self):
+        self.listener = Listener()
+        patcher = mock.patch("core.bus.flush_local_caches")
+        self.flush = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def receive(self, *seqs):
+        for seq in seqs:
+            self.listener.handle(f'{seq} {{"tags": [], "versions": []}}')
+
+    def test_out_of_order_commit_does_not_flush(self):
+        self.receive(1, 3, 4, 2)
+        self.listener.expire_gaps()
+
+        self.flush.assert_not_called()
+        self.assertEqual(self.listener.metrics()["late"], 1)
+        self.assertEqual(self.listener.metrics()["missed"], 0)
+
+    def test_hole_open_past_the_window_flushes_once(self):
+        self.receive(1, 3, 6)
+        self.listener.expire_gaps()
+        self.flush.assert_not_called()
+
+        with override_settings(INVALIDATION_BUS_GAP_WINDOW=0):
+            self.listener.expire_gaps()
+            self.listener.expire_gaps()
+
+        self.flush.assert_called_once()
+        self.assertEqual(self.listener.metrics()["expired"], 3)
+
+    def test_long_skip_flushes_at_once(self):
+        self.receive(1, 50_000)
+
+        self.flush.assert_called_once()
+        self.assertEqual(self.listener.metrics()["missed"], 0)
+
+
+# ===========================
+# QUERY BUDGETS
+# ===========================
+# Streams never finish their response; Django's own admin site isn't ours.
+# The legacy match players page renders a template that reverses the long
+# gone 'match_list' URL; its queries are the admin panel API's.
+SKIPPED_URLS = {
+    "leaderboard:overall_leaderboard_stream",
+    "leaderboard:matchday_leaderboard_stream",
+    "manage_match_players",
+}
+_CONVERTER = re.compile(r"<(?:\w+:)?(\w+)>")
+
+
+def routed_urls(patterns=None, prefix="", namespaces=()):
+    """
+    (path template, view name) for every URL in npl_fatasy.urls outside the
+    admin site, e.g. ("fantasy/select/<int:match_id>/", "fantasy_select")
+    """
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace != "admin":
+                yield from routed_urls(
+                    pattern.url_patterns,
+                    prefix + str(pattern.pattern),
+                    namespaces + ((pattern.namespace,) if pattern.namespace else ()),
+                )
+        else:
+            yield prefix + str(pattern.pattern), ":".join([*namespaces, pattern.name or pattern.lookup_str])
+
+
+def budget_requests(ctx):
+    """
+    {view name: [(method, body)]} for the URLs that need more than a GET.
+    Several bodies grow with the data (playing XI, stats sheet); the
+    statement count must not.
+    """
+    team = {"team_name": "Budget Team", "acronym": "BGT"}
+    player = {"player_name": "Budget Player", "role": "Batsman", "cost": 5, "team_id": ctx["team_id"]}
+    match = {"match_date": str(date.today()), "team_1": ctx["team_id"], "team_2": ctx["other_team_id"]}
+    batter, bowler = ctx["picked"]
+    deliveries = "\n".join(
+        json.dumps({"batter": batter, "bowler": bowler, "runs": runs}) for runs in (0, 1, 4, 2, 6)
+    )
+    return {
+        "register": [("post", {"username": "budget_new_user", "password": "secret"})],
+        "login": [("post", {"username": ctx["username"], "password": "wrong"})],
+        "fantasy_select": [("get", None), ("post", ctx["lineup"])],
+        "admin_panel:admin_login_api": [("post", {"username": "budget_admin", "password": "secret"})],
+        "admin_panel:add_team_api": [("post", team)],
+        "admin_panel:edit_team_api": [("put", team)],
+        "admin_panel:delete_team_api": [("delete", None)],
+        "admin_panel:add_player_api": [("post", {"player_id": "BUDGET_1", **player})],
+        "admin_panel:edit_player": [("put", player)],
+        "admin_panel:delete_player": [("delete", None)],
+        "admin_panel:add_match_api": [("post", match)],
+        "admin_panel:edit_match_api": [("put", match)],
+        "admin_panel:delete_match_api": [("delete", None)],
+        "admin_panel:update_match_players_api": [("post", {"playing_ids": ctx["playing_ids"]})],
+        "admin_panel:manage_player_stats_api": [("get", None), ("post", {"players": ctx["stats"]})],
+        "admin_panel:ingest_ball_events_api": [("post", deliveries)],
+        "admin_panel:calculate_match_results_api": [("post", None)],
+        "admin_panel:query_stats_api": [("get", None), ("delete", None)],
+    }
+
+
+@override_settings(CACHES=LOCMEM, INVALIDATION_BUS=False)
+class QueryBudgetTests(TestCase):
+    """
+    Every URL, cold caches: each request stays within its query budget on
+    a small seeded league, and (slow) runs exactly as many statements on a
+    large one, so a per-row query loop fails here.
+    """
+    SMALL = {"users": 10, "squad_size": 11}
+    LARGE = {"users": 10_000, "squad_size": 25}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("budget_admin", password="secret")
+        cls.small = cls.league(**cls.SMALL)
+
+    def test_budgets_name_real_urls(self):
+        names = {name for _, name in routed_urls()}
+
+        self.assertEqual(set(settings.QUERY_BUDGETS) - names, set())
+
+    def test_within_budget(self):
+        for request, (count, budget) in self.statement_counts(self.small).items():
+            with self.subTest(request=request):
+                self.assertLessEqual(count, budget)
+
+    @tag("slow")
+    def test_statement_counts_do_not_grow_with_data(self):
+        small = self.statement_counts(self.small)
+        large = self.statement_counts(self.league(**self.LARGE))
+
+        self.assertEqual(small.keys(), large.keys())
+        for request, (count, budget) in large.items():
+            with self.subTest(request=request):
+                self.assertLessEqual(small[request][0], budget)
+                self.assertLessEqual(count, budget)
+                self.assertEqual(count, small[request][0], "statement count grows with the data")
+
+    @classmethod
+    def league(cls, users, squad_size):
+        """
+        Seed and score a league; returns the values the URLs and bodies need
+        """
+        seeded = seed_league(users, 2, squad_size=squad_size, entry_rate=1.0)
+        match_id = seeded["match_ids"][0]
+
+        job_id = enqueue(
+            "calculate_match_results", {"match_id": match_id},
+            dedupe_key=f"calculate_match_results:{match_id}",
+        )
+        while (job := run_next_job()) and job.job_id != job_id:
+            pass
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT team_1, team_2 FROM matches WHERE match_id = %s", [match_id])
+            team_id, other_team_id = cursor.fetchone()
+            cursor.execute("""
+                SELECT user_id, username FROM users
+                WHERE starts_with(username, %s)
+                ORDER BY user_id
+                LIMIT 1
+            """, [seeded["prefix"]])
+            user_id, username = cursor.fetchone()
+            cursor.execute(
+                "SELECT player_id FROM match_players WHERE match_id = %s AND is_playing ORDER BY player_id",
+                [match_id],
+            )
+            playing = [player_id for player_id, in cursor.fetchall()]
+            # deliveries for the two most picked players move enough teams
+            # to take the same re-rank path (a full one) at both scales
+            cursor.execute("""
+                SELECT mp.mp_id
+                FROM fantasy_team_players ftp
+                JOIN match_players mp
+                    ON mp.match_id = ftp.match_id
+                   AND mp.player_id = ftp.player_id
+                WHERE ftp.match_id = %s AND mp.is_playing
+                GROUP BY mp.mp_id
+                ORDER BY COUNT(*) DESC, mp.mp_id
+                LIMIT 2
+            """, [match_id])
+            picked = [mp_id for mp_id, in cursor.fetchall()]
+
+        stats = fetch_all(PLAYING_STATS, [match_id])
+        return {
+            "match_id": match_id,
+            "team_id": team_id,
+            "other_team_id": other_team_id,
+            "acronym": f"S{team_id}",
+            "player_id": f"{seeded['prefix']}{team_id}_0",
+            "job_id": job_id,
+            "user_id": user_id,
+            "username": username,
+            "lineup": pick_lineup(match_squad(match_id), random.Random(0)),
+            # one player dropped, so rows actually flip
+            "playing_ids": playing[1:],
+            "picked": picked,
+            "stats": [{field: row[field] for field in ("mp_id", *STAT_FIELDS)} for row in stats],
+        }
+
+    def statement_counts(self, ctx):
+        """
+        {"METHOD view name": (statements, budget)}
+        """
+        requests = budget_requests(ctx)
+        counts = {}
+        for template, name in routed_urls():
+            if name in SKIPPED_URLS:
+                continue
+            path = "/" + _CONVERTER.sub(lambda m: str(ctx[m.group(1)]), template)
+            for method, body in requests.get(name, [("get", None)]):
+                counts[f"{method.upper()} {name}"] = (self.count(ctx, method, path, body), query_budget(name))
+        return counts
+
+    def count(self, ctx, method, path, body):
+        # a fresh admin + fantasy session each time: login/logout rotate it
+        self.client.force_login(self.admin)
+        session = self.client.session
+        session["user_id"], session["username"] = ctx["user_id"], ctx["username"]
+        session.save()
+        flush_local_caches()
+
+        kwargs = {}
+        if isinstance(body, str):
+            kwargs = {"data": body, "content_type": "application/x-ndjson"}
+        elif body is not None:
+            kwargs = {"data": json.dumps(body, cls=DjangoJSONEncoder), "content_type": "application/json"}
+
+        # every request sees the same data: writes are rolled back
+        with transaction.atomic():
+            with record_queries() as recorder:
+                getattr(self.client, method)(path, **kwargs)
+            transaction.set_rollback(True)
+        return recorder.count
+
+
+# ===========================
+# QUERY PLANS
+# ===========================
+class PlanComparisonTests(SimpleTestCase):
+    OLD = {"q": {"label": "x", "cost": 100.0, "shape": ["Index Scan on players using players_pkey"]}}
+
+    def test_shape_change(self):
+        new = {"q": {**self.OLD["q"], "shape": ["Seq Scan on players"]}}
+
+        [(name, problem)] = compare_snapshots(self.OLD, new)
+        self.assertEqual(name, "q")
+        self.assertIn("+Seq Scan on players", problem)
+
+    def test_cost_tolerance(self):
+        within = {"q": {**self.OLD["q"], "cost": 150.0}}
+        blown = {"q": {**self.OLD["q"], "cost": 250.0}}
+
+        self.assertEqual(compare_snapshots(self.OLD, within), [])
+        self.assertEqual(len(compare_snapshots(self.OLD, blown)), 1)
+
+
+@override_settings(CACHES=LOCMEM, INVALIDATION_BUS=False)
+class QueryPlanSnapshotTests(TestCase):
+    """
+    The registered statements of the matchday hot paths, EXPLAINed at the
+    committed snapshot's scale: no sequential scan of a large table, and
+    every plan keeps its shape and (within COST_FACTOR) its cost.
+    Refresh the snapshot with manage.py check_query_plans --update-snapshot
+    on a freshly migrated database, as this test's is: plans also depend on
+    dead rows and visibility left behind by earlier runs.
+    """
+    MIN_ROWS = 1000
+
+    def test_plans_match_snapshot(self):
+        expected = load_snapshot()
+        self.assertIsNotNone(expected, "no plan snapshot; run manage.py check_query_plans --update-snapshot")
+
+        plans = collect_hot_plans(expected["teams"])
+
+        self.assertEqual(sequential_scans(plans, self.MIN_ROWS), [])
+        problems = compare_snapshots(expected["plans"], snapshot(plans))
+        self.assertFalse(problems, "\n".join(f"{name}: {problem}" for name, problem in problems))
+
+
+# ===========================
+# PROFILING
+# ===========================
+class ProfilingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = Path(directory.name)
+
+    def get(self, superuser, **headers):
+        request = RequestFactory().get("/slow/", **headers)
+        request.user = SimpleNamespace(is_superuser=superuser)
+        with override_settings(PROFILING=True, PROFILE_DIR=self.dir):
+            return ProfilingMiddleware(lambda request: HttpResponse("ok"))(request)
+
+    def test_off_removes_itself(self):
+        with override_settings(PROFILING=False), self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: HttpResponse("ok"))
+
+    def test_superuser_flag_writes_profile(self):
+        response = self.get(True, HTTP_X_PROFILE="1")
+
+        profile_id = response["X-Profile-Id"]
+        self.assertEqual(
+            sorted(path.name for path in self.dir.iterdir()),
+            [f"{profile_id}.folded", f"{profile_id}.prof", f"{profile_id}.sql.json"],
+        )
+
+    def test_ignored_for_other_sessions_and_unflagged_requests(self):
+        self.assertNotIn("X-Profile-Id", self.get(False, HTTP_X_PROFILE="1"))
+        self.assertNotIn("X-Profile-Id", self.get(True))
+        self.assertEqual(list(self.dir.iterdir()), [])
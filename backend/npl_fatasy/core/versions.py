@@ -0,0 +1,153 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from core import bus
+
+# ===========================
+# VERSION COUNTERS
+# ===========================
+# One counter per entity ("leaderboard:overall", "leaderboard:match:12", ...)
+# in the "versions" cache. Writers bump a counter after their transaction
+# commits; readers compare counters to notice changes without querying the
+# database. A missing counter starts from the current time in microseconds,
+# so counters keep growing across cache restarts. Bumps are also announced
+# on the invalidation bus (core.bus), which keeps process-local counters
+# in step.
+VERSIONS_CACHE = "versions"
+
+# Entities bumped by admin writes
+TEAMS = "teams"
+PLAYERS = "players"
+MATCHES = "matches"
+
+
+def _cache():
+    return caches[VERSIONS_CACHE]
+
+
+def _key(entity):
+    return f"version:{entity}"
+
+
+def _seed():
+    return time.time_ns() // 1000
+
+
+def get_versions(entities):
+    """
+    {entity: version} for every entity, creating missing counters
+    """
+    cache = _cache()
+    keys = {_key(entity): entity for entity in entities}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        cache.add(key, _seed(), timeout=None)
+        found[key] = cache.get(key)
+    return {entity: found[key] for key, entity in keys.items()}
+
+
+def get_version(entity):
+    return get_versions([entity])[entity]
+
+
+async def aget_version(entity):
+    cache = _cache()
+    key = _key(entity)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _seed(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump(*entities):
+    cache = _cache()
+    for entity in entities:
+        key = _key(entity)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # no counter yet: any fresh seed is newer than what readers saw
+            cache.add(key, _seed(), timeout=None)
+
+
+def bump_on_commit(*entities):
+    """
+    Bump once the current transaction commits (immediately outside one),
+    here and, through the bus, in every other process
+    """
+    transaction.on_commit(lambda: bump(*entities))
+    bus.publish(versions=entities)
+
+
+def versions_in_shared_cache():
+    return not isinstance(_cache(), LocMemCache)
+
+
+def versions_reliable():
+    """
+    True when this process sees every committed bump: the counters live in
+    a shared cache, or the invalidation bus is keeping the local ones in step
+    """
+    return versions_in_shared_cache() or (bus.bus_enabled() and bus.local_caches_usable())
+
+
+def clear_local():
+    """
+    Forget process-local counters. They restart from fresh seeds, newer
+    than anything handed out before, so no stale tag can match again.
+    """
+    if not versions_in_shared_cache():
+        _cache().clear()
+
+
+# ===========================
+# ETAGS
+# ===========================
+def etag(*entities, vary=None):
+    """
+    Give a GET view a strong ETag built from the version counters of the
+    entities it reads, and answer a matching If-None-Match with 304
+    before the view (and its queries) runs.
+
+    entities are names, or callables taking the view's URL kwargs and
+    returning one. The full path (query string included) and vary(request),
+    if given, are part of the tag. Only active while versions are reliable
+    (see versions_reliable).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or not versions_reliable():
+                return view(request, *args, **kwargs)
+
+            names = [entity(**kwargs) if callable(entity) else entity for entity in entities]
+            versions = get_versions(names)
+            parts = [request.get_full_path(), *(f"{name}={versions[name]}" for name in names)]
+            if vary is not None:
+                parts.append(str(vary(request)))
+            tag = '"%s"' % hashlib.sha256("\n".join(parts).encode()).hexdigest()[:32]
+
+            client_tags = parse_etags(request.headers.get("If-None-Match", ""))
+            if tag in client_tags or "*" in client_tags:
+                response = HttpResponseNotModified()
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            response["ETag"] = tag
+            # always revalidate: the tag is cheap to check, the data may change
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        return wrapped
+    return decorator
@@ -0,0 +1,27 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from users.auth import superuser_required
+
+from . import bus, db
+
+
+@superuser_required
+@require_http_methods(["GET"])
+def invalidation_bus_api(request):
+    """
+    Invalidation bus metrics of the process serving this request
+    """
+    return JsonResponse(bus.metrics())
+
+
+@superuser_required
+@require_http_methods(["GET", "DELETE"])
+def query_stats_api(request):
+    """
+    Per-query call counts and timings of the process serving this request.
+    DELETE resets them.
+    """
+    if request.method == "DELETE":
+        db.reset_query_stats()
+    return JsonResponse({"queries": db.query_stats()})
@@ -0,0 +1,55 @@
+from django.db import transaction
+
+from core.db import fetch_value, query
+from jobs.queue import register
+from leaderboard.refresh import refresh_match_leaderboards
+from .scoring import refresh_match_player_points, score_fantasy_teams
+
+CHUNK_SIZE = 2000
+
+COUNT_TEAMS = query("jobs.count_match_teams", """
+    SELECT COUNT(*) FROM fantasy_teams WHERE match_id = %s
+""")
+
+
+@register("calculate_match_results")
+def calculate_match_results(job):
+    """
+    Score every fantasy team of a match in chunks, then refresh its
+    leaderboards. Each chunk commits together with its checkpoint.
+    Re-running any stage gives the same result.
+    """
+    match_id = job.params["match_id"]
+    checkpoint = job.checkpoint or {"stage": "score", "after": ""}
+
+    if checkpoint["stage"] == "score":
+        if "teams_total" not in job.progress:
+            # stats written outside the admin paths still get scored
+            refresh_match_player_points(match_id)
+            job.save_checkpoint(
+                checkpoint,
+                teams_total=fetch_value(COUNT_TEAMS, [match_id]),
+                teams_processed=0,
+                ranks_updated=0,
+            )
+
+        while True:
+            with transaction.atomic():
+                rows = score_fantasy_teams(match_id, after=checkpoint["after"], limit=CHUNK_SIZE)
+                if not rows:
+                    checkpoint = {"stage": "leaderboards"}
+                    job.save_checkpoint(checkpoint)
+                    break
+
+                # the last id in the collation's order: under en_US "1_5" sorts before "15_5",
+                # though Python's max() of the two is "1_5"
+                checkpoint = {"stage": "score", "after": rows[-1][0]}
+                job.save_checkpoint(
+                    checkpoint,
+                    teams_processed=job.progress.get("teams_processed", 0) + len(rows),
+                )
+
+    if checkpoint["stage"] == "leaderboards":
+        with transaction.atomic():
+            ranks_updated = refresh_match_leaderboards(match_id)
+            job.save_checkpoint({"stage": "done"}, ranks_updated=ranks_updated)
@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from core.db import as_tuples, fetch_all, query
+from leaderboard.views import apply_matchday_totals, apply_overall_point_deltas
+from .scoring import multiplied_points_sql
+
+
+# Each team is re-totalled by an indexed lookup of its own players. A join
+# of all affected teams against all their totals went quadratic whenever
+# the planner misjudged the row counts (freshly loaded, unanalyzed tables).
+RESCORE_TEAMS = query("live.rescore_teams", f"""
+    WITH affected AS (
+        SELECT DISTINCT fantasy_team_id
+        FROM fantasy_team_players
+        WHERE match_id = %s
+          AND player_id = ANY(%s)
+    ),
+    old AS (
+        SELECT ft.fantasy_team_id, ft.total_points
+        FROM fantasy_teams ft
+        JOIN affected a ON a.fantasy_team_id = ft.fantasy_team_id
+        FOR UPDATE OF ft
+    ),
+    team_points AS MATERIALIZED (
+        SELECT
+            o.fantasy_team_id,
+            o.total_points AS old_points,
+            COALESCE((
+                SELECT ROUND(SUM({multiplied_points_sql("mpp.base_points")})::numeric, 2)
+                FROM fantasy_team_players ftp
+                JOIN match_player_points mpp
+                    ON mpp.match_id = %s
+                   AND mpp.player_id = ftp.player_id
+                WHERE ftp.fantasy_team_id = o.fantasy_team_id
+            ), 0) AS points
+        FROM old o
+    )
+    UPDATE fantasy_teams ft
+    SET total_points = tp.points
+    FROM team_points tp
+    WHERE ft.fantasy_team_id = tp.fantasy_team_id
+      AND ft.total_points IS DISTINCT FROM tp.points
+    RETURNING ft.user_id, ft.total_points, ft.total_points - tp.old_points
+""")
+
+
+def rescore_players(match_id, deltas):
+    """
+    Re-score only the fantasy teams of a match that picked a player whose
+    points changed, and move their leaderboard entries with them.
+
+    deltas: {player_id: points change}, as returned by
+    refresh_match_player_points. Affected teams are found through the
+    (match_id, player_id) index on fantasy_team_players and re-totalled
+    from match_player_points, so the cost grows with the number of teams
+    owning those players, not with the size of the match.
+
+    Returns the number of fantasy teams whose total changed.
+    """
+    player_ids = [player_id for player_id, delta in deltas.items() if delta]
+    if not player_ids:
+        return 0
+
+    with transaction.atomic():
+        rescored = fetch_all(RESCORE_TEAMS, [match_id, player_ids, match_id], rows=as_tuples)
+
+        apply_overall_point_deltas({user_id: delta for user_id, _, delta in rescored})
+        apply_matchday_totals(match_id, {user_id: total for user_id, total, _ in rescored})
+
+    return len(rescored)
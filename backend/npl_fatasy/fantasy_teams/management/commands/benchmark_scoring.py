@@ -0,0 +1,158 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.synthetic import seed_match
+from fantasy_teams.scoring import score_match
+from leaderboard.views import (
+    refresh_overall_leaderboard,
+    update_all_overall_ranks,
+    update_overall_leaderboard_for_user,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic match with N fantasy teams (rolled back afterwards) and "
+        "compare the per-team scoring loop with the set-based scoring engine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="1000,10000,50000",
+            help="Comma separated fantasy team counts to benchmark",
+        )
+        parser.add_argument(
+            "--legacy-max", type=int, default=10000,
+            help="Skip the per-team loop above this many teams (it is slow)",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(s) for s in options["sizes"].split(",") if s.strip()]
+
+        self.stdout.write(f"{'teams':>8} {'loop (s)':>10} {'set (s)':>10} {'speedup':>8} {'mismatches':>11}")
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    row = self.run_size(size, run_legacy=size <= options["legacy_max"])
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+            loop_s, set_s, mismatches = row
+            speedup = f"{loop_s / set_s:.1f}x" if loop_s is not None and set_s else "-"
+            self.stdout.write(
+                f"{size:>8} "
+                f"{(f'{loop_s:.3f}' if loop_s is not None else '-'):>10} "
+                f"{set_s:>10.3f} {speedup:>8} "
+                f"{(mismatches if mismatches is not None else '-'):>11}"
+            )
+
+    # ===========================
+    # RUN
+    # ===========================
+    def run_size(self, size, run_legacy):
+        match_id = seed_match(size)["match_id"]
+
+        loop_s = None
+        legacy_totals = None
+        if run_legacy:
+            started = time.perf_counter()
+            self.legacy_score(match_id)
+            loop_s = time.perf_counter() - started
+            legacy_totals = self.totals(match_id)
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE fantasy_teams SET total_points = 0 WHERE match_id = %s",
+                    [match_id],
+                )
+
+        started = time.perf_counter()
+        user_ids = score_match(match_id)
+        refresh_overall_leaderboard(user_ids)
+        set_s = time.perf_counter() - started
+
+        mismatches = None
+        if legacy_totals is not None:
+            set_totals = self.totals(match_id)
+            mismatches = sum(
+                1 for team_id, points in legacy_totals.items()
+                if set_totals.get(team_id) != points
+            )
+
+        return loop_s, set_s, mismatches
+
+    def totals(self, match_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT fantasy_team_id, total_points FROM fantasy_teams WHERE match_id = %s",
+                [match_id],
+            )
+            return dict(cursor.fetchall())
+
+    def legacy_score(self, match_id):
+        """
+        The per-team loop calculate_match_results_api used before score_match
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT fantasy_team_id, user_id
+                FROM fantasy_teams
+                WHERE match_id = %s
+            """, [match_id])
+            teams = cursor.fetchall()
+
+        for fantasy_team_id, user_id in teams:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT
+                        ftp.is_captain,
+                        ftp.is_vice_captain,
+                        (
+                            (COALESCE(ps.runs,0) / 10.0) +
+                            (COALESCE(ps.run_rate,0) / 100.0) +
+                            (CASE
+                                WHEN COALESCE(ps.econ,0) > 0
+                                THEN 10.0 / ps.econ
+                                ELSE 0
+                            END) +
+                            (COALESCE(ps.wickets,0) * 2) +
+                            (COALESCE(ps.sixes,0)) +
+                            (COALESCE(ps.fours,0) * 0.5) +
+                            (COALESCE(ps.catches,0))
+                        ) AS base_points
+                    FROM fantasy_team_players ftp
+                    JOIN match_players mp
+                        ON mp.player_id = ftp.player_id
+                       AND mp.match_id = %s
+                    LEFT JOIN player_stats ps
+                        ON ps.mp_id = mp.mp_id
+                    WHERE ftp.fantasy_team_id = %s
+                """, [match_id, fantasy_team_id])
+                players = cursor.fetchall()
+
+            total_points = 0
+            for is_captain, is_vice_captain, base_points in players:
+                if is_captain:
+                    total_points += base_points * 2
+                elif is_vice_captain:
+                    total_points += base_points * 1.5
+                else:
+                    total_points += base_points
+
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE fantasy_teams
+                    SET total_points = %s
+                    WHERE fantasy_team_id = %s
+                """, [round(total_points, 2), fantasy_team_id])
+
+            update_overall_leaderboard_for_user(user_id)
+
+        update_all_overall_ranks()
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('users', '0001_users'),
+        ('matches', '0001_matches'),
+        ('players', '0001_players'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS fantasy_teams (
+                    fantasy_team_id varchar(100) PRIMARY KEY,
+                    user_id integer NOT NULL REFERENCES users ON DELETE CASCADE,
+                    match_id integer NOT NULL REFERENCES matches ON DELETE CASCADE,
+                    total_points double precision NOT NULL DEFAULT 0
+                );
+                -- WHERE user_id = ... (overall totals), one team per user and match
+                CREATE UNIQUE INDEX IF NOT EXISTS fantasy_teams_user_id_match_id
+                    ON fantasy_teams (user_id, match_id);
+                -- WHERE match_id = %s, scored in fantasy_team_id order
+                CREATE INDEX IF NOT EXISTS fantasy_teams_match_id
+                    ON fantasy_teams (match_id, fantasy_team_id);
+
+                CREATE TABLE IF NOT EXISTS fantasy_team_players (
+                    fantasy_team_id varchar(100) NOT NULL
+                        REFERENCES fantasy_teams ON DELETE CASCADE,
+                    player_id varchar(50) NOT NULL
+                        REFERENCES players ON DELETE CASCADE,
+                    is_captain boolean NOT NULL DEFAULT FALSE,
+                    is_vice_captain boolean NOT NULL DEFAULT FALSE,
+                    PRIMARY KEY (fantasy_team_id, player_id)
+                );
+                CREATE INDEX IF NOT EXISTS fantasy_team_players_player_id
+                    ON fantasy_team_players (player_id);
+            """,
+            reverse_sql="DROP TABLE IF EXISTS fantasy_team_players, fantasy_teams CASCADE;",
+        ),
+    ]
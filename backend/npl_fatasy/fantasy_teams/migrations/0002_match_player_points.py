@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fantasy_teams', '0001_fantasy_teams'),
+        ('match_players', '0001_match_players'),
+        ('player_stats', '0001_player_stats'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS match_player_points (
+                    match_id integer NOT NULL,
+                    player_id varchar(50) NOT NULL,
+                    mp_id varchar(100) NOT NULL
+                        REFERENCES match_players ON DELETE CASCADE,
+                    base_points double precision NOT NULL DEFAULT 0,
+                    PRIMARY KEY (match_id, player_id)
+                );
+
+                -- backfill with the scoring rules as they stood when the table
+                -- was added (fantasy_teams.scoring.BASE_POINTS_SQL at the time)
+                INSERT INTO match_player_points (match_id, player_id, mp_id, base_points)
+                SELECT
+                    mp.match_id, mp.player_id, mp.mp_id,
+                    (COALESCE(ps.runs, 0) / 10.0)
+                    + (COALESCE(ps.run_rate, 0) / 100.0)
+                    + (CASE WHEN COALESCE(ps.econ, 0) > 0 THEN 10.0 / ps.econ ELSE 0 END)
+                    + (COALESCE(ps.wickets, 0) * 2)
+                    + (COALESCE(ps.sixes, 0) * 1)
+                    + (COALESCE(ps.fours, 0) * 0.5)
+                    + (COALESCE(ps.catches, 0) * 1)
+                FROM match_players mp
+                LEFT JOIN player_stats ps ON ps.mp_id = mp.mp_id
+                ON CONFLICT (match_id, player_id) DO NOTHING;
+            """,
+            reverse_sql="DROP TABLE IF EXISTS match_player_points;",
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fantasy_teams', '0002_match_player_points'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE fantasy_team_players
+                    ADD COLUMN IF NOT EXISTS match_id integer;
+
+                UPDATE fantasy_team_players ftp
+                SET match_id = ft.match_id
+                FROM fantasy_teams ft
+                WHERE ft.fantasy_team_id = ftp.fantasy_team_id
+                  AND ftp.match_id IS NULL;
+
+                ALTER TABLE fantasy_team_players
+                    ALTER COLUMN match_id SET NOT NULL;
+
+                -- (match, player) -> teams that picked the player, for live re-scoring
+                CREATE INDEX IF NOT EXISTS fantasy_team_players_match_id_player_id
+                    ON fantasy_team_players (match_id, player_id)
+                    INCLUDE (fantasy_team_id);
+            """,
+            reverse_sql="""
+                DROP INDEX IF EXISTS fantasy_team_players_match_id_player_id;
+                ALTER TABLE fantasy_team_players DROP COLUMN IF EXISTS match_id;
+            """,
+        ),
+    ]
@@ -0,0 +1,312 @@
+from collections import namedtuple
+
+from django.db import transaction
+
+from core.db import as_columns, as_tuples, execute, fetch_all, query
+
+
+# ===========================
+# RULES
+# ===========================
+# The single definition of the fantasy points formula. Everything else
+# (SQL, NumPy, scalar previews) is generated from these.
+#
+#   "per":     stat / factor
+#   "times":   stat * factor
+#   "inverse": factor / stat, 0 when stat is 0 (economy: lower is better)
+StatRule = namedtuple("StatRule", ["stat", "kind", "factor"])
+
+SCORING_RULES = (
+    StatRule("runs", "per", 10),
+    StatRule("run_rate", "per", 100),
+    StatRule("econ", "inverse", 10),
+    StatRule("wickets", "times", 2),
+    StatRule("sixes", "times", 1),
+    StatRule("fours", "times", 0.5),
+    StatRule("catches", "times", 1),
+)
+
+CAPTAIN_MULTIPLIER = 2
+VICE_CAPTAIN_MULTIPLIER = 1.5
+
+
+def multiplier(is_captain, is_vice_captain):
+    if is_captain:
+        return CAPTAIN_MULTIPLIER
+    if is_vice_captain:
+        return VICE_CAPTAIN_MULTIPLIER
+    return 1
+
+
+def base_points(stats):
+    """
+    Fantasy points of one player from a {stat: value} mapping (missing = 0)
+    """
+    points = 0
+    for rule in SCORING_RULES:
+        value = stats.get(rule.stat) or 0
+        if rule.kind == "per":
+            points += value / rule.factor
+        elif rule.kind == "times":
+            points += value * rule.factor
+        elif value > 0:
+            points += rule.factor / value
+    return points
+
+
+# ===========================
+# SQL
+# ===========================
+def _sql_number(value, decimal=False):
+    # "per"/"inverse" need a decimal literal: 7 / 10 is 0 in SQL
+    return repr(float(value)) if decimal else repr(value)
+
+
+def base_points_sql(alias="ps"):
+    """
+    SQL expression for the fantasy points of one player_stats row
+    """
+    terms = []
+    for rule in SCORING_RULES:
+        column = f"COALESCE({alias}.{rule.stat},0)"
+        if rule.kind == "per":
+            terms.append(f"({column} / {_sql_number(rule.factor, decimal=True)})")
+        elif rule.kind == "times":
+            terms.append(f"({column} * {_sql_number(rule.factor)})")
+        else:
+            terms.append(
+                f"(CASE WHEN {column} > 0 "
+                f"THEN {_sql_number(rule.factor, decimal=True)} / {alias}.{rule.stat} "
+                f"ELSE 0 END)"
+            )
+    return "(" + " + ".join(terms) + ")"
+
+
+def multiplied_points_sql(points, is_captain="ftp.is_captain", is_vice_captain="ftp.is_vice_captain"):
+    """
+    SQL expression applying the captain/vice-captain multipliers to `points`
+    """
+    return (
+        f"(CASE WHEN {is_captain} THEN {points} * {_sql_number(CAPTAIN_MULTIPLIER)} "
+        f"WHEN {is_vice_captain} THEN {points} * {_sql_number(VICE_CAPTAIN_MULTIPLIER)} "
+        f"ELSE {points} END)"
+    )
+
+
+BASE_POINTS_SQL = base_points_sql("ps")
+
+
+# ===========================
+# NUMPY
+# ===========================
+def base_points_array(stats):
+    """
+    Vectorized base_points: stats maps each stat to an array-like with one
+    entry per player row (None/NaN/missing = 0). Returns a float64 array.
+    """
+    import numpy as np
+
+    size = len(next(iter(stats.values()))) if stats else 0
+    total = np.zeros(size)
+
+    for rule in SCORING_RULES:
+        values = stats.get(rule.stat)
+        values = np.zeros(size) if values is None else np.nan_to_num(np.asarray(values, dtype=float))
+        if rule.kind == "per":
+            total += values / rule.factor
+        elif rule.kind == "times":
+            total += values * rule.factor
+        else:
+            total += np.divide(rule.factor, values, out=np.zeros(size), where=values > 0)
+
+    return total
+
+
+def team_points_array(points, is_captain, is_vice_captain, team_index, teams):
+    """
+    Vectorized team totals: one entry per picked player, team_index giving
+    the team (0..teams-1) each pick belongs to. Rounded like total_points.
+    """
+    import numpy as np
+
+    multipliers = np.where(
+        np.asarray(is_captain, dtype=bool), CAPTAIN_MULTIPLIER,
+        np.where(np.asarray(is_vice_captain, dtype=bool), VICE_CAPTAIN_MULTIPLIER, 1),
+    )
+    totals = np.bincount(team_index, weights=np.asarray(points) * multipliers, minlength=teams)
+    return np.round(totals, 2)
+
+
+PREVIEW_PLAYERS = query("scoring.preview_players", f"""
+    SELECT mp.player_id, {", ".join(f"ps.{rule.stat}" for rule in SCORING_RULES)}
+    FROM match_players mp
+    LEFT JOIN player_stats ps ON ps.mp_id = mp.mp_id
+    WHERE mp.match_id = %s
+""")
+
+PREVIEW_PICKS = query("scoring.preview_picks", """
+    SELECT ftp.fantasy_team_id, ftp.player_id, ftp.is_captain, ftp.is_vice_captain
+    FROM fantasy_teams ft
+    JOIN fantasy_team_players ftp
+        ON ftp.fantasy_team_id = ft.fantasy_team_id
+    WHERE ft.match_id = %s
+""")
+
+PREVIEW_TEAMS = query("scoring.preview_teams", """
+    SELECT fantasy_team_id FROM fantasy_teams WHERE match_id = %s
+""")
+
+
+def preview_match_totals(match_id, stat_overrides=None):
+    """
+    Score every fantasy team of a match in memory without writing anything.
+    stat_overrides: {player_id: {stat: value}} to try "what if" stat lines.
+
+    Returns {fantasy_team_id: total_points}.
+    """
+    import numpy as np
+
+    # column-oriented: base_points_array takes one sequence per stat
+    columns = fetch_all(PREVIEW_PLAYERS, [match_id], rows=as_columns)
+    picks = fetch_all(PREVIEW_PICKS, [match_id], rows=as_tuples)
+    team_ids = fetch_all(PREVIEW_TEAMS, [match_id], rows=as_columns)["fantasy_team_id"]
+
+    player_ids = columns.pop("player_id")
+    player_index = {player_id: i for i, player_id in enumerate(player_ids)}
+    for player_id, stats in (stat_overrides or {}).items():
+        if player_id in player_index:
+            for name, value in stats.items():
+                if name in columns:
+                    columns[name][player_index[player_id]] = value
+
+    player_points = base_points_array(columns)
+
+    # Picks of players not in match_players score nothing, like the SQL join
+    picks = [pick for pick in picks if pick[1] in player_index]
+    team_index = {team_id: i for i, team_id in enumerate(team_ids)}
+
+    totals = team_points_array(
+        player_points[[player_index[pick[1]] for pick in picks]] if picks else np.zeros(0),
+        [pick[2] for pick in picks],
+        [pick[3] for pick in picks],
+        np.array([team_index[pick[0]] for pick in picks], dtype=np.int64),
+        len(team_ids),
+    )
+
+    return {team_id: float(totals[i]) for team_id, i in team_index.items()}
+
+
+# ===========================
+# PER-PLAYER POINTS
+# ===========================
+# Writers of a match's player points take (POINTS_LOCK, match_id), so the
+# deltas they return never overlap.
+POINTS_LOCK = 0x4E504C03
+
+LOCK_POINTS = query("scoring.lock_points", """
+    SELECT pg_advisory_xact_lock(%s, %s)
+""")
+
+REFRESH_POINTS = query("scoring.refresh_points", f"""
+    WITH fresh AS (
+        SELECT mp.match_id, mp.player_id, mp.mp_id, {BASE_POINTS_SQL} AS base_points
+        FROM match_players mp
+        LEFT JOIN player_stats ps ON ps.mp_id = mp.mp_id
+        WHERE mp.match_id = %s
+    ),
+    changed AS (
+        SELECT f.*, COALESCE(old.base_points, 0) AS old_points
+        FROM fresh f
+        LEFT JOIN match_player_points old
+            ON old.match_id = f.match_id
+           AND old.player_id = f.player_id
+        WHERE old.base_points IS DISTINCT FROM f.base_points
+           OR old.mp_id IS DISTINCT FROM f.mp_id
+    ),
+    written AS (
+        INSERT INTO match_player_points (match_id, player_id, mp_id, base_points)
+        SELECT match_id, player_id, mp_id, base_points
+        FROM changed
+        ON CONFLICT (match_id, player_id) DO UPDATE SET
+            mp_id = EXCLUDED.mp_id,
+            base_points = EXCLUDED.base_points
+    )
+    SELECT player_id, base_points - old_points
+    FROM changed
+""")
+
+
+def refresh_match_player_points(match_id):
+    """
+    Recompute match_player_points for every match_players row of a match
+    (players without stats score 0). Only rows whose points actually
+    changed are written. Call after stats or the playing XI are saved.
+
+    Returns {player_id: new points - old points} for every row written.
+    """
+    with transaction.atomic():
+        execute(LOCK_POINTS, [POINTS_LOCK, match_id])
+        return dict(fetch_all(REFRESH_POINTS, [match_id], rows=as_tuples))
+
+
+# ===========================
+# STORED SCORES
+# ===========================
+def score_match(match_id):
+    """
+    Calculate & store total_points for every fantasy team of a match
+    in a single statement. Teams without scored players get 0.
+
+    Returns the user_ids of the teams that were scored.
+    """
+    return [user_id for _, user_id in score_fantasy_teams(match_id)]
+
+
+SCORE_TEAMS = query("scoring.score_teams", f"""
+    WITH chunk AS (
+        SELECT fantasy_team_id
+        FROM fantasy_teams
+        WHERE match_id = %s
+          AND fantasy_team_id > %s
+        ORDER BY fantasy_team_id
+        LIMIT %s
+    ),
+    team_points AS (
+        SELECT
+            ftp.fantasy_team_id,
+            SUM({multiplied_points_sql("mpp.base_points")}) AS points
+        FROM chunk c
+        JOIN fantasy_team_players ftp
+            ON ftp.fantasy_team_id = c.fantasy_team_id
+        JOIN match_player_points mpp
+            ON mpp.match_id = %s
+           AND mpp.player_id = ftp.player_id
+        GROUP BY ftp.fantasy_team_id
+    ),
+    scored AS (
+        UPDATE fantasy_teams ft
+        SET total_points = ROUND(COALESCE(tp.points, 0)::numeric, 2)
+        FROM chunk c
+        LEFT JOIN team_points tp
+            ON tp.fantasy_team_id = c.fantasy_team_id
+        WHERE ft.fantasy_team_id = c.fantasy_team_id
+          -- the chunk's index range again, so the update never scans other matches
+          AND ft.match_id = %s
+          AND ft.fantasy_team_id > %s
+        RETURNING ft.fantasy_team_id, ft.user_id
+    )
+    -- in the database's collation, like the chunk: its last id is the next `after`
+    SELECT fantasy_team_id, user_id FROM scored ORDER BY fantasy_team_id
+""")
+
+
+def score_fantasy_teams(match_id, after="", limit=None):
+    """
+    Score the fantasy teams of a match whose fantasy_team_id sorts after
+    `after`, at most `limit` of them (all when None), in one statement.
+    Player points are read from match_player_points, which must be fresh.
+
+    Returns (fantasy_team_id, user_id) for every team scored, ordered as
+    the database orders fantasy_team_id: resume from the last one.
+    """
+    return fetch_all(SCORE_TEAMS, [match_id, after, limit, match_id, match_id, after], rows=as_tuples)
@@ -0,0 +1,70 @@
+from django.db import transaction
+
+from core.db import as_tuples, execute, fetch_all, fetch_one, query
+from leaderboard.refresh import request_leaderboard_refresh
+
+
+CREATE_TEAM = query("submission.create_team", """
+    INSERT INTO fantasy_teams
+    (fantasy_team_id, user_id, match_id, total_points)
+    VALUES (%s, %s, %s, 0)
+    ON CONFLICT (fantasy_team_id) DO NOTHING
+    RETURNING fantasy_team_id
+""")
+
+LOCK_TEAM = query("submission.lock_team", """
+    SELECT 1 FROM fantasy_teams
+    WHERE fantasy_team_id = %s
+    FOR UPDATE
+""")
+
+STORED_LINEUP = query("submission.stored_lineup", """
+    SELECT player_id, is_captain, is_vice_captain
+    FROM fantasy_team_players
+    WHERE fantasy_team_id = %s
+""")
+
+CLEAR_LINEUP = query("submission.clear_lineup", """
+    DELETE FROM fantasy_team_players
+    WHERE fantasy_team_id = %s
+""")
+
+INSERT_LINEUP = query("submission.insert_lineup", """
+    INSERT INTO fantasy_team_players
+    (fantasy_team_id, match_id, player_id, is_captain, is_vice_captain)
+    SELECT %s, %s, p.player_id, p.player_id = %s, p.player_id = %s
+    FROM unnest(%s::text[]) AS p(player_id)
+""")
+
+
+def submit_fantasy_team(user_id, match_id, players, captain, vice_captain):
+    """
+    Store a user's lineup for a match in one transaction.
+
+    The fantasy_teams row is locked first, so concurrent submits from the
+    same user run one after the other and the last one wins with exactly
+    seven rows. Submitting the stored lineup again writes nothing.
+
+    Returns "created", "updated" or "unchanged".
+    """
+    fantasy_team_id = f"{user_id}_{match_id}"
+    lineup = {(pid, pid == captain, pid == vice_captain) for pid in players}
+
+    with transaction.atomic():
+        created = fetch_one(CREATE_TEAM, [fantasy_team_id, user_id, match_id], rows=as_tuples) is not None
+
+        if created:
+            request_leaderboard_refresh(match_id)
+        else:
+            execute(LOCK_TEAM, [fantasy_team_id])
+
+            stored = set(fetch_all(STORED_LINEUP, [fantasy_team_id], rows=as_tuples))
+
+            if stored == lineup:
+                return "unchanged"
+
+            execute(CLEAR_LINEUP, [fantasy_team_id])
+
+        execute(INSERT_LINEUP, [fantasy_team_id, match_id, captain, vice_captain, list(players)])
+
+    return "created" if created else "updated"
@@ -1,3 +1,380 @@
-from django.test import TestCase
+import json
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+
+from core.management.commands.load_matchday import pick_lineup
+from core.synthetic import seed_match
+from fantasy_teams import jobs
+from fantasy_teams.live import rescore_players
+from fantasy_teams.management.commands.benchmark_scoring import Command as BenchmarkScoring
+from fantasy_teams.scoring import (
+    BASE_POINTS_SQL,
+    SCORING_RULES,
+    base_points,
+    base_points_array,
+    preview_match_totals,
+    refresh_match_player_points,
+    score_fantasy_teams,
+)
+from fantasy_teams.submission import submit_fantasy_team
+from fantasy_teams.views import match_squad
+from jobs.queue import enqueue, get_job, run_next_job
+
+# stats per player: runs, run_rate, econ, wickets, sixes, fours, catches
+STATS = {
+    "TST_BAT": (64, 152.38, 0, 0, 3, 6, 1),
+    "TST_BOWL": (7, 70.0, 6.25, 3, 0, 1, 0),
+    "TST_ALL": (31, 124.0, 8.5, 1, 1, 2, 2),
+    "TST_KEEP": (0, 0, 0, 0, 0, 0, 3),
+}
+# picked but not playing: no player_stats row
+BENCHED = ("TST_BENCH1", "TST_BENCH2", "TST_BENCH3")
+
+
+def seed_fixture(cursor):
+    """
+    Two teams, one match with four scoring players and three benched ones.
+    Returns the match_id.
+    """
+    cursor.execute("""
+        INSERT INTO teams (team_id, team_name, acronym)
+        VALUES (9001, 'Test Team A', 'TTA'), (9002, 'Test Team B', 'TTB')
+    """)
+    cursor.execute("""
+        INSERT INTO matches (match_date, team_1, team_2)
+        VALUES (CURRENT_DATE, 9001, 9002)
+        RETURNING match_id
+    """)
+    match_id = cursor.fetchone()[0]
+
+    for n, player_id in enumerate([*STATS, *BENCHED]):
+        cursor.execute("""
+            INSERT INTO players (player_id, player_name, role, cost, team_id)
+            VALUES (%s, %s, %s, 8, %s)
+        """, [player_id, player_id, ("Batsman", "Bowler")[n % 2], (9001, 9002)[n % 2]])
+        cursor.execute("""
+            INSERT INTO match_players (mp_id, match_id, player_id, is_playing)
+            VALUES (%s, %s, %s, %s)
+        """, [f"{match_id}_{player_id}", match_id, player_id, player_id in STATS])
+
+    for player_id, (runs, run_rate, econ, wickets, sixes, fours, catches) in STATS.items():
+        mp_id = f"{match_id}_{player_id}"
+        cursor.execute("""
+            INSERT INTO player_stats
+            (stat_id, mp_id, runs, run_rate, econ, wickets, sixes, fours, catches)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, [f"{mp_id}_STAT", mp_id, runs, run_rate, econ, wickets, sixes, fours, catches])
+
+    return match_id
+
+
+class ScoringParityTests(TestCase):
+    """
+    score_fantasy_teams must give every team the total the old per-team
+    loop (kept in benchmark_scoring) gave it
+    """
+
+    # (captain, vice-captain, picks): a benched captain / vice-captain scores 0
+    LINEUPS = (
+        ("TST_BAT", "TST_BOWL", [*STATS, *BENCHED]),
+        ("TST_ALL", "TST_KEEP", [*STATS, *BENCHED]),
+        ("TST_BENCH1", "TST_BAT", [*STATS, *BENCHED]),
+        ("TST_BOWL", "TST_BENCH2", ["TST_BOWL", "TST_BENCH2", "TST_BENCH3", "TST_KEEP"]),
+    )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            self.match_id = seed_fixture(cursor)
+
+            for n, (captain, vice_captain, picks) in enumerate(self.LINEUPS):
+                cursor.execute(
+                    "INSERT INTO users (username, password) VALUES (%s, '!') RETURNING user_id",
+                    [f"parity_user_{n}"],
+                )
+                user_id = cursor.fetchone()[0]
+                fantasy_team_id = f"{user_id}_{self.match_id}"
+                cursor.execute("""
+                    INSERT INTO fantasy_teams (fantasy_team_id, user_id, match_id, total_points)
+                    VALUES (%s, %s, %s, 0)
+                """, [fantasy_team_id, user_id, self.match_id])
+                for player_id in picks:
+                    cursor.execute("""
+                        INSERT INTO fantasy_team_players
+                        (fantasy_team_id, match_id, player_id, is_captain, is_vice_captain)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, [fantasy_team_id, self.match_id, player_id,
+                          player_id == captain, player_id == vice_captain])
+
+    def test_set_based_scoring_matches_legacy_loop(self):
+        benchmark = BenchmarkScoring()
+        benchmark.legacy_score(self.match_id)
+        legacy = benchmark.totals(self.match_id)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE fantasy_teams SET total_points = 0 WHERE match_id = %s",
+                [self.match_id],
+            )
+        refresh_match_player_points(self.match_id)
+        scored = score_fantasy_teams(self.match_id)
+
+        self.assertEqual(len(scored), len(self.LINEUPS))
+        self.assertEqual(benchmark.totals(self.match_id), legacy)
+        self.assertTrue(all(points > 0 for points in legacy.values()))
+
+    def test_live_rescore_matches_full_scoring(self):
+        """Re-scoring only the teams that picked a changed player lands on full-scoring totals"""
+        refresh_match_player_points(self.match_id)
+        score_fantasy_teams(self.match_id)
+        before = BenchmarkScoring().totals(self.match_id)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE player_stats SET runs = runs + 10, wickets = wickets + 1 WHERE mp_id = %s",
+                [f"{self.match_id}_TST_BAT"],
+            )
+        rescored = rescore_players(self.match_id, refresh_match_player_points(self.match_id))
+        live = BenchmarkScoring().totals(self.match_id)
+        score_fantasy_teams(self.match_id)
+
+        # the last lineup didn't pick TST_BAT
+        self.assertEqual(rescored, len(self.LINEUPS) - 1)
+        self.assertEqual(live, BenchmarkScoring().totals(self.match_id))
+        self.assertEqual(sum(live[team] != before[team] for team in live), rescored)
+
+
+
+
+class CalculateMatchResultsTests(TestCase):
+    def setUp(self):
+        self.match_id = seed_match(12)["match_id"]
+
+    def test_resumes_from_the_checkpoint(self):
+        """A job that failed part way scores every team exactly once across both runs"""
+        scored = []
+        calls = 0
+
+        def score_then_fail(match_id, after, limit):
+            nonlocal calls
+            calls += 1
+            if calls == 3:
+                raise RuntimeError("worker lost")
+            rows = score_fantasy_teams(match_id, after=after, limit=limit)
+            scored.extend(team_id for team_id, _ in rows)
+            return rows
+
+        job_id = enqueue("calculate_match_results", {"match_id": self.match_id})
+        with mock.patch.object(jobs, "CHUNK_SIZE", 5), \
+                mock.patch.object(jobs, "score_fantasy_teams", side_effect=score_then_fail):
+            run_next_job()
+            self.assertEqual(get_job(job_id)["status"], "queued")
+            run_next_job()
+
+        job = get_job(job_id)
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["progress"]["teams_processed"], job["progress"]["teams_total"])
+        self.assertEqual(sorted(scored), sorted(set(scored)))
+        self.assertEqual(len(scored), 12)
+
+
+class CompiledRulesParityTests(TestCase):
+    """
+    The SQL and NumPy compilations of SCORING_RULES give the same points,
+    per player row and per team, on the edges of every rule
+    """
+
+    # runs, run_rate, econ, wickets, sixes, fours, catches
+    EDGES = (
+        (0, 0, 0, 0, 0, 0, 0),
+        (9, 0.01, 0.01, 0, 0, 0, 0),
+        (10, 100, 10, 1, 1, 1, 1),
+        (1, 99.99, 36, 0, 0, 1, 0),
+        (250, 999.99, 1.5, 10, 20, 30, 5),
+    )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            self.match_id = seed_fixture(cursor)
+            for n, values in enumerate(self.EDGES):
+                player_id = f"TST_EDGE{n}"
+                mp_id = f"{self.match_id}_{player_id}"
+                cursor.execute("""
+                    INSERT INTO players (player_id, player_name, role, cost, team_id)
+                    VALUES (%s, %s, 'All-Rounder', 8, 9001)
+                """, [player_id, player_id])
+                cursor.execute("""
+                    INSERT INTO match_players (mp_id, match_id, player_id, is_playing)
+                    VALUES (%s, %s, %s, TRUE)
+                """, [mp_id, self.match_id, player_id])
+                cursor.execute("""
+                    INSERT INTO player_stats
+                    (stat_id, mp_id, runs, run_rate, econ, wickets, sixes, fours, catches)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, [f"{mp_id}_STAT", mp_id, *values])
+
+            cursor.execute(
+                "SELECT player_id FROM match_players WHERE match_id = %s ORDER BY player_id",
+                [self.match_id],
+            )
+            self.player_ids = [player_id for player_id, in cursor.fetchall()]
+
+            # every player as captain, vice-captain and plain pick once
+            for n, player_id in enumerate(self.player_ids):
+                cursor.execute(
+                    "INSERT INTO users (username, password) VALUES (%s, '!') RETURNING user_id",
+                    [f"edge_user_{n}"],
+                )
+                user_id = cursor.fetchone()[0]
+                fantasy_team_id = f"{user_id}_{self.match_id}"
+                cursor.execute("""
+                    INSERT INTO fantasy_teams (fantasy_team_id, user_id, match_id, total_points)
+                    VALUES (%s, %s, %s, 0)
+                """, [fantasy_team_id, user_id, self.match_id])
+                picks = [self.player_ids[(n + k) % len(self.player_ids)] for k in range(7)]
+                for k, pick in enumerate(picks):
+                    cursor.execute("""
+                        INSERT INTO fantasy_team_players
+                        (fantasy_team_id, match_id, player_id, is_captain, is_vice_captain)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, [fantasy_team_id, self.match_id, pick, k == 0, k == 1])
+
+    def test_player_points(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {", ".join(f"ps.{rule.stat}" for rule in SCORING_RULES)}, {BASE_POINTS_SQL}
+                FROM match_players mp
+                LEFT JOIN player_stats ps ON ps.mp_id = mp.mp_id
+                WHERE mp.match_id = %s
+                ORDER BY mp.player_id
+            """, [self.match_id])
+            rows = cursor.fetchall()
+
+        stats = [dict(zip((rule.stat for rule in SCORING_RULES), row[:-1])) for row in rows]
+        sql_points = [float(row[-1]) for row in rows]
+        array_points = base_points_array({rule.stat: [s[rule.stat] for s in stats] for rule in SCORING_RULES})
+
+        self.assertEqual(len(rows), len(STATS) + len(BENCHED) + len(self.EDGES))
+        for n, expected in enumerate(sql_points):
+            with self.subTest(player=self.player_ids[n]):
+                self.assertAlmostEqual(array_points[n], expected, places=9)
+                self.assertAlmostEqual(base_points(stats[n]), expected, places=9)
+
+    def test_team_totals(self):
+        previewed = preview_match_totals(self.match_id)
+        refresh_match_player_points(self.match_id)
+        score_fantasy_teams(self.match_id)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT fantasy_team_id, total_points FROM fantasy_teams WHERE match_id = %s",
+                [self.match_id],
+            )
+            self.assertEqual(previewed, dict(cursor.fetchall()))
+
+
+@override_settings(INVALIDATION_BUS=False)
+class SelectPlayersReadOnlyTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            self.match_id = seed_fixture(cursor)
+            cursor.execute(
+                "INSERT INTO users (username, password) VALUES ('reader', '!') RETURNING user_id"
+            )
+            user_id = cursor.fetchone()[0]
+
+        session = self.client.session
+        session["user_id"], session["username"] = user_id, "reader"
+        session.save()
+
+    def test_get_writes_nothing(self):
+        """Opening the picker without a team neither creates one nor queues a refresh"""
+        response = self.client.get(f"/fantasy/select/{self.match_id}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["existing_team"])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM fantasy_teams WHERE match_id = %s", [self.match_id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute("SELECT COUNT(*) FROM leaderboard_refresh_queue WHERE match_id = %s", [self.match_id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+@override_settings(INVALIDATION_BUS=False)
+class SubmissionTests(TestCase):
+    def setUp(self):
+        self.match_id = seed_match(0)["match_id"]
+        self.squad = match_squad(self.match_id)
+        self.lineup = pick_lineup(self.squad, random.Random(0))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, password) VALUES ('picker', '!') RETURNING user_id"
+            )
+            self.user_id = cursor.fetchone()[0]
+
+        session = self.client.session
+        session["user_id"], session["username"] = self.user_id, "picker"
+        session.save()
+
+    def submit(self, lineup):
+        return self.client.post(
+            f"/fantasy/select/{self.match_id}/",
+            data=json.dumps(lineup), content_type="application/json",
+        )
+
+    def stored(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT player_id, is_captain, is_vice_captain
+                FROM fantasy_team_players
+                WHERE fantasy_team_id = %s
+                ORDER BY player_id
+            """, [f"{self.user_id}_{self.match_id}"])
+            return cursor.fetchall()
+
+    def expected(self, lineup):
+        return sorted(
+            (pid, pid == lineup["captain"], pid == lineup["vice_captain"])
+            for pid in lineup["players"]
+        )
+
+    def test_invalid_lineup_writes_nothing(self):
+        team_id = self.squad[0]["team_id"]
+        one_team = [p["player_id"] for p in self.squad if p["team_id"] == team_id][:7]
+        invalid = {"players": one_team, "captain": one_team[0], "vice_captain": one_team[1]}
+
+        response = self.submit(invalid)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Max 4 players per team"})
+        self.assertEqual(self.stored(), [])
+
+        self.submit(self.lineup)
+        self.assertEqual(self.submit(invalid).status_code, 400)
+        self.assertEqual(self.stored(), self.expected(self.lineup))
+
+    def test_failed_replacement_keeps_the_stored_lineup(self):
+        """A lineup failing mid-write rolls back the clear as well"""
+        self.submit(self.lineup)
+        players = [*self.lineup["players"][:6], "NO_SUCH_PLAYER"]
+
+        with self.assertRaises(IntegrityError):
+            submit_fantasy_team(self.user_id, self.match_id, players, players[0], players[1])
+
+        self.assertEqual(self.stored(), self.expected(self.lineup))
+
+    def test_duplicate_submission_writes_once(self):
+        first = self.submit(self.lineup)
+        second = self.submit(self.lineup)
+
+        self.assertEqual(first.json(), {"success": True, "status": "created"})
+        self.assertEqual(second.json(), {"success": True, "status": "unchanged"})
+        self.assertEqual(self.stored(), self.expected(self.lineup))
+
+    def test_resubmission_replaces_the_lineup(self):
+        self.submit(self.lineup)
+        swapped = {**self.lineup, "captain": self.lineup["vice_captain"], "vice_captain": self.lineup["captain"]}
+
+        self.assertEqual(self.submit(swapped).json(), {"success": True, "status": "updated"})
+        self.assertEqual(self.stored(), self.expected(swapped))
@@ -1,106 +1,125 @@
 from django.http import JsonResponse
-from django.db import connection
 from users.auth import login_required
+from leaderboard.refresh import request_leaderboard_refresh
+from core.cache import match_tag, read_through, team_tag
+from core.db import as_tuples, execute, fetch_all, fetch_one, fetch_value, query
+from core.versions import MATCHES, TEAMS, etag
+from .scoring import multiplied_points_sql
+from .submission import submit_fantasy_team
 import json
 
-def dictfetchall(cursor):
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
+MATCH_LIST = query("fantasy_teams.match_list", """
+    SELECT 
+        m.match_id,
+        m.match_date,
+        t1.team_name AS team1,
+        t2.team_name AS team2
+    FROM matches m
+    JOIN teams t1 ON m.team_1 = t1.team_id
+    JOIN teams t2 ON m.team_2 = t2.team_id
+    ORDER BY m.match_date DESC
+""")
 
+
+@etag(MATCHES, TEAMS)
 def match_list_api(request):
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                m.match_id,
-                m.match_date,
-                t1.team_name AS team1,
-                t2.team_name AS team2
-            FROM matches m
-            JOIN teams t1 ON m.team_1 = t1.team_id
-            JOIN teams t2 ON m.team_2 = t2.team_id
-            ORDER BY m.match_date DESC
-        """)
-        matches = dictfetchall(cursor)
+    matches = read_through("fantasy_match_list", [MATCHES, TEAMS], lambda: fetch_all(MATCH_LIST))
 
     return JsonResponse({"matches": matches})
 
 
+MATCH_TEAMS = query("fantasy_teams.match_teams", """
+    SELECT team_1, team_2 FROM matches WHERE match_id = %s
+""")
+
+MATCH_SQUAD = query("fantasy_teams.match_squad", """
+    SELECT 
+        p.player_id,
+        p.player_name,
+        p.role,
+        p.cost,
+        t.team_name,
+        t.team_id
+    FROM players p
+    JOIN teams t ON p.team_id = t.team_id
+    WHERE p.team_id IN (%s, %s)
+    ORDER BY t.team_name, p.player_name
+""")
+
+
+def match_squad(match_id):
+    """
+    Players of both teams of a match, cached under the match and both teams
+    """
+    teams = read_through(
+        f"match_teams:{match_id}", [match_tag(match_id)],
+        lambda: fetch_one(MATCH_TEAMS, [match_id], rows=as_tuples),
+    )
+    if teams is None:
+        return []
+
+    return read_through(
+        f"match_squad:{match_id}",
+        [match_tag(match_id), *map(team_tag, teams)],
+        lambda: fetch_all(MATCH_SQUAD, list(teams)),
+    )
+
+
+FANTASY_TEAM_EXISTS = query("fantasy_teams.exists", """
+    SELECT 1 FROM fantasy_teams
+    WHERE fantasy_team_id = %s
+""")
+
+CREATE_FANTASY_TEAM = query("fantasy_teams.create", """
+    INSERT INTO fantasy_teams
+    (fantasy_team_id, user_id, match_id, total_points)
+    VALUES (%s, %s, %s, 0)
+""")
+
+
 @login_required
 def create_fantasy_team(request, match_id):
     user_id = request.session["user_id"]
     fantasy_team_id = f"{user_id}_{match_id}"
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 1 FROM fantasy_teams
-            WHERE fantasy_team_id = %s
-        """, [fantasy_team_id])
-
-        exists = cursor.fetchone()
+    exists = fetch_value(FANTASY_TEAM_EXISTS, [fantasy_team_id])
 
-        if not exists:
-            cursor.execute("""
-                INSERT INTO fantasy_teams
-                (fantasy_team_id, user_id, match_id, total_points)
-                VALUES (%s, %s, %s, 0)
-            """, [fantasy_team_id, user_id, match_id])
+    if not exists:
+        execute(CREATE_FANTASY_TEAM, [fantasy_team_id, user_id, match_id])
+        request_leaderboard_refresh(match_id)
 
-            return JsonResponse({"status": "created"})
+        return JsonResponse({"status": "created"})
 
     return JsonResponse({"status": "exists"})
 
 
+SELECTED_PLAYERS = query("fantasy_teams.selected_players", """
+    SELECT
+        player_id,
+        is_captain,
+        is_vice_captain
+    FROM fantasy_team_players
+    WHERE fantasy_team_id = %s
+""")
+
+SELECTION_DETAILS = query("fantasy_teams.selection_details", """
+    SELECT player_id, role, team_id, cost
+    FROM players
+    WHERE player_id = ANY(%s)
+""")
+
+
 @login_required
 def select_players_api(request, match_id):
     user_id = request.session["user_id"]
     fantasy_team_id = f"{user_id}_{match_id}"
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 1 FROM fantasy_teams
-            WHERE fantasy_team_id = %s
-        """, [fantasy_team_id])
-
-        if not cursor.fetchone():
-            cursor.execute("""
-                INSERT INTO fantasy_teams
-                (fantasy_team_id, user_id, match_id, total_points)
-                VALUES (%s, %s, %s, 0)
-            """, [fantasy_team_id, user_id, match_id])
-
+    # Read only: the team is created by create_fantasy_team or on submit
     if request.method == "GET":
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    p.player_id,
-                    p.player_name,
-                    p.role,
-                    p.cost,
-                    t.team_name,
-                    t.team_id
-                FROM players p
-                JOIN teams t ON p.team_id = t.team_id
-                WHERE p.team_id IN (
-                    SELECT team_1 FROM matches WHERE match_id = %s
-                    UNION
-                    SELECT team_2 FROM matches WHERE match_id = %s
-                )
-                ORDER BY t.team_name, p.player_name
-            """, [match_id, match_id])
-
-            players = dictfetchall(cursor)
-
-            cursor.execute("""
-                SELECT
-                    player_id,
-                    is_captain,
-                    is_vice_captain
-                FROM fantasy_team_players
-                WHERE fantasy_team_id = %s
-            """, [fantasy_team_id])
-
-            rows = dictfetchall(cursor)
+        players = match_squad(match_id)
+
+        rows = fetch_all(SELECTED_PLAYERS, [fantasy_team_id])
 
         existing_team = None
         if rows:
@@ -121,7 +140,7 @@ def select_players_api(request, match_id):
         captain = data.get("captain")
         vice_captain = data.get("vice_captain")
 
-        if len(selected_players) != 7:
+        if len(selected_players) != 7 or len(set(selected_players)) != 7:
             return JsonResponse({"error": "Select exactly 7 players"}, status=400)
 
         if not captain or not vice_captain:
@@ -133,14 +152,10 @@ def select_players_api(request, match_id):
         if captain not in selected_players or vice_captain not in selected_players:
             return JsonResponse({"error": "Captain/VC must be selected players"}, status=400)
 
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT player_id, role, team_id, cost
-                FROM players
-                WHERE player_id = ANY(%s)
-            """, [selected_players])
+        selected_data = fetch_all(SELECTION_DETAILS, [selected_players])
 
-            selected_data = dictfetchall(cursor)
+        if len(selected_data) != 7:
+            return JsonResponse({"error": "Invalid players selected"}, status=400)
 
         team_count = {}
         role_count = {}
@@ -160,25 +175,28 @@ def select_players_api(request, match_id):
         if total_cost > 60:
             return JsonResponse({"error": "Budget exceeded"}, status=400)
 
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                DELETE FROM fantasy_team_players
-                WHERE fantasy_team_id = %s
-            """, [fantasy_team_id])
+        status = submit_fantasy_team(user_id, match_id, selected_players, captain, vice_captain)
 
-            for pid in selected_players:
-                cursor.execute("""
-                    INSERT INTO fantasy_team_players
-                    (fantasy_team_id, player_id, is_captain, is_vice_captain)
-                    VALUES (%s, %s, %s, %s)
-                """, [
-                    fantasy_team_id,
-                    pid,
-                    pid == captain,
-                    pid == vice_captain
-                ])
+        return JsonResponse({"success": True, "status": status})
 
-        return JsonResponse({"success": True})
+
+FANTASY_TEAM = query("fantasy_teams.team", """
+    SELECT
+        p.player_name,
+        t.team_name,
+        p.role,
+        p.cost,
+        ftp.is_captain,
+        ftp.is_vice_captain
+    FROM fantasy_team_players ftp
+    JOIN players p ON ftp.player_id = p.player_id
+    JOIN teams t ON p.team_id = t.team_id
+    WHERE ftp.fantasy_team_id = %s
+    ORDER BY
+        ftp.is_captain DESC,
+        ftp.is_vice_captain DESC,
+        p.player_name
+""")
 
 
 @login_required
@@ -186,80 +204,40 @@ def fantasy_team_api(request, match_id):
     user_id = request.session["user_id"]
     fantasy_team_id = f"{user_id}_{match_id}"
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT
-                p.player_name,
-                t.team_name,
-                p.role,
-                p.cost,
-                ftp.is_captain,
-                ftp.is_vice_captain
-            FROM fantasy_team_players ftp
-            JOIN players p ON ftp.player_id = p.player_id
-            JOIN teams t ON p.team_id = t.team_id
-            WHERE ftp.fantasy_team_id = %s
-            ORDER BY
-                ftp.is_captain DESC,
-                ftp.is_vice_captain DESC,
-                p.player_name
-        """, [fantasy_team_id])
-
-        players = dictfetchall(cursor)
-    update_overall_leaderboard_for_user(user_id)
-    update_all_overall_ranks()
-    update_matchday_leaderboard(match_id)
+    players = fetch_all(FANTASY_TEAM, [fantasy_team_id])
+
     return JsonResponse({"players": players})
 
+
+FANTASY_TEAM_RESULTS = query("fantasy_teams.results", f"""
+    SELECT
+        p.player_name,
+        t.team_name,
+        p.role,
+        ftp.is_captain,
+        ftp.is_vice_captain,
+        ft.total_points,
+        mpp.base_points,
+        ROUND(({multiplied_points_sql("mpp.base_points")})::numeric, 2)::float AS final_points
+    FROM fantasy_team_players ftp
+    JOIN fantasy_teams ft 
+        ON ft.fantasy_team_id = ftp.fantasy_team_id
+    JOIN players p ON ftp.player_id = p.player_id
+    JOIN teams t ON p.team_id = t.team_id
+    JOIN match_player_points mpp
+        ON mpp.match_id = %s
+       AND mpp.player_id = ftp.player_id
+    WHERE ftp.fantasy_team_id = %s
+    ORDER BY ftp.is_captain DESC, ftp.is_vice_captain DESC
+""")
+
+
 @login_required
 def fantasy_team_results_api(request, match_id):
     user_id = request.session["user_id"]
     fantasy_team_id = f"{user_id}_{match_id}"
 
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT
-                p.player_name,
-                t.team_name,
-                p.role,
-                ftp.is_captain,
-                ftp.is_vice_captain,
-                ft.total_points,
-                (
-                    (COALESCE(ps.runs,0) / 10.0) +
-                    (COALESCE(ps.run_rate,0) / 100.0) +
-                    (CASE 
-                        WHEN COALESCE(ps.econ,0) > 0 
-                        THEN 10.0 / ps.econ 
-                        ELSE 0 
-                    END) +
-                    (COALESCE(ps.wickets,0) * 2) +
-                    (COALESCE(ps.sixes,0)) +
-                    (COALESCE(ps.fours,0) * 0.5) +
-                    (COALESCE(ps.catches,0))
-                ) AS base_points
-            FROM fantasy_team_players ftp
-            JOIN fantasy_teams ft 
-                ON ft.fantasy_team_id = ftp.fantasy_team_id
-            JOIN players p ON ftp.player_id = p.player_id
-            JOIN teams t ON p.team_id = t.team_id
-            JOIN match_players mp 
-                ON mp.player_id = p.player_id 
-               AND mp.match_id = %s
-            LEFT JOIN player_stats ps ON ps.mp_id = mp.mp_id
-            WHERE ftp.fantasy_team_id = %s
-            ORDER BY ftp.is_captain DESC, ftp.is_vice_captain DESC
-        """, [match_id, fantasy_team_id])
-
-        players = dictfetchall(cursor)
-
-    for p in players:
-        if p["is_captain"]:
-            p["final_points"] = round(p["base_points"] * 2, 2)
-        elif p["is_vice_captain"]:
-            p["final_points"] = round(p["base_points"] * 1.5, 2)
-        else:
-            p["final_points"] = round(p["base_points"], 2)
+    players = fetch_all(FANTASY_TEAM_RESULTS, [match_id, fantasy_team_id])
 
     total_points = players[0]["total_points"] if players else 0
 
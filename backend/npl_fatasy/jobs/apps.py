@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
+
+    def ready(self):
+        # Load every app's jobs.py so its handlers get registered
+        from django.utils.module_loading import autodiscover_modules
+        autodiscover_modules("jobs")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from jobs.queue import run_next_job, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (match result calculation, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep polling for jobs instead of exiting when the queue is empty",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0,
+            help="Seconds between polls with --loop",
+        )
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+
+        while True:
+            job = run_next_job(worker)
+            if job:
+                self.stdout.write(f"job {job.job_id} ({job.kind}): {job.progress}")
+                continue
+
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id bigserial PRIMARY KEY,
+                    kind text NOT NULL,
+                    params jsonb NOT NULL DEFAULT '{}',
+                    dedupe_key text,
+                    status text NOT NULL DEFAULT 'queued',
+                    progress jsonb NOT NULL DEFAULT '{}',
+                    checkpoint jsonb NOT NULL DEFAULT '{}',
+                    attempts integer NOT NULL DEFAULT 0,
+                    error text,
+                    locked_by text,
+                    heartbeat_at timestamptz,
+                    created_at timestamptz NOT NULL DEFAULT now(),
+                    started_at timestamptz,
+                    finished_at timestamptz
+                );
+                -- at most one queued/running job per dedupe key
+                CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedupe_key
+                    ON jobs (dedupe_key)
+                    WHERE status IN ('queued', 'running');
+                CREATE INDEX IF NOT EXISTS jobs_claimable
+                    ON jobs (created_at)
+                    WHERE status IN ('queued', 'running');
+            """,
+            reverse_sql="DROP TABLE IF EXISTS jobs;",
+        ),
+    ]
@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+
+from core.db import as_tuples, execute, fetch_one, fetch_value, query
+
+_handlers = {}
+
+
+def register(kind):
+    """
+    Register a job handler:
+
+        @register("calculate_match_results")
+        def calculate_match_results(job): ...
+
+    Handlers live in each app's jobs.py, which is loaded at startup. They
+    must be idempotent and should call job.save_checkpoint() inside the
+    same transaction as the work they checkpoint, so a job resumed after
+    a crash picks up exactly where the last commit left it.
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+SAVE_CHECKPOINT = query("jobs.save_checkpoint", """
+    UPDATE jobs
+    SET checkpoint = %s,
+        progress = %s,
+        heartbeat_at = now()
+    WHERE job_id = %s
+""")
+
+
+class Job:
+    def __init__(self, job_id, kind, params, checkpoint, progress):
+        self.job_id = job_id
+        self.kind = kind
+        self.params = params
+        self.checkpoint = checkpoint
+        self.progress = progress
+
+    def save_checkpoint(self, checkpoint, **progress):
+        """
+        Store the resume point and update progress counters (also a heartbeat)
+        """
+        self.checkpoint = checkpoint
+        self.progress.update(progress)
+
+        execute(SAVE_CHECKPOINT, [json.dumps(self.checkpoint), json.dumps(self.progress), self.job_id])
+
+
+# ===========================
+# QUEUE
+# ===========================
+INSERT_JOB = query("jobs.insert", """
+    INSERT INTO jobs (kind, params, dedupe_key)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running')
+    DO NOTHING
+    RETURNING job_id
+""")
+
+ACTIVE_JOB = query("jobs.active", """
+    SELECT job_id FROM jobs
+    WHERE dedupe_key = %s
+      AND status IN ('queued', 'running')
+""")
+
+
+def enqueue(kind, params, dedupe_key=None):
+    """
+    Queue a job and return its id. While a job with the same dedupe_key
+    is queued or running, its id is returned instead of a new one.
+    """
+    while True:
+        job_id = fetch_value(INSERT_JOB, [kind, json.dumps(params), dedupe_key])
+        if job_id is not None:
+            return job_id
+
+        job_id = fetch_value(ACTIVE_JOB, [dedupe_key])
+        # Otherwise it finished in between: try again
+        if job_id is not None:
+            return job_id
+
+
+GET_JOB = query("jobs.get", """
+    SELECT job_id, kind, params, status, progress, attempts, error,
+           created_at, started_at, finished_at
+    FROM jobs
+    WHERE job_id = %s
+""")
+
+
+def get_job(job_id):
+    job = fetch_one(GET_JOB, [job_id])
+    if not job:
+        return None
+
+    for key in ("params", "progress"):
+        if isinstance(job[key], str):
+            job[key] = json.loads(job[key])
+    return job
+
+
+CLAIM_JOB = query("jobs.claim", """
+    UPDATE jobs
+    SET status = 'running',
+        locked_by = %s,
+        heartbeat_at = now(),
+        started_at = COALESCE(started_at, now()),
+        attempts = attempts + 1
+    WHERE job_id = (
+        SELECT job_id
+        FROM jobs
+        WHERE status = 'queued'
+           OR (status = 'running'
+               AND heartbeat_at < now() - make_interval(secs => %s))
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING job_id, kind, params, checkpoint, progress
+""")
+
+
+def claim_job(worker, stale_after=None):
+    """
+    Take the oldest queued job, or a running job whose worker stopped
+    sending heartbeats (crashed), and mark it as running by `worker`
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, "JOBS_STALE_AFTER", 300)
+
+    row = fetch_one(CLAIM_JOB, [worker, stale_after], rows=as_tuples)
+
+    if not row:
+        return None
+
+    job_id, kind, params, checkpoint, progress = row
+    return Job(
+        job_id, kind,
+        *(json.loads(v) if isinstance(v, str) else v for v in (params, checkpoint, progress)),
+    )
+
+
+FAIL_JOB = query("jobs.fail", """
+    UPDATE jobs
+    SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+        error = %s,
+        locked_by = NULL,
+        finished_at = CASE WHEN attempts >= %s THEN now() END
+    WHERE job_id = %s
+""")
+
+FINISH_JOB = query("jobs.finish", """
+    UPDATE jobs
+    SET status = 'done',
+        error = NULL,
+        locked_by = NULL,
+        finished_at = now()
+    WHERE job_id = %s
+""")
+
+
+def run_job(job):
+    """
+    Run a claimed job and record whether it finished or failed. Failed
+    jobs are queued again (from their last checkpoint) until they run out
+    of attempts.
+    """
+    max_attempts = getattr(settings, "JOBS_MAX_ATTEMPTS", 3)
+
+    try:
+        handler = _handlers[job.kind]
+        handler(job)
+    except Exception:
+        error = traceback.format_exc()
+        execute(FAIL_JOB, [max_attempts, error, max_attempts, job.job_id])
+        return False
+
+    execute(FINISH_JOB, [job.job_id])
+    return True
+
+
+def run_next_job(worker=None):
+    """
+    Claim and run one job. Returns the job, or None if the queue is empty.
+    """
+    with transaction.atomic():
+        job = claim_job(worker or worker_name())
+    if job:
+        run_job(job)
+    return job
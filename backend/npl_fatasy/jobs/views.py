@@ -0,0 +1,29 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from users.auth import superuser_required
+from .queue import get_job
+
+
+@superuser_required
+@require_http_methods(["GET"])
+def job_status_api(request, job_id):
+    """
+    Poll a background job: status is queued, running, done or failed
+    """
+    job = get_job(job_id)
+    if not job:
+        return JsonResponse({"error": "Job not found"}, status=404)
+
+    return JsonResponse({
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "params": job["params"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    })
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from leaderboard.refresh import process_leaderboard_refreshes, refresh_window
+
+
+class Command(BaseCommand):
+    help = "Process queued leaderboard refreshes (one refresh per match per window)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep polling the queue instead of exiting when it is empty",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0,
+            help="Seconds between polls with --loop",
+        )
+        parser.add_argument(
+            "--window", type=float, default=None,
+            help="Coalescing window in seconds (default: LEADERBOARD_REFRESH_WINDOW)",
+        )
+
+    def handle(self, *args, **options):
+        window = refresh_window() if options["window"] is None else options["window"]
+
+        while True:
+            for match_id in process_leaderboard_refreshes(window):
+                self.stdout.write(f"refreshed leaderboards for match {match_id}")
+
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS leaderboard_refresh_queue (
+                    match_id integer PRIMARY KEY,
+                    requested_at timestamptz NOT NULL DEFAULT now()
+                );
+                CREATE INDEX IF NOT EXISTS leaderboard_refresh_queue_requested_at
+                    ON leaderboard_refresh_queue (requested_at);
+            """,
+            reverse_sql="DROP TABLE IF EXISTS leaderboard_refresh_queue;",
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leaderboard', '0001_leaderboard_refresh_queue'),
+        ('users', '0001_users'),
+        ('matches', '0001_matches'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS leaderboard (
+                    id serial PRIMARY KEY,
+                    user_id integer NOT NULL REFERENCES users ON DELETE CASCADE,
+                    match_id integer REFERENCES matches ON DELETE CASCADE,
+                    totalpoints double precision NOT NULL DEFAULT 0,
+                    rank integer
+                );
+                -- the old ON CONFLICT (user_id, match_id) never matched a NULL
+                -- match_id, so adopted tables can hold several overall rows per
+                -- user: keep the highest total (points only accumulate)
+                DELETE FROM leaderboard
+                WHERE ctid IN (
+                    SELECT ctid FROM (
+                        SELECT ctid, ROW_NUMBER() OVER (
+                            PARTITION BY user_id ORDER BY totalpoints DESC, ctid DESC
+                        ) AS n
+                        FROM leaderboard
+                        WHERE match_id IS NULL
+                    ) overall
+                    WHERE n > 1
+                );
+                -- ON CONFLICT (user_id, match_id), match_id NULL is the overall row
+                CREATE UNIQUE INDEX IF NOT EXISTS leaderboard_user_id_match_id
+                    ON leaderboard (user_id, match_id) NULLS NOT DISTINCT;
+                -- matchday ranking: WHERE match_id = %s ORDER BY totalpoints DESC
+                CREATE INDEX IF NOT EXISTS leaderboard_match_id_totalpoints
+                    ON leaderboard (match_id, totalpoints DESC, user_id);
+                CREATE INDEX IF NOT EXISTS leaderboard_match_id_rank
+                    ON leaderboard (match_id, rank);
+                -- overall ranking (match_id IS NULL), see update_overall_ranks_for_users
+                CREATE INDEX IF NOT EXISTS leaderboard_overall_totalpoints
+                    ON leaderboard (totalpoints DESC, user_id)
+                    WHERE match_id IS NULL;
+                CREATE INDEX IF NOT EXISTS leaderboard_overall_rank
+                    ON leaderboard (rank)
+                    WHERE match_id IS NULL;
+            """,
+            # the table may predate this migration: only drop what it added
+            reverse_sql="""
+                DROP INDEX IF EXISTS leaderboard_user_id_match_id;
+                DROP INDEX IF EXISTS leaderboard_match_id_totalpoints;
+                DROP INDEX IF EXISTS leaderboard_match_id_rank;
+                DROP INDEX IF EXISTS leaderboard_overall_totalpoints;
+                DROP INDEX IF EXISTS leaderboard_overall_rank;
+            """,
+        ),
+    ]
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import transaction
+
+from core.db import as_columns, execute, fetch_all, fetch_value, query
+from .views import refresh_overall_leaderboard, update_matchday_leaderboard
+
+
+def refresh_window():
+    return getattr(settings, "LEADERBOARD_REFRESH_WINDOW", 5)
+
+
+REQUEST_REFRESH = query("refresh.request", """
+    INSERT INTO leaderboard_refresh_queue (match_id)
+    VALUES (%s)
+    ON CONFLICT (match_id) DO NOTHING
+""")
+
+
+def request_leaderboard_refresh(match_id):
+    """
+    Ask for the leaderboards of a match to be recomputed.
+
+    Requests for a match that is already queued are dropped, so every
+    trigger inside the refresh window collapses into one refresh.
+    """
+    execute(REQUEST_REFRESH, [match_id])
+
+
+MATCH_USERS = query("refresh.match_users", """
+    SELECT user_id
+    FROM fantasy_teams
+    WHERE match_id = %s
+""")
+
+
+def refresh_match_leaderboards(match_id):
+    """
+    Recompute the matchday leaderboard of a match and the overall
+    totals/ranks of every user who played it.
+
+    Returns the number of leaderboard ranks rewritten.
+    """
+    with transaction.atomic():
+        user_ids = fetch_all(MATCH_USERS, [match_id], rows=as_columns)["user_id"]
+
+        overall = refresh_overall_leaderboard(user_ids)
+        matchday = update_matchday_leaderboard(match_id)
+
+    return (overall or 0) + matchday
+
+
+DEQUEUE_REFRESH = query("refresh.dequeue", """
+    DELETE FROM leaderboard_refresh_queue
+    WHERE match_id = (
+        SELECT match_id
+        FROM leaderboard_refresh_queue
+        WHERE requested_at <= now() - make_interval(secs => %s)
+        ORDER BY requested_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING match_id
+""")
+
+
+def process_leaderboard_refreshes(window=None):
+    """
+    Run one refresh per queued match whose first request is older than
+    the window. Safe to run from several processes at once.
+
+    Returns the refreshed match_ids.
+    """
+    window = refresh_window() if window is None else window
+    refreshed = []
+
+    while True:
+        # Dequeue and refresh in one transaction: a failed refresh stays queued
+        with transaction.atomic():
+            match_id = fetch_value(DEQUEUE_REFRESH, [window])
+
+            if match_id is None:
+                return refreshed
+
+            refresh_match_leaderboards(match_id)
+
+        refreshed.append(match_id)
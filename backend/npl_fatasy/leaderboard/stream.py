@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+
+from core.db import fetch_all
+from core.versions import aget_version, versions_reliable
+from .views import OVERALL_LEADERBOARD, board_query, board_variant, matchday_leaderboard
+
+logger = logging.getLogger(__name__)
+
+# ===========================
+# LIVE LEADERBOARDS (SSE)
+# ===========================
+# Needs the ASGI app (npl_fatasy.asgi): every stream is an open request.
+#
+# Each process runs at most one Producer per board. It watches the board's
+# version counter and, only when it moves, reads the top ranks once and
+# pushes the difference to every subscriber. N viewers cost one query per
+# update, not N queries per poll interval. While the counters can't be
+# trusted (process-local, bus listener not yet connected) it reads the rows
+# on every poll instead. A failed poll is logged and retried.
+#
+# Events:
+#   snapshot  {"version", "rows"}                   on connect / after lagging
+#   delta     {"version", "changed", "removed"}     rows keyed by user_id
+KEEPALIVE = 15
+SUBSCRIBER_QUEUE = 32
+
+
+def stream_poll():
+    return getattr(settings, "LEADERBOARD_STREAM_POLL", 1.0)
+
+
+def stream_size():
+    return getattr(settings, "LEADERBOARD_STREAM_SIZE", 100)
+
+
+TOP_ROWS = board_query("leaderboard.top_rows", """
+    SELECT
+        l.rank,
+        l.user_id,
+        u.username,
+        l.totalpoints AS total_points
+    FROM leaderboard l
+    JOIN users u ON u.user_id = l.user_id
+    WHERE l.match_id {board}
+      AND l.rank <= %(size)s
+    ORDER BY l.rank
+""", matchday="= %(match_id)s")
+
+
+def top_rows(match_id, size):
+    return fetch_all(board_variant(TOP_ROWS, match_id), {"match_id": match_id, "size": size})
+
+
+def read_top_rows(match_id, size):
+    """
+    top_rows outside any request: drop broken or expired connections
+    before and after, as request_started / request_finished would
+    """
+    close_old_connections()
+    try:
+        return top_rows(match_id, size)
+    finally:
+        close_old_connections()
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Producer:
+    def __init__(self, match_id):
+        self.match_id = match_id
+        self.entity = OVERALL_LEADERBOARD if match_id is None else matchday_leaderboard(match_id)
+        self.loop = asyncio.get_running_loop()
+        self.subscribers = set()
+        self.version = None
+        self.rows = None  # {user_id: row} as last pushed
+        self.task = None
+
+    def snapshot(self):
+        return sse("snapshot", {"version": self.version, "rows": list(self.rows.values())})
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        if self.rows is not None:
+            queue.put_nowait(self.snapshot())
+        self.subscribers.add(queue)
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A subscriber that fell behind skips to the current state
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot())
+
+    async def run(self):
+        try:
+            while self.subscribers:
+                try:
+                    await self.poll()
+                except Exception:
+                    logger.exception("leaderboard stream %s: poll failed", self.entity)
+                await asyncio.sleep(stream_poll())
+        finally:
+            if _producers.get(self.match_id) is self:
+                del _producers[self.match_id]
+
+    async def poll(self):
+        # Read the version before the rows: a write landing in between
+        # shows up as a newer version on the next poll. versions_reliable
+        # also starts this process's bus listener.
+        version = await aget_version(self.entity)
+        if version != self.version or not versions_reliable():
+            rows = await sync_to_async(read_top_rows)(self.match_id, stream_size())
+            self.update(version, {row["user_id"]: row for row in rows})
+
+    def update(self, version, rows):
+        previous, self.rows, self.version = self.rows, rows, version
+
+        if previous is None:
+            self.publish(self.snapshot())
+            return
+
+        changed = [row for user_id, row in rows.items() if previous.get(user_id) != row]
+        removed = [user_id for user_id in previous if user_id not in rows]
+        if changed or removed:
+            self.publish(sse("delta", {"version": version, "changed": changed, "removed": removed}))
+
+
+_producers = {}
+
+
+def producer_for(match_id):
+    producer = _producers.get(match_id)
+    if producer is None or producer.loop is not asyncio.get_running_loop():
+        producer = _producers[match_id] = Producer(match_id)
+    return producer
+
+
+async def events(producer):
+    queue = producer.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+    finally:
+        producer.unsubscribe(queue)
+
+
+def stream_response(match_id):
+    response = StreamingHttpResponse(events(producer_for(match_id)), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@require_http_methods(["GET"])
+async def overall_leaderboard_stream(request):
+    return stream_response(None)
+
+
+@require_http_methods(["GET"])
+async def matchday_leaderboard_stream(request, match_id):
+    return stream_response(match_id)
@@ -1,75 +1,337 @@
-from django.test import TransactionTestCase
-from django.db import connection
-from .views import update_leaderboard_for_user, update_rank
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.db import DatabaseError, connection
+from core.instrumentation import record_queries
+from core.synthetic import seed_league
+from fantasy_teams.scoring import score_match
+from .stream import Producer
+from .views import (
+    apply_matchday_totals,
+    apply_overall_point_deltas,
+    refresh_overall_leaderboard,
+    update_all_overall_ranks,
+    update_matchday_leaderboard,
+    update_matchday_ranks,
+    update_overall_leaderboard_for_users,
+)
+
+class LeaderboardTestCase(TestCase):
 
-class LeaderboardTestCase(TransactionTestCase):
-    
     def setUp(self):
-        """Insert test data into existing Supabase tables"""
+        """Three users with one fantasy team each (150, 200 and 175 points)"""
         with connection.cursor() as cursor:
-            # Insert fresh test data
             cursor.execute("""
-                INSERT INTO fantasy_teams (fantasy_team_id, user_id, total_points)
-                VALUES 
-                    (1, 101, 150),
-                    (2, 102, 200),
-                    (3, 103, 175)
+                INSERT INTO teams (team_id, team_name, acronym)
+                VALUES (9001, 'Test Team A', 'TTA'), (9002, 'Test Team B', 'TTB')
             """)
-    
-    def tearDown(self):
-        """Clean up test data after each test"""
+            cursor.execute("""
+                INSERT INTO matches (match_date, team_1, team_2)
+                VALUES (CURRENT_DATE, 9001, 9002)
+                RETURNING match_id
+            """)
+            self.match_id = cursor.fetchone()[0]
+
+            self.user_ids = []
+            for username in ("test_user_1", "test_user_2", "test_user_3"):
+                cursor.execute(
+                    "INSERT INTO users (username, password) VALUES (%s, '!') RETURNING user_id",
+                    [username],
+                )
+                self.user_ids.append(cursor.fetchone()[0])
+
+            for user_id, points in zip(self.user_ids, (150, 200, 175)):
+                cursor.execute("""
+                    INSERT INTO fantasy_teams (fantasy_team_id, user_id, match_id, total_points)
+                    VALUES (%s, %s, %s, %s)
+                """, [f"{user_id}_{self.match_id}", user_id, self.match_id, points])
+
+    def overall(self):
         with connection.cursor() as cursor:
-            # Delete test data
-            cursor.execute("DELETE FROM leaderboard WHERE user_id IN (101, 102, 103)")
-            cursor.execute("DELETE FROM fantasy_team WHERE fantasy_team_id IN (1, 2, 3)")
-    
-    def test_update_leaderboard_for_user(self):
-        """Test updating leaderboard for a user"""
-        # Update leaderboard for team 1
-        update_leaderboard_for_user(1)
-        
-        # Check if leaderboard was updated
+            cursor.execute("""
+                SELECT user_id, totalpoints, rank
+                FROM leaderboard
+                WHERE match_id IS NULL
+                  AND user_id = ANY(%s)
+                ORDER BY rank
+            """, [self.user_ids])
+            return cursor.fetchall()
+
+    def test_update_overall_leaderboard_for_users(self):
+        """Overall totals are the sum of the users' fantasy teams"""
+        update_overall_leaderboard_for_users(self.user_ids)
+
+        totals = {user_id: points for user_id, points, _ in self.overall()}
+        self.assertEqual(totals, dict(zip(self.user_ids, (150, 200, 175))))
+
+    def test_update_all_overall_ranks(self):
+        """Ranks follow total points, highest first"""
+        update_overall_leaderboard_for_users(self.user_ids)
+        update_all_overall_ranks()
+
+        first, second, third = self.user_ids
+        self.assertEqual(
+            [(user_id, rank) for user_id, _, rank in self.overall()],
+            [(second, 1), (third, 2), (first, 3)],
+        )
+
+    def test_refresh_overall_leaderboard_reranks_incrementally(self):
+        """A changed total moves the user to the same rank a full re-rank gives"""
+        update_overall_leaderboard_for_users(self.user_ids)
+        update_all_overall_ranks()
+
+        first = self.user_ids[0]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE fantasy_teams SET total_points = 250 WHERE user_id = %s",
+                [first],
+            )
+        refresh_overall_leaderboard([first])
+        incremental = self.overall()
+
+        update_all_overall_ranks()
+        self.assertEqual(incremental, self.overall())
+        self.assertEqual(incremental[0][:2], (first, 250))
+
+    def test_point_deltas_match_recomputed_totals(self):
+        """Deltas land on the same 2 dp totals a recompute gives, new rows included"""
+        first, second, third = self.user_ids
+        update_overall_leaderboard_for_users([first, second])
+        update_all_overall_ranks()
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE fantasy_teams SET total_points = total_points + 0.35 WHERE user_id = ANY(%s)",
+                [self.user_ids],
+            )
+        # third has no overall row yet: it gets all 175.35, not the 0.35
+        apply_overall_point_deltas({first: 0.35, second: 0.35, third: 0.35})
+        applied = self.overall()
+
+        update_overall_leaderboard_for_users(self.user_ids)
+        update_all_overall_ranks()
+        self.assertEqual(applied, self.overall())
+        self.assertEqual(
+            {user_id: points for user_id, points, _ in applied},
+            {first: 150.35, second: 200.35, third: 175.35},
+        )
+
+    def test_refresh_overall_leaderboard_for_most_users(self):
+        """Changing most of a ranked board re-ranks it in full, not user by user"""
+        match_id = seed_league(users=2000, matches=1)["match_ids"][0]
+        refresh_overall_leaderboard(score_match(match_id))
+
         with connection.cursor() as cursor:
             cursor.execute("""
-                SELECT user_id, total_points 
-                FROM leaderboard 
-                WHERE user_id = 101
+                UPDATE fantasy_teams
+                SET total_points = ROUND((random() * 300)::numeric, 2)
+                WHERE match_id = %s
+                  AND random() < 0.9
+                RETURNING user_id
+            """, [match_id])
+            changed = [user_id for user_id, in cursor.fetchall()]
+
+        with record_queries() as recorder:
+            refresh_overall_leaderboard(changed)
+        incremental = self.board()
+
+        self.assertNotIn("leaderboard.rank_moves.overall", recorder.shapes())
+        update_all_overall_ranks()
+        self.assertEqual(incremental, self.board())
+
+    def board(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT user_id, totalpoints, rank
+                FROM leaderboard
+                WHERE match_id IS NULL
+                ORDER BY rank, user_id
             """)
-            result = cursor.fetchone()
-            
-        self.assertIsNotNone(result)
-        self.assertEqual(result[0], 101)  # user_id
-        self.assertEqual(result[1], 150)  # total_points
-        print("✓ test_update_leaderboard_for_user passed!")
-    
-    def test_update_rank(self):
-        """Test rank calculation"""
-        # Populate leaderboard
-        update_leaderboard_for_user(1)
-        update_leaderboard_for_user(2)
-        update_leaderboard_for_user(3)
-        
-        # Update ranks
-        update_rank()
-        
-        # Check ranks
+            return cursor.fetchall()
+
+
+class IncrementalRankTests(TestCase):
+    """
+    update_ranks_for_users must leave a board exactly as a full re-rank of
+    the same totals does
+    """
+
+    # 30 users in ties of three: 0, 0, 0, 10, 10, 10, ... 90. Up to 5
+    # changed users re-rank incrementally, 6 (36 > 30) re-rank in full.
+    USERS = 30
+
+    def setUp(self):
         with connection.cursor() as cursor:
             cursor.execute("""
-                SELECT user_id, total_points, rank 
-                FROM leaderboard 
-                ORDER BY rank
+                INSERT INTO teams (team_id, team_name, acronym)
+                VALUES (9001, 'Test Team A', 'TTA'), (9002, 'Test Team B', 'TTB')
+            """)
+            cursor.execute("""
+                INSERT INTO matches (match_date, team_1, team_2)
+                VALUES (CURRENT_DATE, 9001, 9002)
+                RETURNING match_id
             """)
-            results = cursor.fetchall()
-        
-        # User 102 has 200 points, should be rank 1
-        self.assertEqual(results[0][0], 102)
-        self.assertEqual(results[0][2], 1)
-        
-        # User 103 has 175 points, should be rank 2
-        self.assertEqual(results[1][0], 103)
-        self.assertEqual(results[1][2], 2)
-        
-        # User 101 has 150 points, should be rank 3
-        self.assertEqual(results[2][0], 101)
-        self.assertEqual(results[2][2], 3)
-        print("✓ test_update_rank passed!")
\ No newline at end of file
+            self.match_id = cursor.fetchone()[0]
+
+        self.user_ids = [self.add_user(f"rank_user_{n}", n // 3 * 10) for n in range(self.USERS)]
+        update_overall_leaderboard_for_users(self.user_ids)
+        update_all_overall_ranks()
+        update_matchday_leaderboard(self.match_id)
+
+    def add_user(self, username, points):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO users (username, password) VALUES (%s, '!') RETURNING user_id",
+                [username],
+            )
+            user_id = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO fantasy_teams (fantasy_team_id, user_id, match_id, total_points)
+                VALUES (%s, %s, %s, %s)
+            """, [f"{user_id}_{self.match_id}", user_id, self.match_id, points])
+        return user_id
+
+    def set_points(self, points):
+        """Change fantasy team totals; returns the users changed"""
+        with connection.cursor() as cursor:
+            for user_id, total in points.items():
+                cursor.execute(
+                    "UPDATE fantasy_teams SET total_points = %s WHERE user_id = %s",
+                    [total, user_id],
+                )
+        return list(points)
+
+    def board(self, match_id=None):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT user_id, totalpoints, rank
+                FROM leaderboard
+                WHERE match_id IS NOT DISTINCT FROM %s
+                ORDER BY rank, user_id
+            """, [match_id])
+            return cursor.fetchall()
+
+    def assert_reranks_like_full(self, change, incremental=True, match_id=None):
+        """
+        Run change(), check the board against a full re-rank of it and
+        whether the incremental path ran. Returns the board.
+        """
+        with record_queries() as recorder:
+            change()
+        board = self.board(match_id)
+
+        self.assertEqual([rank for *_, rank in board], list(range(1, len(board) + 1)))
+        if match_id is None:
+            update_all_overall_ranks()
+        else:
+            update_matchday_ranks(match_id)
+        self.assertEqual(board, self.board(match_id))
+
+        moves = "leaderboard.rank_moves." + ("overall" if match_id is None else "matchday")
+        self.assertEqual(moves in recorder.shapes(), incremental)
+        return board
+
+    def test_moving_up(self):
+        last = self.user_ids[0]
+        changed = self.set_points({last: 95})
+
+        board = self.assert_reranks_like_full(lambda: refresh_overall_leaderboard(changed))
+        self.assertEqual(board[0][:2], (last, 95))
+
+    def test_moving_down(self):
+        top = self.user_ids[-1]
+        changed = self.set_points({top: 5})
+
+        board = self.assert_reranks_like_full(lambda: refresh_overall_leaderboard(changed))
+        self.assertEqual([user_id for user_id, *_ in board[-4:]], [top, *self.user_ids[:3]])
+
+    def test_ties_and_crossing_moves(self):
+        """Users move into a tie on either side of it and past each other"""
+        first, crossing_up, crossing_down, last = (self.user_ids[n] for n in (0, 3, 20, -1))
+        changed = self.set_points({first: 50, last: 50, crossing_up: 60, crossing_down: 10})
+
+        board = self.assert_reranks_like_full(lambda: refresh_overall_leaderboard(changed))
+        self.assertEqual(
+            [user_id for user_id, points, _ in board if points == 50],
+            [first, *self.user_ids[15:18], last],
+        )
+
+    def test_new_users(self):
+        """Users without an overall row are ranked along with the moves"""
+        newcomers = [self.add_user("rank_new_1", 45), self.add_user("rank_new_2", 0)]
+        changed = [*newcomers, *self.set_points({self.user_ids[10]: 85})]
+
+        board = self.assert_reranks_like_full(lambda: refresh_overall_leaderboard(changed))
+        self.assertEqual(len(board), self.USERS + 2)
+
+    def test_point_deltas(self):
+        first, last = self.user_ids[0], self.user_ids[-1]
+
+        board = self.assert_reranks_like_full(lambda: apply_overall_point_deltas({first: 100, last: -90}))
+        self.assertEqual((board[0][0], board[-1][0]), (first, last))
+
+    def test_full_rerank_threshold(self):
+        for count, incremental in ((5, True), (6, False)):
+            with self.subTest(changed=count):
+                changed = self.set_points({
+                    user_id: (n * 37) % 100 for n, user_id in enumerate(self.user_ids[:count])
+                })
+                self.assert_reranks_like_full(lambda: refresh_overall_leaderboard(changed), incremental)
+
+    def test_unranked_rows_fall_back(self):
+        """A row nobody ranked yet makes the old ranks untrustworthy"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE leaderboard SET rank = NULL WHERE user_id = %s AND match_id IS NULL",
+                [self.user_ids[12]],
+            )
+        changed = self.set_points({self.user_ids[0]: 95})
+
+        self.assert_reranks_like_full(lambda: refresh_overall_leaderboard(changed), incremental=False)
+
+    def test_matchday_board(self):
+        first, last = self.user_ids[0], self.user_ids[-1]
+
+        board = self.assert_reranks_like_full(
+            lambda: apply_matchday_totals(self.match_id, {first: 95, last: 0}),
+            match_id=self.match_id,
+        )
+        self.assertEqual(board[0][0], first)
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "versions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "stream-versions"},
+    },
+    INVALIDATION_BUS=False,
+    LEADERBOARD_STREAM_POLL=0.01,
+)
+class StreamProducerTests(SimpleTestCase):
+    def test_failed_poll_is_retried(self):
+        """A database error is logged and the next poll still serves subscribers"""
+        rows = [{"rank": 1, "user_id": 7, "username": "top", "total_points": 10.0}]
+        calls = []
+
+        def read(match_id, size):
+            calls.append(match_id)
+            if len(calls) == 1:
+                raise DatabaseError("connection lost")
+            return rows
+
+        async def first_event():
+            producer = Producer(None)
+            queue = producer.subscribe()
+            try:
+                return await asyncio.wait_for(queue.get(), 5)
+            finally:
+                producer.unsubscribe(queue)
+                await producer.task
+
+        with mock.patch("leaderboard.stream.read_top_rows", side_effect=read), \
+                self.assertLogs("leaderboard.stream", "ERROR"):
+            event = asyncio.run(first_event())
+
+        self.assertTrue(event.startswith("event: snapshot\n"))
+        self.assertIn('"username": "top"', event)
@@ -1,8 +1,12 @@
 from django.urls import path
-from . import views
+from . import stream, views
 
 app_name='leaderboard'
 urlpatterns=[
     path('api/overall/',views.overall_leaderboard_api,name='overall_leaderboard'),
-    path('api/match/<int:match_id>/',views.matchday_leaderboard_api,name='matchday_leaderboard')
+    path('api/match/<int:match_id>/',views.matchday_leaderboard_api,name='matchday_leaderboard'),
+    path('api/overall/me/',views.my_overall_rank_api,name='my_overall_rank'),
+    path('api/match/<int:match_id>/me/',views.my_matchday_rank_api,name='my_matchday_rank'),
+    path('stream/overall/',stream.overall_leaderboard_stream,name='overall_leaderboard_stream'),
+    path('stream/match/<int:match_id>/',stream.matchday_leaderboard_stream,name='matchday_leaderboard_stream'),
 ]
\ No newline at end of file
@@ -4,155 +4,530 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from datetime import datetime
-from django.db import connection
+from django.db import transaction
+from users.auth import login_required
+from core.db import as_tuples, execute, fetch_all, fetch_one, fetch_value, query
+from core.versions import bump_on_commit, etag
 
 
-def dictfetchall(cursor):
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+def board_query(name, sql, overall="IS NULL", matchday="= %s"):
+    """
+    Register the overall and matchday variants of a statement whose SQL
+    tests the board with `match_id {board}`. Returns {None: overall query,
+    "match": matchday query}; pick one with board_variant(match_id).
+    """
+    return {
+        None: query(f"{name}.overall", sql.format(board=overall)),
+        "match": query(f"{name}.matchday", sql.format(board=matchday)),
+    }
+
+
+def board_variant(queries, match_id):
+    return queries[None if match_id is None else "match"]
+
+
+LOCK_BOARD = query("leaderboard.lock_board", """
+    SELECT pg_advisory_xact_lock(%s)
+""")
+
+LOCK_MATCHDAY_BOARD = query("leaderboard.lock_matchday_board", """
+    SELECT pg_advisory_xact_lock(%s, %s)
+""")
+
+# Version counters (core.versions) of the boards, bumped by every writer
+OVERALL_LEADERBOARD = "leaderboard:overall"
 
 
-def dictfetchone(cursor):
-    columns = [col[0] for col in cursor.description]
-    row = cursor.fetchone()
-    return dict(zip(columns, row)) if row else None
+def matchday_leaderboard(match_id):
+    return f"leaderboard:match:{match_id}"
+
+
+MATCHDAY_TOTALS = query("leaderboard.matchday_totals", """
+    INSERT INTO leaderboard (user_id, match_id, totalpoints)
+    SELECT user_id, match_id, COALESCE(total_points, 0)
+    FROM fantasy_teams
+    WHERE match_id=%s
+    ON CONFLICT (user_id, match_id)
+    DO UPDATE SET totalpoints = EXCLUDED.totalpoints
+""")
+
 
 def update_matchday_leaderboard(match_id):
-    with connection.cursor() as cursor:
-        cursor.execute(""" 
-            SELECT user_id, total_points
-            FROM fantasy_teams
-            WHERE match_id=%s
-        """,[match_id])
-
-        teams = dictfetchall(cursor)
-
-        for team in teams:
-            cursor.execute(""" 
-                INSERT INTO leaderboard (user_id, match_id, totalpoints)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (user_id, match_id)
-                DO UPDATE SET totalpoints = EXCLUDED.totalpoints
-            """, [team['user_id'], match_id, team['total_points'] or 0])
+    with transaction.atomic():
+        bump_on_commit(matchday_leaderboard(match_id))
+        execute(LOCK_MATCHDAY_BOARD, [MATCHDAY_RANK_LOCK, match_id])
+        execute(MATCHDAY_TOTALS, [match_id])
 
         # Rank AFTER all inserts
-        cursor.execute("""
-            WITH ranked AS (
-                SELECT id,
-                       ROW_NUMBER() OVER (ORDER BY totalpoints DESC) AS new_rank
-                FROM leaderboard
-                WHERE match_id=%s
-            )
-            UPDATE leaderboard l
-            SET rank = r.new_rank
-            FROM ranked r
-            WHERE l.id = r.id
-        """, [match_id])
-
-            
+        return update_matchday_ranks(match_id)
+
+
+MATCHDAY_RANKS = query("leaderboard.matchday_ranks", """
+    WITH ranked AS (
+        SELECT id,
+               ROW_NUMBER() OVER (ORDER BY totalpoints DESC, user_id) AS new_rank
+        FROM leaderboard
+        WHERE match_id=%s
+    )
+    UPDATE leaderboard l
+    SET rank = r.new_rank
+    FROM ranked r
+    WHERE l.id = r.id
+      AND l.match_id = %s
+      AND l.rank IS DISTINCT FROM r.new_rank
+""")
+
+
+def update_matchday_ranks(match_id):
+    """
+    Re-rank the whole matchday leaderboard of a match
+    """
+    return execute(MATCHDAY_RANKS, [match_id, match_id])
+
+
+USER_TOTAL = query("leaderboard.user_total", """
+    SELECT 
+        ROUND(SUM(total_points)::numeric, 2) as total_points
+    FROM fantasy_teams
+    WHERE user_id = %s
+""")
+
+SET_OVERALL_TOTAL = query("leaderboard.set_overall_total", """
+    INSERT INTO leaderboard (user_id,match_id, totalpoints)
+    VALUES (%s,NULL,%s)
+    ON CONFLICT (user_id,match_id)
+    DO UPDATE SET 
+        totalpoints = EXCLUDED.totalpoints
+""")
+
+
 def update_overall_leaderboard_for_user(user_id):
     """
     Update leaderboard for a user by summing ALL their fantasy team points
     """
-    with connection.cursor() as cursor:
-        # Sum all fantasy teams for this user
-        cursor.execute("""
-            SELECT 
-                SUM(total_points) as total_points
-            FROM fantasy_teams
-            WHERE user_id = %s
-        """, [user_id])
-        
-        stats = dictfetchone(cursor)
-        
-        if not stats:
-            return
-        
-        # Insert or update leaderboard
-        cursor.execute("""
-            INSERT INTO leaderboard (user_id,match_id, totalpoints)
-            VALUES (%s,NULL,%s)
-            ON CONFLICT (user_id,match_id)
-            DO UPDATE SET 
-                totalpoints = EXCLUDED.totalpoints
-        """, [
-            user_id,
-            stats['total_points'] or 0
-        ])
+    # Sum all fantasy teams for this user
+    stats = fetch_one(USER_TOTAL, [user_id])
+
+    if not stats:
+        return
+
+    # Insert or update leaderboard
+    execute(SET_OVERALL_TOTAL, [
+        user_id,
+        stats['total_points'] or 0
+    ])
+
+
+# Summed user by user through the (user_id, match_id) index: a whole
+# match's users are enough for the planner to scan every team of the
+# season otherwise, and that grows with every match played
+OVERALL_TOTALS = query("leaderboard.overall_totals", """
+    INSERT INTO leaderboard (user_id, match_id, totalpoints)
+    SELECT u.user_id, NULL, ROUND(t.points::numeric, 2)
+    FROM unnest(%s::int[]) AS u(user_id)
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS teams, COALESCE(SUM(total_points), 0) AS points
+        FROM fantasy_teams ft
+        WHERE ft.user_id = u.user_id
+    ) t
+    WHERE t.teams > 0
+    ON CONFLICT (user_id, match_id)
+    DO UPDATE SET
+        totalpoints = EXCLUDED.totalpoints
+""")
+
+
+def update_overall_leaderboard_for_users(user_ids):
+    """
+    Same as update_overall_leaderboard_for_user, for many users in one statement
+    """
+    if not user_ids:
+        return
+
+    execute(OVERALL_TOTALS, [list(set(user_ids))])
+
+
+OVERALL_RANKS = query("leaderboard.overall_ranks", """
+    WITH ranked AS (
+        SELECT 
+            id,
+            ROW_NUMBER() OVER (
+                ORDER BY totalpoints DESC, user_id
+            ) as new_rank
+        FROM leaderboard
+        where match_id is null
+    )
+    UPDATE leaderboard l
+    SET rank = r.new_rank
+    FROM ranked r
+    WHERE l.id = r.id
+      AND l.rank IS DISTINCT FROM r.new_rank
+""")
 
 
 def update_all_overall_ranks():
     """
     Update ranks for all users in the leaderboard
     """
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            WITH ranked AS (
-                SELECT 
-                    id,
-                    ROW_NUMBER() OVER (
-                        ORDER BY totalpoints DESC
-                    ) as new_rank
-                FROM leaderboard
-                where match_id is null
-            )
-            UPDATE leaderboard l
-            SET rank = r.new_rank
-            FROM ranked r
-            WHERE l.id = r.id
-        """)
+    execute(LOCK_BOARD, [OVERALL_RANK_LOCK])
+    execute(OVERALL_RANKS)
 
 
-@require_http_methods(["GET"])
-def overall_leaderboard_api(request):
-    limit = int(request.GET.get("limit", 100))
-    offset = int(request.GET.get("offset", 0))
-
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT
-                ROW_NUMBER() OVER (ORDER BY SUM(ft.total_points) DESC) AS rank,
-                u.user_id AS user_id,
-                u.username,
-                SUM(ft.total_points) AS total_points
-            FROM fantasy_teams ft
-            JOIN users u ON ft.user_id = u.user_id
-            GROUP BY u.user_id, u.username
-            ORDER BY total_points DESC
-            LIMIT %s OFFSET %s
-        """, [limit, offset])
-
-        leaderboard = dictfetchall(cursor)
+# ===========================
+# INCREMENTAL RANKS
+# ===========================
+# Ranks are ordered by (totalpoints DESC, user_id). Every writer of the
+# overall board takes OVERALL_RANK_LOCK, every writer of a matchday board
+# takes (MATCHDAY_RANK_LOCK, match_id), so two re-ranks never interleave.
+OVERALL_RANK_LOCK = 0x4E504C01
+MATCHDAY_RANK_LOCK = 0x4E504C02
+
+
+def refresh_overall_leaderboard(user_ids):
+    """
+    Recompute overall totals of the given users from fantasy_teams and
+    re-rank only the part of the leaderboard they moved through
+    """
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return 0
+
+    with transaction.atomic():
+        bump_on_commit(OVERALL_LEADERBOARD)
+        execute(LOCK_BOARD, [OVERALL_RANK_LOCK])
+
+        update_overall_leaderboard_for_users(user_ids)
+        return update_overall_ranks_for_users(user_ids)
+
+
+ADD_OVERALL_POINTS = query("leaderboard.add_overall_points", """
+    WITH deltas AS (
+        SELECT * FROM unnest(%s::int[], %s::numeric[]) AS d(user_id, points)
+    ),
+    added AS (
+        UPDATE leaderboard l
+        SET totalpoints = ROUND((l.totalpoints + d.points)::numeric, 2)
+        FROM deltas d
+        WHERE l.user_id = d.user_id
+          AND l.match_id IS NULL
+        RETURNING l.user_id
+    )
+    -- without an overall row the delta is all we'd have: start from the sum
+    INSERT INTO leaderboard (user_id, match_id, totalpoints)
+    SELECT user_id, NULL, ROUND(COALESCE(SUM(total_points), 0)::numeric, 2)
+    FROM fantasy_teams
+    WHERE user_id IN (SELECT user_id FROM deltas EXCEPT SELECT user_id FROM added)
+    GROUP BY user_id
+""")
+
+
+def apply_overall_point_deltas(deltas):
+    """
+    Add points to many users' overall totals in one statement, then re-rank
+    incrementally. deltas: {user_id: points}
+    """
+    deltas = {user_id: points for user_id, points in deltas.items() if points}
+    if not deltas:
+        return 0
+
+    user_ids = list(deltas)
+
+    with transaction.atomic():
+        bump_on_commit(OVERALL_LEADERBOARD)
+        execute(LOCK_BOARD, [OVERALL_RANK_LOCK])
+        execute(ADD_OVERALL_POINTS, [user_ids, [deltas[user_id] for user_id in user_ids]])
+
+        return update_overall_ranks_for_users(user_ids)
+
+
+SET_MATCHDAY_TOTALS = query("leaderboard.set_matchday_totals", """
+    INSERT INTO leaderboard (user_id, match_id, totalpoints)
+    SELECT t.user_id, %s, t.points
+    FROM unnest(%s::int[], %s::numeric[]) AS t(user_id, points)
+    ON CONFLICT (user_id, match_id)
+    DO UPDATE SET totalpoints = EXCLUDED.totalpoints
+""")
+
+
+def apply_matchday_totals(match_id, totals):
+    """
+    Set many users' totals on a matchday leaderboard in one statement, then
+    re-rank incrementally. totals: {user_id: points}
+    """
+    if not totals:
+        return 0
+
+    user_ids = list(totals)
+
+    with transaction.atomic():
+        bump_on_commit(matchday_leaderboard(match_id))
+        execute(LOCK_MATCHDAY_BOARD, [MATCHDAY_RANK_LOCK, match_id])
+        execute(SET_MATCHDAY_TOTALS, [match_id, user_ids, [totals[user_id] for user_id in user_ids]])
 
+        return update_ranks_for_users(user_ids, match_id)
+
+
+def update_overall_ranks_for_users(user_ids):
+    return update_ranks_for_users(user_ids)
+
+
+UNRANKED_OTHERS = board_query("leaderboard.unranked_others", """
+    SELECT 1 FROM leaderboard
+    WHERE match_id {board}
+      AND rank IS NULL
+      AND user_id <> ALL(%s)
+    LIMIT 1
+""")
+
+BOTTOM_RANK = board_query("leaderboard.bottom_rank", """
+    SELECT MAX(rank) FROM leaderboard WHERE match_id {board}
+""")
+
+RANK_MOVES = board_query("leaderboard.rank_moves", """
+    SELECT
+        c.rank,
+        (
+            SELECT l.rank
+            FROM leaderboard l
+            WHERE l.match_id {board}
+              AND l.user_id <> ALL(%s)
+              AND l.totalpoints <= c.totalpoints
+              AND (l.totalpoints < c.totalpoints OR l.user_id > c.user_id)
+            ORDER BY l.totalpoints DESC, l.user_id
+            LIMIT 1
+        ) AS next_rank
+    FROM leaderboard c
+    WHERE c.match_id {board}
+      AND c.user_id = ANY(%s)
+""")
+
+RERANK_RANGE = board_query("leaderboard.rerank_range", """
+    WITH ranked AS (
+        SELECT
+            id,
+            %s - 1 + ROW_NUMBER() OVER (
+                ORDER BY totalpoints DESC, user_id
+            ) AS new_rank
+        FROM leaderboard
+        WHERE match_id {board}
+          AND (rank BETWEEN %s AND %s OR user_id = ANY(%s))
+    )
+    UPDATE leaderboard l
+    SET rank = r.new_rank
+    FROM ranked r
+    WHERE l.id = r.id
+      AND l.rank IS DISTINCT FROM r.new_rank
+""")
+
+
+def update_ranks_for_users(user_ids, match_id=None):
+    """
+    Re-rank the overall leaderboard (or the matchday leaderboard of
+    match_id) after the totals of user_ids changed.
+
+    The rank column still holds the ranks from before the change. Every
+    changed user moves between its old rank and the old rank of the first
+    unchanged row it now beats, so only ranks inside the hull of those
+    ranges (plus unranked new rows) are rewritten. Must run in the same
+    transaction as the total updates, under the board's rank lock.
+
+    Returns the number of rows whose rank changed.
+    """
+    board_params = [] if match_id is None else [match_id]
+
+    def rerank_all():
+        if match_id is None:
+            update_all_overall_ranks()
+        else:
+            update_matchday_ranks(match_id)
+
+    # An unranked row we didn't just write means ranks can't be trusted
+    if fetch_value(board_variant(UNRANKED_OTHERS, match_id), [*board_params, user_ids]):
+        rerank_all()
+        return None
+
+    # Each move walks past the other changed rows to find an unchanged one:
+    # k changed users cost up to k² steps, a full re-rank about N. Past
+    # that point (a whole-match refresh, say) the full re-rank is cheaper.
+    bottom = fetch_value(board_variant(BOTTOM_RANK, match_id), board_params)
+    if bottom is None or len(user_ids) ** 2 > bottom:
+        rerank_all()
+        return None
+
+    moves = fetch_all(
+        board_variant(RANK_MOVES, match_id),
+        [*board_params, user_ids, *board_params, user_ids],
+        rows=as_tuples,
+    )
+
+    if not moves:
+        return 0
+
+    lo, hi = bottom, 1
+    for old_rank, next_rank in moves:
+        # New rows and rows falling to the bottom push everything below
+        old_rank = bottom if old_rank is None else old_rank
+        next_rank = bottom if next_rank is None else next_rank
+        lo = min(lo, old_rank, next_rank)
+        hi = max(hi, old_rank, next_rank)
+
+    return execute(board_variant(RERANK_RANGE, match_id), [lo, *board_params, lo, hi, user_ids])
+
+
+# ===========================
+# LEADERBOARD API
+# ===========================
+# Served from the precomputed ranks in `leaderboard`. Ranks are dense, so
+# ?after_rank=N (keyset) returns the page starting at rank N+1 through the
+# rank index: every page costs the same. ?offset= is accepted as an alias.
+MAX_PAGE_SIZE = 100
+
+
+def page_params(request):
+    """
+    (limit, after_rank) from the query string, or None if invalid
+    """
+    try:
+        limit = int(request.GET.get("limit", MAX_PAGE_SIZE))
+        after_rank = int(request.GET.get("after_rank", request.GET.get("offset", 0)))
+    except ValueError:
+        return None
+
+    return max(1, min(limit, MAX_PAGE_SIZE)), max(0, after_rank)
+
+
+def page_response(leaderboard, limit, after_rank, **extra):
     return JsonResponse({
+        **extra,
         "leaderboard": leaderboard,
         "limit": limit,
-        "offset": offset
+        "after_rank": after_rank,
+        "next_after_rank": leaderboard[-1]["rank"] if len(leaderboard) == limit else None,
     })
 
 
+LEADERBOARD_PAGE = board_query("leaderboard.page", """
+    SELECT
+        l.rank,
+        l.user_id,
+        u.username,
+        l.totalpoints AS total_points
+    FROM leaderboard l
+    JOIN users u ON u.user_id = l.user_id
+    WHERE l.match_id {board}
+      AND l.rank > %s
+    ORDER BY l.rank
+    LIMIT %s
+""")
+
+
+@require_http_methods(["GET"])
+@etag(OVERALL_LEADERBOARD)
+def overall_leaderboard_api(request):
+    params = page_params(request)
+    if params is None:
+        return JsonResponse({"error": "limit and after_rank must be integers"}, status=400)
+    limit, after_rank = params
+
+    leaderboard = fetch_all(board_variant(LEADERBOARD_PAGE, None), [after_rank, limit])
+
+    return page_response(leaderboard, limit, after_rank)
+
+
 @require_http_methods(["GET"])
+@etag(matchday_leaderboard)
 def matchday_leaderboard_api(request, match_id):
-    limit = int(request.GET.get("limit", 100))
-    offset = int(request.GET.get("offset", 0))
-
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT
-                ROW_NUMBER() OVER (ORDER BY ft.total_points DESC) AS rank,
-                u.user_id AS user_id,
-                u.username,
-                ft.total_points
-            FROM fantasy_teams ft
-            JOIN users u ON ft.user_id = u.user_id
-            WHERE ft.match_id = %s
-            ORDER BY ft.total_points DESC
-            LIMIT %s OFFSET %s
-        """, [match_id, limit, offset])
-
-        leaderboard = dictfetchall(cursor)
+    params = page_params(request)
+    if params is None:
+        return JsonResponse({"error": "limit and after_rank must be integers"}, status=400)
+    limit, after_rank = params
+
+    leaderboard = fetch_all(board_variant(LEADERBOARD_PAGE, match_id), [match_id, after_rank, limit])
+
+    return page_response(leaderboard, limit, after_rank, match_id=match_id)
+
+
+# ===========================
+# MY RANK
+# ===========================
+MAX_NEIGHBOURS = 50
+
+
+RANK_WITH_NEIGHBOURS = board_query("leaderboard.rank_with_neighbours", """
+    WITH me AS (
+        SELECT l.rank
+        FROM leaderboard l
+        WHERE l.user_id = %(user_id)s
+          AND l.match_id {board}
+    )
+    SELECT
+        n.rank,
+        n.user_id,
+        u.username,
+        n.totalpoints AS total_points
+    FROM me
+    CROSS JOIN LATERAL (
+        -- ranks are unique: the LIMIT drops nothing, but tells the
+        -- planner the window is small enough to look users up one by one
+        SELECT l.rank, l.user_id, l.totalpoints
+        FROM leaderboard l
+        WHERE l.rank BETWEEN me.rank - %(k)s AND me.rank + %(k)s
+          AND l.match_id {board}
+        ORDER BY l.rank
+        LIMIT 2 * %(k)s + 1
+    ) n
+    JOIN users u ON u.user_id = n.user_id
+    ORDER BY n.rank
+""", matchday="= %(match_id)s")
+
+
+def rank_with_neighbours(user_id, match_id, k):
+    """
+    The user's leaderboard row plus the k rows above and below it, from two
+    index lookups: (user_id, match_id) then the rank range. match_id None
+    is the overall leaderboard.
+    """
+    rows = fetch_all(
+        board_variant(RANK_WITH_NEIGHBOURS, match_id),
+        {"user_id": user_id, "match_id": match_id, "k": k},
+    )
+
+    me = next((r for r in rows if r["user_id"] == user_id), None)
+    if me is None:
+        return None, [], []
+
+    return (
+        me,
+        [r for r in rows if r["rank"] < me["rank"]],
+        [r for r in rows if r["rank"] > me["rank"]],
+    )
+
+
+def my_rank_response(request, match_id):
+    try:
+        k = int(request.GET.get("k", 5))
+    except ValueError:
+        return JsonResponse({"error": "k must be an integer"}, status=400)
+    k = max(0, min(k, MAX_NEIGHBOURS))
+
+    me, above, below = rank_with_neighbours(request.session["user_id"], match_id, k)
 
     return JsonResponse({
         "match_id": match_id,
-        "leaderboard": leaderboard
+        "k": k,
+        "me": me,
+        "above": above,
+        "below": below,
     })
+
+
+@require_http_methods(["GET"])
+@login_required
+def my_overall_rank_api(request):
+    return my_rank_response(request, None)
+
+
+@require_http_methods(["GET"])
+@login_required
+def my_matchday_rank_api(request, match_id):
+    return my_rank_response(request, match_id)
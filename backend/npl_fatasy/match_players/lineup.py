@@ -0,0 +1,61 @@
+from django.db import transaction
+
+from core.db import as_tuples, fetch_all, query
+from fantasy_teams.scoring import refresh_match_player_points
+
+
+UPDATE_PLAYING_XI = query("lineup.update_playing_xi", """
+    WITH squad AS (
+        SELECT player_id
+        FROM players
+        WHERE team_id IN (
+            SELECT team_1 FROM matches WHERE match_id = %s
+            UNION
+            SELECT team_2 FROM matches WHERE match_id = %s
+        )
+    ),
+    upserted AS (
+        INSERT INTO match_players (mp_id, match_id, player_id, is_playing)
+        SELECT %s || '_' || player_id, %s, player_id, player_id = ANY(%s)
+        FROM squad
+        ON CONFLICT (mp_id) DO UPDATE
+            SET is_playing = EXCLUDED.is_playing
+            WHERE match_players.is_playing IS DISTINCT FROM EXCLUDED.is_playing
+        RETURNING player_id, is_playing
+    ),
+    dropped AS (
+        UPDATE match_players
+        SET is_playing = FALSE
+        WHERE match_id = %s
+          AND is_playing = TRUE
+          AND player_id NOT IN (SELECT player_id FROM squad)
+        RETURNING player_id, is_playing
+    )
+    SELECT player_id, is_playing FROM upserted
+    UNION ALL
+    SELECT player_id, is_playing FROM dropped
+""")
+
+
+def update_playing_xi(match_id, playing_ids):
+    """
+    Mark exactly `playing_ids` as playing for a match, in one statement.
+
+    Squad players without a match_players row get one; existing rows are
+    only touched when is_playing actually flips, so unchanged rows (and
+    the player_stats hanging off their mp_id) are left alone. Rows of
+    players no longer in either squad are marked as not playing. New rows
+    get their match_player_points in the same transaction.
+
+    Returns [(player_id, is_playing)] for every row inserted or flipped.
+    """
+    with transaction.atomic():
+        changed = fetch_all(UPDATE_PLAYING_XI, [
+            match_id, match_id,
+            match_id, match_id, [str(pid) for pid in playing_ids],
+            match_id,
+        ], rows=as_tuples)
+
+        refresh_match_player_points(match_id)
+
+    return changed
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('matches', '0001_matches'),
+        ('players', '0001_players'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS match_players (
+                    mp_id varchar(100) PRIMARY KEY,
+                    match_id integer NOT NULL REFERENCES matches ON DELETE CASCADE,
+                    player_id varchar(50) NOT NULL REFERENCES players ON DELETE CASCADE,
+                    is_playing boolean NOT NULL DEFAULT FALSE
+                );
+                -- mp.match_id = %s AND mp.player_id = ...
+                CREATE UNIQUE INDEX IF NOT EXISTS match_players_match_id_player_id
+                    ON match_players (match_id, player_id);
+                CREATE INDEX IF NOT EXISTS match_players_player_id
+                    ON match_players (player_id);
+            """,
+            reverse_sql="DROP TABLE IF EXISTS match_players CASCADE;",
+        ),
+    ]
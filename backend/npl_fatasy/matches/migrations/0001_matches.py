@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('teams', '0001_teams'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS matches (
+                    match_id serial PRIMARY KEY,
+                    match_date date NOT NULL,
+                    team_1 integer NOT NULL REFERENCES teams ON DELETE CASCADE,
+                    team_2 integer NOT NULL REFERENCES teams ON DELETE CASCADE
+                );
+                CREATE INDEX IF NOT EXISTS matches_match_date
+                    ON matches (match_date);
+                -- delete_team_api: WHERE team_1=%s OR team_2=%s
+                CREATE INDEX IF NOT EXISTS matches_team_1 ON matches (team_1);
+                CREATE INDEX IF NOT EXISTS matches_team_2 ON matches (team_2);
+            """,
+            reverse_sql="DROP TABLE IF EXISTS matches CASCADE;",
+        ),
+    ]
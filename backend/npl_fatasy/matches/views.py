@@ -1,26 +1,28 @@
 from django.http import JsonResponse
-from django.db import connection
 from django.utils.timezone import localdate
 
-def dictfetchall(cursor):
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+from core.cache import read_through
+from core.db import fetch_all, query
+from core.versions import MATCHES, TEAMS, etag
 
 
+MATCH_LIST = query("matches.match_list", """
+    SELECT 
+        m.match_id,
+        m.match_date,
+        t1.team_name AS team1_name,
+        t2.team_name AS team2_name
+    FROM matches m
+    JOIN teams t1 ON m.team_1 = t1.team_id
+    JOIN teams t2 ON m.team_2 = t2.team_id
+    ORDER BY m.match_date ASC
+""")
+
+
+# status depends on today's date as well
+@etag(MATCHES, TEAMS, vary=lambda request: localdate())
 def match_list_api(request):
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                m.match_id,
-                m.match_date,
-                t1.team_name AS team1_name,
-                t2.team_name AS team2_name
-            FROM matches m
-            JOIN teams t1 ON m.team_1 = t1.team_id
-            JOIN teams t2 ON m.team_2 = t2.team_id
-            ORDER BY m.match_date ASC
-        """)
-        rows = dictfetchall(cursor)
+    rows = read_through("match_list", [MATCHES, TEAMS], lambda: fetch_all(MATCH_LIST))
 
     today = localdate()
     matches = []
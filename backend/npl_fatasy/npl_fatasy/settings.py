@@ -48,16 +48,20 @@ INSTALLED_APPS = [
     'users',
     'fantasy_teams',
     'player_stats',
-    'leaderboard'
+    'leaderboard',
+    'jobs',
+    'core',
 ]
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    'core.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -162,3 +166,142 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# Caches
+# The "versions" cache holds the change counters behind live leaderboards.
+# Set REDIS_URL so every process (web, job workers, refresh loop) shares
+# them; without it each process only sees its own writes.
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'versions',
+        },
+        'reference': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'reference',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'versions',
+        },
+        'reference': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'reference',
+        },
+    }
+
+
+# Reference data cache
+# Teams, squads and fixtures are cached in each process ("reference" cache)
+# for at most REFERENCE_CACHE_TTL seconds; admin writes invalidate them.
+
+REFERENCE_CACHE_TTL = 300
+
+
+# Invalidation bus
+# Admin writes and result calculations announce what they changed with
+# Postgres NOTIFY; every process listens and evicts its local caches. A
+# process whose listener hasn't confirmed its connection for
+# INVALIDATION_BUS_MAX_STALENESS seconds stops serving from those caches.
+# A message sequence gap still open after INVALIDATION_BUS_GAP_WINDOW
+# seconds flushes them.
+
+INVALIDATION_BUS = True
+
+INVALIDATION_BUS_MAX_STALENESS = 5
+
+INVALIDATION_BUS_GAP_WINDOW = 2
+
+
+# Live leaderboards
+# Each process runs one producer per streamed leaderboard; it checks the
+# board's version every LEADERBOARD_STREAM_POLL seconds and queries only
+# when it changed. Streams push the top LEADERBOARD_STREAM_SIZE ranks.
+
+LEADERBOARD_STREAM_POLL = 1.0
+
+LEADERBOARD_STREAM_SIZE = 100
+
+
+# SQL instrumentation
+# core.instrumentation.QueryInstrumentationMiddleware counts and times the
+# statements of every request (Server-Timing header + one "sql" log line).
+# A request is flagged when it runs more statements than its view's budget,
+# or the same statement shape N_PLUS_ONE_THRESHOLD times or more. Budgets
+# are keyed by resolved URL name ("namespace:name") and must not grow with
+# data: core.tests.QueryBudgetTests holds every URL to them at two scales.
+
+SQL_INSTRUMENTATION = True
+
+QUERY_BUDGET_DEFAULT = 30
+
+QUERY_BUDGETS = {
+    'leaderboard:overall_leaderboard': 10,
+    'leaderboard:matchday_leaderboard': 10,
+    'leaderboard:my_overall_rank': 10,
+    'leaderboard:my_matchday_rank': 10,
+    'fantasy_select': 15,
+    'fantasy_team': 10,
+    'fantasy_results': 10,
+    'admin_panel:calculate_match_results_api': 10,
+}
+
+N_PLUS_ONE_THRESHOLD = 5
+
+SLOW_QUERY_COUNT = 3
+
+# Request profiling
+# With PROFILING on, a superuser can add ?profile=1 (or an "X-Profile: 1"
+# header) to one request to get its cProfile stats, folded call stacks for
+# a flamegraph and its SQL timeline in PROFILE_DIR. Off, the middleware
+# removes itself at startup.
+
+PROFILING = os.getenv('PROFILING') == '1'
+
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+PROFILE_SAMPLE_INTERVAL = 0.001
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'core.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+
+# Leaderboard refresh
+# Refresh requests for the same match within this many seconds are coalesced
+# into one; run `manage.py refresh_leaderboards --loop` to process them.
+
+LEADERBOARD_REFRESH_WINDOW = 5
+
+
+# Background jobs
+# Run workers with `manage.py run_jobs --loop`. A running job whose worker sent
+# no heartbeat for JOBS_STALE_AFTER seconds is resumed by another worker.
+
+JOBS_STALE_AFTER = 300
+
+JOBS_MAX_ATTEMPTS = 3
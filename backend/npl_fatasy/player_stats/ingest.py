@@ -0,0 +1,316 @@
+import json
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from core.db import as_columns, execute, fetch_all, query
+from fantasy_teams.live import rescore_players
+from fantasy_teams.scoring import refresh_match_player_points
+
+# ===========================
+# EVENTS
+# ===========================
+# One NDJSON line per delivery:
+#
+#   {"batter": "<mp_id>", "bowler": "<mp_id>", "runs": 4, "boundary": 4,
+#    "extras": 0, "legal": true, "wicket": false, "fielder": null}
+#
+#   runs      runs off the bat, credited to the batter and against the bowler
+#   boundary  4 or 6 when the runs were a boundary
+#   extras    wides / no-balls, conceded by the bowler
+#   legal     false for wides and no-balls: no ball faced or bowled
+#   wicket    a wicket credited to the bowler
+#   fielder   mp_id of the player who took the catch
+#
+# Events are coalesced into per-mp_id counters before anything is written.
+COUNTERS = (
+    "runs", "fours", "sixes", "balls_faced",
+    "wickets", "balls_bowled", "runs_conceded", "catches",
+)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_WAIT = 1.0
+# Lines read ahead of the batcher when flushing on a timer
+READ_AHEAD = 10000
+
+
+def _count(event, field):
+    value = event.get(field, 0)
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"{field} must be a non-negative integer")
+    return value
+
+
+def parse_event(line):
+    """
+    One NDJSON line -> [(mp_id, Counter)] contributions.
+    Raises ValueError on anything malformed.
+    """
+    try:
+        event = json.loads(line)
+    except ValueError:
+        raise ValueError("not valid JSON")
+    if not isinstance(event, dict):
+        raise ValueError("must be an object")
+
+    batter, bowler, fielder = event.get("batter"), event.get("bowler"), event.get("fielder")
+    for field, mp_id in (("batter", batter), ("bowler", bowler)):
+        if not isinstance(mp_id, str) or not mp_id:
+            raise ValueError(f"{field} is required")
+    if fielder is not None and (not isinstance(fielder, str) or not fielder):
+        raise ValueError("fielder must be an mp_id")
+
+    runs = _count(event, "runs")
+    extras = _count(event, "extras")
+    boundary = event.get("boundary")
+    if boundary not in (None, 4, 6):
+        raise ValueError("boundary must be 4, 6 or null")
+    if boundary is not None and runs != boundary:
+        raise ValueError("boundary must equal runs")
+    legal = event.get("legal", True)
+    wicket = event.get("wicket", False)
+    if not isinstance(legal, bool) or not isinstance(wicket, bool):
+        raise ValueError("legal and wicket must be booleans")
+
+    contributions = [
+        (batter, Counter(
+            runs=runs,
+            fours=boundary == 4,
+            sixes=boundary == 6,
+            balls_faced=legal,
+        )),
+        (bowler, Counter(
+            wickets=wicket,
+            balls_bowled=legal,
+            runs_conceded=runs + extras,
+        )),
+    ]
+    if fielder is not None:
+        contributions.append((fielder, Counter(catches=1)))
+    return contributions
+
+
+PLAYING_MP_IDS = query("ingest.playing_mp_ids", """
+    SELECT mp_id
+    FROM match_players
+    WHERE match_id = %s
+      AND is_playing = TRUE
+""")
+
+
+def playing_mp_ids(match_id):
+    return set(fetch_all(PLAYING_MP_IDS, [match_id], rows=as_columns)["mp_id"])
+
+
+# ===========================
+# WRITES
+# ===========================
+APPLY_COUNTERS = query("ingest.apply_counters", """
+    INSERT INTO player_stats
+    (stat_id, mp_id, run_rate, econ, runs, fours, sixes, balls_faced,
+     wickets, balls_bowled, runs_conceded, catches)
+    SELECT
+        c.mp_id || '_STAT', c.mp_id,
+        CASE WHEN c.balls_faced > 0
+             THEN ROUND(c.runs * 100.0 / c.balls_faced, 2) ELSE 0 END,
+        CASE WHEN c.balls_bowled > 0
+             THEN ROUND(c.runs_conceded * 6.0 / c.balls_bowled, 2) ELSE 0 END,
+        c.runs, c.fours, c.sixes, c.balls_faced,
+        c.wickets, c.balls_bowled, c.runs_conceded, c.catches
+    FROM unnest(
+        %s::text[], %s::int[], %s::int[], %s::int[], %s::int[],
+        %s::int[], %s::int[], %s::int[], %s::int[]
+    ) AS c(mp_id, runs, fours, sixes, balls_faced,
+           wickets, balls_bowled, runs_conceded, catches)
+    ON CONFLICT (stat_id) DO UPDATE SET
+        runs = player_stats.runs + EXCLUDED.runs,
+        fours = player_stats.fours + EXCLUDED.fours,
+        sixes = player_stats.sixes + EXCLUDED.sixes,
+        balls_faced = player_stats.balls_faced + EXCLUDED.balls_faced,
+        wickets = player_stats.wickets + EXCLUDED.wickets,
+        balls_bowled = player_stats.balls_bowled + EXCLUDED.balls_bowled,
+        runs_conceded = player_stats.runs_conceded + EXCLUDED.runs_conceded,
+        catches = player_stats.catches + EXCLUDED.catches,
+        -- rates only move once balls have been counted
+        run_rate = CASE
+            WHEN player_stats.balls_faced + EXCLUDED.balls_faced > 0
+            THEN ROUND(
+                (player_stats.runs + EXCLUDED.runs) * 100.0
+                / (player_stats.balls_faced + EXCLUDED.balls_faced), 2)
+            ELSE player_stats.run_rate END,
+        econ = CASE
+            WHEN player_stats.balls_bowled + EXCLUDED.balls_bowled > 0
+            THEN ROUND(
+                (player_stats.runs_conceded + EXCLUDED.runs_conceded) * 6.0
+                / (player_stats.balls_bowled + EXCLUDED.balls_bowled), 2)
+            ELSE player_stats.econ END
+""")
+
+
+def apply_counters(match_id, counters):
+    """
+    Add coalesced counters {mp_id: Counter} to player_stats in one
+    statement, recomputing run_rate (runs per 100 balls) and econ (runs
+    conceded per 6 balls) from the new totals. Then refresh the match's
+    player points and re-score the affected fantasy teams, all in one
+    transaction.
+
+    Returns the number of player_stats rows written.
+    """
+    if not counters:
+        return 0
+
+    mp_ids = list(counters)
+
+    with transaction.atomic():
+        written = execute(APPLY_COUNTERS, [
+            mp_ids,
+            *([int(counters[mp_id][field]) for mp_id in mp_ids] for field in COUNTERS),
+        ])
+
+        rescore_players(match_id, refresh_match_player_points(match_id))
+
+    return written
+
+
+_END = object()
+
+
+class _ReadError:
+    def __init__(self, error):
+        self.error = error
+
+
+def timed_lines(lines, timeout):
+    """
+    Yield the lines of an iterable, read on a daemon thread so a slow
+    source can't hold up the caller: None is yielded whenever timeout()
+    seconds (None: no limit) pass without a line. Errors raised by the
+    source are re-raised here. Closing the generator stops the reader
+    before its next line, even with the read-ahead queue full.
+    """
+    pending = queue.Queue(maxsize=READ_AHEAD)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for line in lines:
+                if not put(line):
+                    return
+        except Exception as e:
+            put(_ReadError(e))
+        put(_END)
+
+    threading.Thread(target=read, name="timed_lines", daemon=True).start()
+
+    try:
+        while True:
+            try:
+                line = pending.get(timeout=timeout())
+            except queue.Empty:
+                yield None
+                continue
+            if line is _END:
+                return
+            if isinstance(line, _ReadError):
+                raise line.error
+            yield line
+    finally:
+        stop.set()
+
+
+def ingest_events(match_id, lines, batch_size=DEFAULT_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT, timer=True):
+    """
+    Read NDJSON delivery events for a match from any iterable of lines and
+    apply them in batches. A batch is flushed once it holds batch_size
+    events or its first event is max_wait seconds old, so a burst of balls
+    becomes one write per player. The age is checked on a timer, not only
+    when the next line arrives: a quiet stream still lands within max_wait.
+    With timer=False the lines are read on the caller's thread and the age
+    is only checked as lines arrive (an HTTP body must be read by the
+    request's own thread).
+
+    Lines that don't parse, or name a player who isn't playing the match,
+    are rejected and reported; the rest of the stream is still applied.
+
+    Returns {"events", "rejected", "errors", "batches", "rows", "seconds"};
+    errors holds the first 100 rejections as {"line", "error"}.
+    """
+    playing = playing_mp_ids(match_id)
+    summary = {"events": 0, "rejected": 0, "errors": [], "batches": 0, "rows": 0}
+    counters = defaultdict(Counter)
+    buffered = 0
+    first_at = None
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal counters, buffered, first_at
+        if buffered:
+            summary["rows"] += apply_counters(match_id, counters)
+            summary["batches"] += 1
+        counters, buffered, first_at = defaultdict(Counter), 0, None
+
+    def wait():
+        if first_at is None:
+            return None
+        return max(0, first_at + max_wait - time.monotonic())
+
+    timed = None
+    if timer and max_wait != float("inf"):
+        lines = timed = timed_lines(lines, wait)
+
+    number = 0
+    try:
+        for line in lines:
+            # max_wait passed without a new line
+            if line is None:
+                flush()
+                continue
+
+            number += 1
+            if isinstance(line, bytes):
+                line = line.decode()
+            if not line.strip():
+                continue
+
+            try:
+                contributions = parse_event(line)
+                unknown = [mp_id for mp_id, _ in contributions if mp_id not in playing]
+                if unknown:
+                    raise ValueError(f"{unknown[0]} is not a playing player of this match")
+            except ValueError as e:
+                summary["rejected"] += 1
+                if len(summary["errors"]) < 100:
+                    summary["errors"].append({"line": number, "error": str(e)})
+                continue
+
+            for mp_id, counter in contributions:
+                counters[mp_id].update(counter)
+            summary["events"] += 1
+            buffered += 1
+            first_at = first_at or time.monotonic()
+
+            if buffered >= batch_size or time.monotonic() - first_at >= max_wait:
+                flush()
+    finally:
+        # stop the reader even if a batch failed part way through the stream
+        if timed is not None:
+            timed.close()
+
+    flush()
+    summary["seconds"] = time.perf_counter() - started
+    return summary
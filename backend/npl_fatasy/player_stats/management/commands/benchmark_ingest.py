@@ -0,0 +1,117 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.cache import invalidate_on_commit, match_tag
+from core.synthetic import seed_match
+from core.versions import MATCHES, PLAYERS, TEAMS, bump_on_commit
+from fantasy_teams.scoring import score_match
+from leaderboard.refresh import refresh_match_leaderboards
+from leaderboard.views import OVERALL_LEADERBOARD, update_all_overall_ranks
+from player_stats.ingest import ingest_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic match (committed, removed afterwards), stream "
+        "generated ball-by-ball events into it and report events per second "
+        "per batch size. Every batch commits, as in a live match."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--events", type=int, default=2000,
+            help="Deliveries to ingest per run",
+        )
+        parser.add_argument(
+            "--teams", type=int, default=10000,
+            help="Fantasy teams in the synthetic match (re-scored as events land)",
+        )
+        parser.add_argument(
+            "--batch-sizes", default="1,20,200,2000",
+            help="Comma separated batch sizes to compare",
+        )
+
+    def handle(self, *args, **options):
+        batch_sizes = [int(s) for s in options["batch_sizes"].split(",") if s.strip()]
+
+        self.stdout.write(f"{'batch':>6} {'events':>8} {'batches':>8} {'seconds':>9} {'events/s':>10}")
+        for batch_size in batch_sizes:
+            seeded = self.seed(options["teams"])
+            try:
+                lines = self.deliveries(seeded["match_id"], seeded["team_ids"], options["events"])
+                summary = ingest_events(
+                    seeded["match_id"], lines,
+                    batch_size=batch_size, max_wait=float("inf"),
+                )
+            finally:
+                self.cleanup(seeded)
+
+            rate = summary["events"] / summary["seconds"] if summary["seconds"] else 0
+            self.stdout.write(
+                f"{batch_size:>6} {summary['events']:>8} {summary['batches']:>8} "
+                f"{summary['seconds']:>9.3f} {rate:>10,.0f}"
+            )
+
+    # ===========================
+    # DATA
+    # ===========================
+    def seed(self, teams):
+        """
+        Commit a scored match with its leaderboards, as they stand before
+        the first ball. Batches rewrite the same leaderboard rows: inside one
+        long transaction their dead versions could never be pruned.
+        """
+        with transaction.atomic():
+            seeded = seed_match(teams)
+            score_match(seeded["match_id"])
+            refresh_match_leaderboards(seeded["match_id"])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        return seeded
+
+    def cleanup(self, seeded):
+        # everything else cascades from the users and the teams
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM leaderboard_refresh_queue WHERE match_id = %s", [seeded["match_id"]])
+                cursor.execute("DELETE FROM users WHERE starts_with(username, %s)", [seeded["prefix"]])
+                cursor.execute("DELETE FROM teams WHERE team_id = ANY(%s)", [seeded["team_ids"]])
+            # close the gaps the synthetic users left in the overall ranks
+            update_all_overall_ranks()
+            bump_on_commit(TEAMS, PLAYERS, MATCHES, OVERALL_LEADERBOARD)
+            invalidate_on_commit(TEAMS, MATCHES, match_tag(seeded["match_id"]))
+
+    def deliveries(self, match_id, team_ids, count):
+        """
+        NDJSON lines of plausible deliveries: one side bats, the other
+        bowls and fields. Deterministic.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT mp.mp_id, p.team_id
+                FROM match_players mp
+                JOIN players p ON p.player_id = mp.player_id
+                WHERE mp.match_id = %s
+                ORDER BY mp.mp_id
+            """, [match_id])
+            rows = cursor.fetchall()
+        batting = [mp_id for mp_id, team_id in rows if team_id == team_ids[0]]
+        fielding = [mp_id for mp_id, team_id in rows if team_id == team_ids[1]]
+
+        rng = random.Random(42)
+        for _ in range(count):
+            runs = rng.choice((0, 0, 0, 1, 1, 2, 3, 4, 6))
+            wicket = rng.random() < 0.05
+            yield json.dumps({
+                "batter": rng.choice(batting),
+                "bowler": rng.choice(fielding),
+                "runs": runs,
+                "boundary": runs if runs in (4, 6) else None,
+                "extras": 1 if rng.random() < 0.04 else 0,
+                "legal": rng.random() >= 0.04,
+                "wicket": wicket,
+                "fielder": rng.choice(fielding) if wicket and rng.random() < 0.6 else None,
+            })
@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from player_stats.ingest import DEFAULT_BATCH_SIZE, DEFAULT_MAX_WAIT, ingest_events
+
+
+class Command(BaseCommand):
+    help = "Apply an NDJSON stream of ball-by-ball events to a match's player_stats."
+
+    def add_arguments(self, parser):
+        parser.add_argument("match_id", type=int)
+        parser.add_argument(
+            "--file", default="-",
+            help="NDJSON file to read (default: stdin)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+            help="Flush after this many events",
+        )
+        parser.add_argument(
+            "--max-wait", type=float, default=DEFAULT_MAX_WAIT,
+            help="Flush once the oldest buffered event is this many seconds old",
+        )
+
+    def handle(self, *args, **options):
+        if options["file"] == "-":
+            summary = self.ingest(options, sys.stdin)
+        else:
+            try:
+                with open(options["file"]) as lines:
+                    summary = self.ingest(options, lines)
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for error in summary["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+
+        rate = summary["events"] / summary["seconds"] if summary["seconds"] else 0
+        self.stdout.write(
+            f"{summary['events']} events in {summary['batches']} batches "
+            f"({summary['rejected']} rejected), {summary['seconds']:.3f}s, "
+            f"{rate:,.0f} events/s"
+        )
+
+    def ingest(self, options, lines):
+        return ingest_events(
+            options["match_id"], lines,
+            batch_size=options["batch_size"],
+            max_wait=options["max_wait"],
+        )
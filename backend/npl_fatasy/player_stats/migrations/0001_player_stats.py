@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('match_players', '0001_match_players'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS player_stats (
+                    stat_id varchar(120) PRIMARY KEY,
+                    mp_id varchar(100) NOT NULL REFERENCES match_players ON DELETE CASCADE,
+                    run_rate double precision NOT NULL DEFAULT 0,
+                    econ double precision NOT NULL DEFAULT 0,
+                    wickets integer NOT NULL DEFAULT 0,
+                    sixes integer NOT NULL DEFAULT 0,
+                    fours integer NOT NULL DEFAULT 0,
+                    catches integer NOT NULL DEFAULT 0,
+                    runs integer NOT NULL DEFAULT 0
+                );
+                -- LEFT JOIN player_stats ps ON ps.mp_id = mp.mp_id
+                CREATE UNIQUE INDEX IF NOT EXISTS player_stats_mp_id
+                    ON player_stats (mp_id);
+            """,
+            reverse_sql="DROP TABLE IF EXISTS player_stats CASCADE;",
+        ),
+    ]
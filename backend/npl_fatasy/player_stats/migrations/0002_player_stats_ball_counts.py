@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('player_stats', '0001_player_stats'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                -- raw counts behind run_rate and econ, kept by ball-by-ball ingestion
+                ALTER TABLE player_stats
+                    ADD COLUMN IF NOT EXISTS balls_faced integer NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS balls_bowled integer NOT NULL DEFAULT 0,
+                    ADD COLUMN IF NOT EXISTS runs_conceded integer NOT NULL DEFAULT 0;
+            """,
+            reverse_sql="""
+                ALTER TABLE player_stats
+                    DROP COLUMN IF EXISTS balls_faced,
+                    DROP COLUMN IF EXISTS balls_bowled,
+                    DROP COLUMN IF EXISTS runs_conceded;
+            """,
+        ),
+    ]
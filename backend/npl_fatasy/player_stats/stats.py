@@ -0,0 +1,144 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from core.db import as_tuples, execute, fetch_all, query
+from fantasy_teams.live import rescore_players
+from fantasy_teams.scoring import refresh_match_player_points
+
+DECIMAL_FIELDS = ("run_rate", "econ")
+INTEGER_FIELDS = ("wickets", "sixes", "fours", "catches", "runs")
+STAT_FIELDS = DECIMAL_FIELDS + INTEGER_FIELDS
+
+
+def _parse_stat(field, value):
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None, "must be a number"
+
+    if not number.is_finite():
+        return None, "must be a number"
+    if number < 0:
+        return None, "must not be negative"
+    if field in INTEGER_FIELDS:
+        if number != number.to_integral_value():
+            return None, "must be a whole number"
+        return int(number), None
+    return number, None
+
+
+PLAYING_MP_IDS = query("player_stats.playing_mp_ids", """
+    SELECT mp_id
+    FROM match_players
+    WHERE match_id = %s
+      AND is_playing = TRUE
+      AND mp_id = ANY(%s)
+""")
+
+
+def validate_player_stats(match_id, rows):
+    """
+    Check a whole stats payload before anything is written.
+
+    rows: [{"mp_id": ..., "run_rate": ..., "econ": ..., ...}, ...]
+    Every mp_id must be a playing member of the match and appear once.
+
+    Returns (stats, errors). errors is a list of
+    {"index": i, "mp_id": ..., "errors": {field: message}}; stats is only
+    usable when errors is empty.
+    """
+    if not isinstance(rows, list):
+        return [], [{"index": None, "mp_id": None, "errors": {"players": "must be a list"}}]
+
+    mp_ids = [row.get("mp_id") for row in rows if isinstance(row, dict)]
+    playing = {
+        row[0] for row in fetch_all(
+            PLAYING_MP_IDS,
+            [match_id, [mp_id for mp_id in mp_ids if isinstance(mp_id, str)]],
+            rows=as_tuples,
+        )
+    }
+
+    stats = []
+    errors = []
+    seen = set()
+
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"index": index, "mp_id": None, "errors": {"row": "must be an object"}})
+            continue
+
+        mp_id = row.get("mp_id")
+        row_errors = {}
+
+        if not isinstance(mp_id, str) or not mp_id:
+            row_errors["mp_id"] = "is required"
+            mp_id = None
+        elif mp_id in seen:
+            row_errors["mp_id"] = "appears more than once"
+        elif mp_id not in playing:
+            row_errors["mp_id"] = "is not a playing player of this match"
+        if isinstance(mp_id, str):
+            seen.add(mp_id)
+
+        clean = {"mp_id": mp_id}
+        for field in STAT_FIELDS:
+            if field not in row or row[field] in (None, ""):
+                row_errors[field] = "is required"
+                continue
+            clean[field], error = _parse_stat(field, row[field])
+            if error:
+                row_errors[field] = error
+
+        if row_errors:
+            errors.append({"index": index, "mp_id": mp_id, "errors": row_errors})
+        else:
+            stats.append(clean)
+
+    return stats, errors
+
+
+UPSERT_STATS = query("player_stats.upsert", """
+    INSERT INTO player_stats
+    (stat_id, mp_id, run_rate, econ, wickets, sixes, fours, catches, runs)
+    SELECT
+        s.mp_id || '_STAT', s.mp_id,
+        s.run_rate, s.econ, s.wickets,
+        s.sixes, s.fours, s.catches, s.runs
+    FROM unnest(
+        %s::text[], %s::numeric[], %s::numeric[], %s::int[],
+        %s::int[], %s::int[], %s::int[], %s::int[]
+    ) AS s(mp_id, run_rate, econ, wickets, sixes, fours, catches, runs)
+    ON CONFLICT (stat_id) DO UPDATE SET
+        run_rate = EXCLUDED.run_rate,
+        econ = EXCLUDED.econ,
+        wickets = EXCLUDED.wickets,
+        sixes = EXCLUDED.sixes,
+        fours = EXCLUDED.fours,
+        catches = EXCLUDED.catches,
+        runs = EXCLUDED.runs
+""")
+
+
+def upsert_player_stats(match_id, stats):
+    """
+    Insert or update player_stats for every validated row in one statement.
+    In the same transaction, refresh the match's player points and re-score
+    just the fantasy teams (and leaderboard entries) of players whose
+    points changed.
+    stat_id is always "<mp_id>_STAT", so the conflict on stat_id is the
+    conflict on mp_id.
+    """
+    if not stats:
+        return 0
+
+    with transaction.atomic():
+        saved = execute(UPSERT_STATS, [
+            [s["mp_id"] for s in stats],
+            *([s[field] for s in stats] for field in STAT_FIELDS),
+        ])
+
+        rescore_players(match_id, refresh_match_player_points(match_id))
+
+    return saved
@@ -1,3 +1,216 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from fantasy_teams.tests import seed_fixture
+from player_stats import ingest
+from player_stats.ingest import ingest_events
+from player_stats.stats import STAT_FIELDS, upsert_player_stats, validate_player_stats
+
+
+def stat_row(mp_id, **values):
+    return {
+        "mp_id": mp_id, "run_rate": "125.5", "econ": "7.25", "wickets": 2,
+        "sixes": 1, "fours": 3, "catches": 0, "runs": 40, **values,
+    }
+
+
+class StatsValidationTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            self.match_id = seed_fixture(cursor)
+        self.batter = f"{self.match_id}_TST_BAT"
+        self.bowler = f"{self.match_id}_TST_BOWL"
+
+    def test_valid_rows(self):
+        stats, errors = validate_player_stats(self.match_id, [stat_row(self.batter), stat_row(self.bowler)])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(stats[0]["run_rate"], Decimal("125.5"))
+        self.assertEqual(stats[0]["runs"], 40)
+        self.assertEqual([s["mp_id"] for s in stats], [self.batter, self.bowler])
+
+    def test_bad_values_are_rejected_per_field(self):
+        stats, errors = validate_player_stats(self.match_id, [
+            stat_row(self.batter, run_rate="-1", wickets=1.5, econ="fast"),
+            stat_row(self.bowler, runs=None, sixes=-2),
+        ])
+
+        self.assertEqual(stats, [])
+        self.assertEqual(errors, [
+            {"index": 0, "mp_id": self.batter, "errors": {
+                "run_rate": "must not be negative",
+                "econ": "must be a number",
+                "wickets": "must be a whole number",
+            }},
+            {"index": 1, "mp_id": self.bowler, "errors": {
+                "sixes": "must not be negative",
+                "runs": "is required",
+            }},
+        ])
+
+    def test_unknown_benched_and_repeated_mp_ids(self):
+        stats, errors = validate_player_stats(self.match_id, [
+            stat_row(self.batter),
+            stat_row("999_NOBODY"),
+            stat_row(f"{self.match_id}_TST_BENCH1"),
+            stat_row(self.batter),
+            stat_row(None),
+            "not a row",
+        ])
+
+        self.assertEqual([s["mp_id"] for s in stats], [self.batter])
+        self.assertEqual(
+            [(e["index"], e["errors"]) for e in errors],
+            [
+                (1, {"mp_id": "is not a playing player of this match"}),
+                (2, {"mp_id": "is not a playing player of this match"}),
+                (3, {"mp_id": "appears more than once"}),
+                (4, {"mp_id": "is required"}),
+                (5, {"row": "must be an object"}),
+            ],
+        )
+
+    def test_payload_must_be_a_list(self):
+        self.assertEqual(
+            validate_player_stats(self.match_id, {"mp_id": self.batter}),
+            ([], [{"index": None, "mp_id": None, "errors": {"players": "must be a list"}}]),
+        )
+
+
+class UpsertStatsTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            self.match_id = seed_fixture(cursor)
+        self.batter = f"{self.match_id}_TST_BAT"
+
+    def saved(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT ps.run_rate, ps.econ, ps.wickets, ps.runs, mpp.base_points
+                FROM player_stats ps
+                JOIN match_player_points mpp ON mpp.mp_id = ps.mp_id
+                WHERE ps.mp_id = %s
+            """, [self.batter])
+            return cursor.fetchall()
+
+    def save(self, **values):
+        stats, errors = validate_player_stats(self.match_id, [stat_row(self.batter, **values)])
+        self.assertEqual(errors, [])
+        return upsert_player_stats(self.match_id, stats)
+
+    def test_second_save_overwrites_the_first(self):
+        self.save(run_rate="150", econ="0", wickets=0, runs=60)
+        first = self.saved()
+        self.save(run_rate="80.25", econ="9.5", wickets=1, runs=12)
+
+        (*stats, points), = self.saved()
+        self.assertEqual(len(first), 1)
+        self.assertEqual(stats, [Decimal("80.25"), Decimal("9.50"), 1, 12])
+        self.assertAlmostEqual(points, 1.2 + 0.8025 + 10 / 9.5 + 2 + 1 + 1.5)
+
+    def test_nothing_to_save(self):
+        self.assertEqual(upsert_player_stats(self.match_id, []), 0)
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            self.match_id = seed_fixture(cursor)
+        self.batter = f"{self.match_id}_TST_BAT"
+        self.bowler = f"{self.match_id}_TST_BOWL"
+        self.fielder = f"{self.match_id}_TST_KEEP"
+
+    def delivery(self, runs=0, **event):
+        return json.dumps({"batter": self.batter, "bowler": self.bowler, "runs": runs, **event})
+
+    def stats(self, mp_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {", ".join(STAT_FIELDS)}, mpp.base_points
+                FROM player_stats ps
+                JOIN match_player_points mpp ON mpp.mp_id = ps.mp_id
+                WHERE ps.mp_id = %s
+            """, [mp_id])
+            return cursor.fetchone()
+
+    def test_counts_agree_with_a_manual_save(self):
+        """Ingested deliveries score exactly like the same stats saved by hand"""
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM player_stats WHERE mp_id IN (%s, %s)", [self.batter, self.bowler])
+        lines = [
+            self.delivery(4, boundary=4),
+            self.delivery(1),
+            self.delivery(0, extras=1, legal=False),
+            self.delivery(6, boundary=6),
+            self.delivery(0, wicket=True, fielder=self.fielder),
+            self.delivery(2),
+            self.delivery(0),
+        ]
+        summary = ingest_events(self.match_id, lines)
+        self.assertEqual((summary["events"], summary["rejected"]), (7, 0))
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT balls_faced, balls_bowled, runs_conceded
+                FROM player_stats WHERE mp_id IN (%s, %s) ORDER BY mp_id
+            """, [self.batter, self.bowler])
+            self.assertEqual(cursor.fetchall(), [(6, 0, 0), (0, 6, 14)])
+        ingested = {mp_id: self.stats(mp_id) for mp_id in (self.batter, self.bowler)}
+
+        # 13 runs off 6 balls faced; 14 conceded off 6 legal balls
+        stats, errors = validate_player_stats(self.match_id, [
+            {"mp_id": self.batter, "run_rate": "216.67", "econ": 0, "wickets": 0,
+             "sixes": 1, "fours": 1, "catches": 0, "runs": 13},
+            {"mp_id": self.bowler, "run_rate": 0, "econ": "14.00", "wickets": 1,
+             "sixes": 0, "fours": 0, "catches": 0, "runs": 0},
+        ])
+        self.assertEqual(errors, [])
+        upsert_player_stats(self.match_id, stats)
+
+        self.assertEqual({mp_id: self.stats(mp_id) for mp_id in ingested}, ingested)
+
+    def test_quiet_stream_flushes_on_time(self):
+        """A batch is written max_wait after its first event, not when the next line arrives"""
+        flushed, resumed = [], []
+
+        def apply(match_id, counters):
+            flushed.append(time.monotonic())
+            return len(counters)
+
+        def lines():
+            yield self.delivery(1)
+            time.sleep(0.5)
+            resumed.append(time.monotonic())
+            yield self.delivery(2)
+
+        with mock.patch.object(ingest, "apply_counters", side_effect=apply):
+            summary = ingest_events(self.match_id, lines(), batch_size=100, max_wait=0.05)
+
+        self.assertEqual(summary["batches"], 2)
+        self.assertLess(flushed[0], resumed[0])
+
+    def test_failed_batch_stops_the_reader(self):
+        """A batch that raises part way through leaves no reader blocked on a full queue"""
+        read = []
+
+        def lines():
+            for number in range(1000):
+                read.append(number)
+                yield self.delivery(1)
+
+        before = set(threading.enumerate())
+        with mock.patch.object(ingest, "READ_AHEAD", 10), \
+                mock.patch.object(ingest, "apply_counters", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                ingest_events(self.match_id, lines(), batch_size=5, max_wait=60)
+
+        for reader in set(threading.enumerate()) - before:
+            reader.join(timeout=5)
+            self.assertFalse(reader.is_alive())
+        self.assertLess(len(read), 1000)
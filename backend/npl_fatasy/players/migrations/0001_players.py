@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('teams', '0001_teams'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS players (
+                    player_id varchar(50) PRIMARY KEY,
+                    player_name varchar(100) NOT NULL,
+                    role varchar(30) NOT NULL,
+                    cost numeric(6, 2) NOT NULL,
+                    team_id integer NOT NULL REFERENCES teams ON DELETE CASCADE
+                );
+                -- squad lookups: players of team_1/team_2 of a match
+                CREATE INDEX IF NOT EXISTS players_team_id
+                    ON players (team_id, player_name);
+            """,
+            reverse_sql="DROP TABLE IF EXISTS players CASCADE;",
+        ),
+    ]
@@ -1,15 +1,55 @@
 from django.shortcuts import render, redirect
 from django.http import JsonResponse
-from django.db import connection, IntegrityError
+from django.db import IntegrityError
 from users.auth import login_required
+from core.cache import invalidate_on_commit, read_through, team_tag
+from core.db import as_tuples, execute, fetch_all, fetch_value, query
+from core.versions import PLAYERS, TEAMS, bump_on_commit, etag
 
 
 # =========================
-# Helper
+# Queries
 # =========================
-def dictfetchall(cursor):
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+PLAYERS_BY_ACRONYM = query("players.by_acronym", """
+    SELECT 
+        p.player_id,
+        p.player_name,
+        p.role,
+        p.cost,
+        t.team_name,
+        t.acronym
+    FROM players p
+    JOIN teams t ON p.team_id = t.team_id
+    WHERE t.acronym = %s
+    ORDER BY p.player_name
+""")
+
+TEAM_OPTIONS = query("players.team_options", """
+    SELECT team_id, team_name, acronym
+    FROM teams
+    ORDER BY team_name
+""")
+
+INSERT_PLAYER = query("players.insert", """
+    INSERT INTO players
+    (player_id, player_name, role, cost, team_id)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+
+TEAM_ID_BY_ACRONYM = query("players.team_id_by_acronym", """
+    SELECT team_id FROM teams WHERE acronym = %s
+""")
+
+TEAM_PLAYERS = query("players.team_players", """
+    SELECT 
+        p.player_id,
+        p.player_name,
+        p.role,
+        p.cost
+    FROM players p
+    WHERE p.team_id = %s
+    ORDER BY p.player_name
+""")
 
 
 # =========================
@@ -21,21 +61,7 @@ def players_by_team(request, acronym):
     Server-rendered page:
     /players/ABC/
     """
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                p.player_id,
-                p.player_name,
-                p.role,
-                p.cost,
-                t.team_name,
-                t.acronym
-            FROM players p
-            JOIN teams t ON p.team_id = t.team_id
-            WHERE t.acronym = %s
-            ORDER BY p.player_name
-        """, [acronym.upper()])
-        players = dictfetchall(cursor)
+    players = fetch_all(PLAYERS_BY_ACRONYM, [acronym.upper()])
 
     return render(
         request,
@@ -47,13 +73,7 @@ def players_by_team(request, acronym):
 @login_required
 def add_player(request):
     # Fetch teams for dropdown
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT team_id, team_name, acronym
-            FROM teams
-            ORDER BY team_name
-        """)
-        teams = cursor.fetchall()
+    teams = fetch_all(TEAM_OPTIONS, rows=as_tuples)
 
     error = None
 
@@ -65,12 +85,9 @@ def add_player(request):
         team_id = request.POST.get("team_id")
 
         try:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO players
-                    (player_id, player_name, role, cost, team_id)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, [player_id, player_name, role, cost, team_id])
+            execute(INSERT_PLAYER, [player_id, player_name, role, cost, team_id])
+            bump_on_commit(PLAYERS)
+            invalidate_on_commit(team_tag(team_id))
 
             return redirect("add_player")
 
@@ -87,23 +104,24 @@ def add_player(request):
 # API VIEWS (FOR REACT)
 # =========================
 
+@etag(PLAYERS, TEAMS)
 def players_by_team_api(request, acronym):
     """
     JSON API:
     GET /api/players/<TEAM_ACRONYM>/
     """
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT 
-                p.player_id,
-                p.player_name,
-                p.role,
-                p.cost
-            FROM players p
-            JOIN teams t ON p.team_id = t.team_id
-            WHERE t.acronym = %s
-            ORDER BY p.player_name
-        """, [acronym.upper()])
-        players = dictfetchall(cursor)
+    acronym = acronym.upper()
+
+    team_id = read_through(
+        f"team_id:{acronym}", [TEAMS],
+        lambda: fetch_value(TEAM_ID_BY_ACRONYM, [acronym]),
+    )
+    if team_id is None:
+        return JsonResponse([], safe=False)
+
+    players = read_through(
+        f"team_players:{team_id}", [team_tag(team_id)],
+        lambda: fetch_all(TEAM_PLAYERS, [team_id]),
+    )
 
     return JsonResponse(players, safe=False)
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS teams (
+                    team_id integer PRIMARY KEY,
+                    team_name varchar(100) NOT NULL,
+                    acronym varchar(10) NOT NULL UNIQUE
+                );
+            """,
+            reverse_sql="DROP TABLE IF EXISTS teams CASCADE;",
+        ),
+    ]
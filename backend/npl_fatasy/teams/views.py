@@ -1,19 +1,20 @@
 from django.http import JsonResponse
-from django.db import connection
 
-def dictfetchall(cursor):
-    columns = [col[0] for col in cursor.description]
-    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+from core.cache import read_through
+from core.db import fetch_all, query
+from core.versions import TEAMS, etag
+
+
+TEAM_LIST = query("teams.team_list", """
+    SELECT team_id, team_name, acronym
+    FROM teams
+    ORDER BY team_name
+""")
 
 
 # JSON API for React
+@etag(TEAMS)
 def team_list_api(request):
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT team_id, team_name, acronym
-            FROM teams
-            ORDER BY team_name
-        """)
-        teams = dictfetchall(cursor)
+    teams = read_through("team_list", [TEAMS], lambda: fetch_all(TEAM_LIST))
 
     return JsonResponse(teams, safe=False)
@@ -1,3 +1,4 @@
+from django.http import JsonResponse
 from django.shortcuts import redirect
 
 def login_required(view_func):
@@ -6,3 +7,11 @@ def login_required(view_func):
             return redirect("login")
         return view_func(request, *args, **kwargs)
     return wrapper
+
+def superuser_required(view_func):
+    """Admin panel session (Django auth) of a superuser, else 403"""
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_superuser:
+            return JsonResponse({"error": "Admin access required"}, status=403)
+        return view_func(request, *args, **kwargs)
+    return wrapper
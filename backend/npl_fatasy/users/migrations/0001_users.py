@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id serial PRIMARY KEY,
+                    username varchar(150) NOT NULL UNIQUE,
+                    password varchar(128) NOT NULL
+                );
+            """,
+            reverse_sql="DROP TABLE IF EXISTS users CASCADE;",
+        ),
+    ]
@@ -1,14 +1,25 @@
 from django.shortcuts import render, redirect
-from django.db import connection, IntegrityError
+from django.db import IntegrityError
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.hashers import check_password
 from django.http import JsonResponse
 from django.views.decorators.csrf import ensure_csrf_cookie
 import json
 from django.http import JsonResponse
-from django.db import connection, IntegrityError
+from django.db import IntegrityError
 from django.views.decorators.http import require_POST
 
+from core.db import execute, fetch_one, query, as_tuples
+
+
+CREATE_USER = query("users.create", """
+    INSERT INTO users (username, password) VALUES (%s, %s)
+""")
+
+USER_BY_USERNAME = query("users.by_username", """
+    SELECT user_id, password FROM users WHERE username = %s
+""")
+
 
 @ensure_csrf_cookie
 def csrf(request):
@@ -32,11 +43,7 @@ def register(request):
 
         hashed_password = make_password(password)
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "INSERT INTO users (username, password) VALUES (%s, %s)",
-                [username, hashed_password],
-            )
+        execute(CREATE_USER, [username, hashed_password])
 
         return JsonResponse({"message": "User registered successfully"}, status=201)
 
@@ -54,12 +61,7 @@ def login_view(request):
         username = data.get("username")
         password = data.get("password")
 
-        with connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT user_id, password FROM users WHERE username = %s",
-                [username],
-            )
-            user = cursor.fetchone()
+        user = fetch_one(USER_BY_USERNAME, [username], rows=as_tuples)
 
         if user and check_password(password, user[1]):
             request.session["user_id"] = user[0]
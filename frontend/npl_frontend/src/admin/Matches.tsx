@@ -110,8 +110,18 @@ const handleCalculate = async (id: number) => {
       credentials: "include",
     });
 
+    // Calculation runs as a background job: poll until it finishes
+    let job = await apiFetch(`jobs/${res.job_id}/`);
+    while (job.status === "queued" || job.status === "running") {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      job = await apiFetch(`jobs/${res.job_id}/`);
+    }
+
+    if (job.status !== "done") {
+      throw new Error(job.error || "Calculation job failed");
+    }
 
-    alert(`Results calculated for ${res.teams_processed} teams`);
+    alert(`Results calculated for ${job.progress.teams_processed} teams`);
 
   } catch (err) {
     console.error("Calculation failed:", err);
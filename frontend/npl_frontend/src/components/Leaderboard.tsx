@@ -29,22 +29,41 @@ export default function OverallLeaderboard() {
       .catch(console.error);
   }, []);
 
-  // Fetch leaderboard
+  // Live leaderboard: a snapshot on connect, then deltas pushed by the server
   useEffect(() => {
     setLoading(true);
 
     const url =
       selectedMatch === "all"
-        ? `${API_BASE_URL}/leaderboard/api/overall/`
-        : `${API_BASE_URL}/leaderboard/api/match/${selectedMatch}/`;
+        ? `${API_BASE_URL}/leaderboard/stream/overall/`
+        : `${API_BASE_URL}/leaderboard/stream/match/${selectedMatch}/`;
 
-    fetch(url)
-      .then(res => res.json())
-      .then(data => {
-        setRows(data.leaderboard);
-      })
-      .catch(console.error)
-      .finally(() => setLoading(false));
+    const source = new EventSource(url);
+
+    source.addEventListener("snapshot", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setRows(data.rows);
+      setLoading(false);
+    });
+
+    source.addEventListener("delta", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      const changed = new Map<number, LeaderboardRow>(
+        data.changed.map((row: LeaderboardRow) => [row.user_id, row])
+      );
+      const removed = new Set<number>(data.removed);
+
+      setRows(prev =>
+        [
+          ...prev.filter(row => !removed.has(row.user_id) && !changed.has(row.user_id)),
+          ...changed.values(),
+        ].sort((a, b) => a.rank - b.rank)
+      );
+    });
+
+    source.onerror = () => setLoading(false);
+
+    return () => source.close();
   }, [selectedMatch]);
 
   return (
@@ -6,9 +6,8 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL as string;
 interface MatchdayRow {
   rank: number;
   user_id: number;
-  match_points: number;
-  match_id: number;
-  match_date: string;
+  username: string;
+  total_points: number;
 }
 
 export default function MatchdayLeaderboard() {
@@ -16,15 +15,36 @@ export default function MatchdayLeaderboard() {
   const [rows, setRows] = useState<MatchdayRow[]>([]);
   const [loading, setLoading] = useState(true);
 
+  // Live leaderboard: a snapshot on connect, then deltas pushed by the server
   useEffect(() => {
-    fetch(`${API_BASE_URL}/leaderboard/api/matchday/${matchId}/`)
-      .then(res => {
-        if (!res.ok) throw new Error("Failed to load matchday leaderboard");
-        return res.json();
-      })
-      .then(data => setRows(data))
-      .catch(console.error)
-      .finally(() => setLoading(false));
+    setLoading(true);
+
+    const source = new EventSource(`${API_BASE_URL}/leaderboard/stream/match/${matchId}/`);
+
+    source.addEventListener("snapshot", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      setRows(data.rows);
+      setLoading(false);
+    });
+
+    source.addEventListener("delta", (e) => {
+      const data = JSON.parse((e as MessageEvent).data);
+      const changed = new Map<number, MatchdayRow>(
+        data.changed.map((row: MatchdayRow) => [row.user_id, row])
+      );
+      const removed = new Set<number>(data.removed);
+
+      setRows(prev =>
+        [
+          ...prev.filter(row => !removed.has(row.user_id) && !changed.has(row.user_id)),
+          ...changed.values(),
+        ].sort((a, b) => a.rank - b.rank)
+      );
+    });
+
+    source.onerror = () => setLoading(false);
+
+    return () => source.close();
   }, [matchId]);
 
   if (loading) return <p>Loading matchday leaderboard...</p>;
@@ -77,7 +97,7 @@ export default function MatchdayLeaderboard() {
                       </td>
                       <td className="px-10 py-6 text-right">
                         <div className={`font-black tracking-tight ${isTop3 ? "text-2xl text-brand-blue" : "text-xl text-gray-600"}`}>
-                          {row.match_points}
+                          {row.total_points.toFixed(2)}
                         </div>
                       </td>
                     </tr>